@@ -0,0 +1,488 @@
+from labjack_device import LabJackDevice
+from _ljm_aux import *
+
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import traceback
+from datetime import datetime
+from typing import Iterator
+
+import numpy as np
+
+# Wire format: every message is one frame
+#   prefix  : struct _FRAME_PREFIX = magic (4 bytes), header length (uint32), payload length (uint64), little endian
+#   header  : UTF-8 JSON object with at least {"type": ...}
+#   payload : raw bytes; for "block" frames, the interleaved float64 (little endian) samples of one eStreamRead
+#
+# Client -> server (one request per connection):
+#   {"type": "capture", "stream_in": {<LabJackDevice.stream_in() arguments>}}
+#   {"type": "subscribe"}
+# Server -> client:
+#   {"type": "start", ...stream settings}   (capture: once the stream is configured)
+#   {"type": "block", "shot", "ir", "first_scan", "num_scans", "device_scan_backlog", "ljm_scan_backlog",
+#    "timestamp", "dropped"} + payload
+#       (first_scan counts from scan 0 of the shot including the scans missing at resume gaps, see StreamIn.gaps)
+#   {"type": "end", "skipped_samples", "num_scans", "dropped"}
+#   {"type": "error", "message"}
+_FRAME_MAGIC = b"LJQF"
+_FRAME_PREFIX = struct.Struct("<4sIQ")
+
+
+def _pack_frame(header: dict, payload: bytes = b"") -> bytes:
+    header_bytes = json.dumps(header).encode()
+    return _FRAME_PREFIX.pack(_FRAME_MAGIC, len(header_bytes), len(payload)) + header_bytes + payload
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            raise ConnectionError("Connection closed by peer.")
+        received += n
+    return bytes(buf)
+
+
+def _recv_frame(sock: socket.socket) -> tuple[dict, bytes]:
+    magic, header_len, payload_len = _FRAME_PREFIX.unpack(_recv_exactly(sock, _FRAME_PREFIX.size))
+    if magic != _FRAME_MAGIC:
+        raise ConnectionError(f"Invalid frame magic: {magic!r}")
+    header = json.loads(_recv_exactly(sock, header_len).decode())
+    payload = _recv_exactly(sock, payload_len) if payload_len else b""
+    return header, payload
+
+
+def _stream_in_kwargs(request: dict) -> dict:
+    """Convert JSON `stream_in` arguments of a capture request into LabJackDevice.stream_in() keyword arguments."""
+    kwargs = dict(request)
+    if "trigger_mode" in kwargs:
+        kwargs["trigger_mode"] = LabJackTriggerModeEnum[kwargs["trigger_mode"]]
+    if "trigger_edge" in kwargs:
+        kwargs["trigger_edge"] = LabJackTriggerEdgeEnum[kwargs["trigger_edge"]]
+    return kwargs
+
+
+class _ClientChannel:
+    """
+    Outgoing frame queue of one client, bounded for subscribers.
+    Block frames are dropped (and counted) rather than waited for when a subscriber is too slow, so that a slow client
+    never stalls the acquisition or other clients. Control frames ("start", "end", "error") are never dropped, and
+    neither are the blocks of a capture requester (max_queued_blocks=None): its queue holds one shot at most.
+    """
+
+    def __init__(self, max_queued_blocks: int | None) -> None:
+        self.queue = queue.Queue()
+        self._max_queued_blocks = max_queued_blocks
+        self._queued_blocks = 0
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def put_block(self, frame: bytes) -> None:
+        with self._lock:
+            if self._max_queued_blocks is not None and self._queued_blocks >= self._max_queued_blocks:
+                self.dropped += 1
+                return
+            self._queued_blocks += 1
+        self.queue.put(("block", frame))
+
+    def put_control(self, header: dict) -> None:
+        header = dict(header, dropped=self.dropped)
+        self.queue.put((header["type"], _pack_frame(header)))
+
+    def get(self) -> tuple[str, bytes]:
+        kind, frame = self.queue.get()
+        if kind == "block":
+            with self._lock:
+                self._queued_blocks -= 1
+        return kind, frame
+
+
+class AcquisitionServer:
+    """
+    Long-running acquisition server that owns a LabJack device and serves stream data to local clients,
+    so several scripts can share one device without each paying the connection cost.
+
+    Clients (see `AcquisitionClient`) connect over a Unix domain socket or localhost TCP and either
+    - request a capture with the arguments of `LabJackDevice.stream_in()`; captures are queued and run one at a time
+      on the device, and the blocks of the capture are streamed back to the requester, or
+    - subscribe to the blocks of every capture run by the server.
+    Each block is sent as a binary frame (JSON header + raw float64 samples). Every client has its own queue; blocks
+    for a subscriber that falls behind are dropped and reported in the frame headers (`dropped`), while the requester
+    of a capture gets every block of it.
+
+    Example usage:
+        with LabJackDevice(LabJackDeviceTypeEnum.T7, LabJackConnectionTypeEnum.ETHERNET, '192.168.1.92') as device:
+            server = AcquisitionServer(device, unix_path="/tmp/labjack_quadpd.sock")
+            server.serve_forever()
+    """
+
+    # Read-only properties
+    @property
+    def device(self): return self._device
+    @property
+    def address(self): return self._server.server_address
+
+    def __init__(self,
+                 device: LabJackDevice,
+                 *,
+                 unix_path: str | None = None,
+                 host: str = "127.0.0.1",
+                 port: int = 0,
+                 max_queued_blocks: int = 64,
+            ) -> None:
+        """
+        Parameters:
+            device (LabJackDevice)  : Connected device owned by the server.
+            unix_path (str or None) : Path of the Unix domain socket to listen on. None for TCP.
+            host (str)              : TCP host to listen on. default: "127.0.0.1" (localhost only)
+            port (int)              : TCP port to listen on. 0 for any free port (see `address`).
+            max_queued_blocks (int) : Number of block frames buffered per subscriber before dropping. default: 64
+        """
+        self._device = device
+        self._max_queued_blocks = int(max_queued_blocks)
+
+        self._jobs = queue.Queue()
+        self._subscribers: set[_ClientChannel] = set()
+        self._subscribers_lock = threading.Lock()
+        self._stream_in = None
+        self._stream_in_key = None
+        self._requester = None
+        self._shot = -1
+        self._serving = False
+
+        handler = self._make_handler()
+        if unix_path is not None:
+            if os.path.exists(unix_path):
+                os.unlink(unix_path)
+            self._server = socketserver.ThreadingUnixStreamServer(unix_path, handler)
+        else:
+            self._server = socketserver.ThreadingTCPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._unix_path = unix_path
+
+        self._acquisition_thread = threading.Thread(target=self._acquisition_worker, daemon=True)
+        self._acquisition_thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    # >>>>> client handling >>>>>
+
+    def _make_handler(self):
+        server = self
+
+        class _Handler(socketserver.BaseRequestHandler):
+            def handle(self) -> None:
+                server._handle_client(self.request)
+
+        return _Handler
+
+    def _handle_client(self, sock: socket.socket) -> None:
+        try:
+            request, _ = _recv_frame(sock)
+        except (ConnectionError, ValueError, struct.error):
+            return
+        request_type = request.get("type")
+        # the blocks of a capture are never dropped for its requester
+        channel = _ClientChannel(None if request_type == "capture" else self._max_queued_blocks)
+
+        if request_type == "capture":
+            self._jobs.put((request.get("stream_in", {}), channel))
+            self._send_until(sock, channel, ("end", "error"))
+        elif request_type == "subscribe":
+            with self._subscribers_lock:
+                self._subscribers.add(channel)
+            try:
+                self._send_until(sock, channel, ())
+            finally:
+                with self._subscribers_lock:
+                    self._subscribers.discard(channel)
+        else:
+            try:
+                sock.sendall(_pack_frame({"type": "error", "message": f"Unknown request type: {request_type}"}))
+            except OSError:
+                pass
+
+    def _send_until(self, sock: socket.socket, channel: _ClientChannel, last_kinds: tuple[str, ...]) -> None:
+        """Send queued frames to the client until a frame of `last_kinds` is sent or the client goes away."""
+        while True:
+            kind, frame = channel.get()
+            if kind == "close":
+                return
+            try:
+                sock.sendall(frame)
+            except OSError:
+                return
+            if kind in last_kinds:
+                return
+
+    # <<<<< client handling <<<<<
+
+    # >>>>> acquisition >>>>>
+
+    def _acquisition_worker(self) -> None:
+        """Run queued captures one at a time; the only thread that touches the device."""
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            request, channel = job
+            try:
+                self._capture(request, channel)
+            except Exception as ex:
+                traceback.print_exc()
+                channel.put_control({"type": "error", "message": f"{type(ex).__name__}: {ex}"})
+
+    def _capture(self, request: dict, channel: _ClientChannel) -> None:
+        # reuse the StreamIn object (i.e., skip configuration) while the requested settings are unchanged
+        key = json.dumps(request, sort_keys=True)
+        if key != self._stream_in_key:
+            self._stream_in = None
+            stream_in = self._device.stream_in(**_stream_in_kwargs(request))
+            stream_in.add_block_handler(self._on_block)
+            self._stream_in, self._stream_in_key = stream_in, key
+        stream_in = self._stream_in
+
+        self._requester = channel
+        channel.put_control({
+            "type": "start",
+            "scan_channels": list(stream_in.scan_channels),
+            "scan_rate_Hz": stream_in.scan_rate_Hz,
+            "duration_s": stream_in.duration_s,
+            "num_scans": stream_in.num_scans,
+        })
+        try:
+            stream_in._stream_in()
+        finally:
+            self._requester = None
+        channel.put_control({
+            "type": "end",
+            "skipped_samples": int(stream_in.skipped_samples),
+            "num_scans": int(stream_in._scans),
+        })
+
+    def _on_block(self, stream_in, ir: int, a_data: np.ndarray,
+                  device_scan_backlog: int, ljm_scan_backlog: int, timestamp_read_return: datetime) -> None:
+        """StreamIn block handler: serialize the block once and fan it out to the requester and subscribers."""
+        if ir == 0:
+            self._shot += 1
+        num_channels = len(stream_in.scan_channels)
+        # scans missing at the resume gaps up to this block (the read loop may already have appended later ones)
+        missing_scans = sum(missing for first_scan, missing in stream_in._gaps if first_scan <= stream_in._scans)
+        header = {
+            "type": "block",
+            "shot": self._shot,
+            "ir": ir,
+            "scan_channels": list(stream_in.scan_channels),
+            "scan_rate_Hz": stream_in.scan_rate_Hz,
+            "first_scan": int(stream_in._scans + missing_scans),
+            "num_scans": len(a_data)//num_channels,
+            "device_scan_backlog": int(device_scan_backlog),
+            "ljm_scan_backlog": int(ljm_scan_backlog),
+            "timestamp": timestamp_read_return.timestamp(),
+        }
+        payload = np.ascontiguousarray(a_data, dtype="<f8").tobytes()
+        with self._subscribers_lock:
+            channels = list(self._subscribers)
+        requester = self._requester
+        if requester is not None:
+            channels.append(requester)
+        for channel in channels:
+            channel.put_block(_pack_frame(dict(header, dropped=channel.dropped), payload))
+
+    # <<<<< acquisition <<<<<
+
+    def serve_forever(self) -> None:
+        print(f">>> Acquisition server listening on {self.address}", flush=True)
+        self._serving = True
+        try:
+            self._server.serve_forever()
+        finally:
+            self._serving = False
+
+    def close(self) -> None:
+        """Stop serving. The device is not disconnected."""
+        if self._serving:
+            self._server.shutdown()
+        self._server.server_close()
+        self._jobs.put(None)
+        with self._subscribers_lock:
+            for channel in self._subscribers:
+                channel.queue.put(("close", b""))
+        if self._unix_path is not None and os.path.exists(self._unix_path):
+            os.unlink(self._unix_path)
+
+
+class RemoteStreamIn:
+    """
+    Result of `AcquisitionClient.stream_in()`, with the read-only properties of `StreamIn` that describe the result.
+    """
+
+    # Read-only properties
+    @property
+    def scan_channels(self): return self._scan_channels
+    @property
+    def scan_rate_Hz(self): return self._scan_rate
+    @property
+    def duration_s(self): return self._duration
+    @property
+    def num_scans(self): return self._num_scans
+    @property
+    def records(self): return self._records
+    @property
+    def skipped_samples(self): return self._skipped_samples
+    @property
+    def dropped_blocks(self): return self._dropped
+
+    def __init__(self, start: dict, blocks: list[tuple[dict, bytes]], end: dict) -> None:
+        self._scan_channels = start["scan_channels"]
+        self._scan_rate = start["scan_rate_Hz"]
+        self._duration = start["duration_s"]
+        self._num_scans = end["num_scans"]
+        self._skipped_samples = end["skipped_samples"]
+        self._dropped = end["dropped"]
+        num_channels = len(self._scan_channels)
+        a_data = np.frombuffer(b"".join(payload for _, payload in blocks), dtype="<f8")
+        buffer = a_data[:len(a_data)//num_channels*num_channels].reshape(-1, num_channels)
+        # scan index of each row from the block headers, so the time skips the scans missing at resume gaps
+        # (same 't' as StreamIn.records)
+        scans = np.concatenate([header["first_scan"] + np.arange(header["num_scans"]) for header, _ in blocks]
+                               ) if blocks else np.empty(0, dtype=np.int64)
+        self._records = {}
+        for inx, channel in enumerate(self._scan_channels):
+            self._records[channel] = {'V': buffer[:, inx].copy(), 't': (scans*num_channels + inx)/self._scan_rate}
+
+
+class AcquisitionClient:
+    """
+    Client of an `AcquisitionServer`.
+
+    Example usage:
+        client = AcquisitionClient(unix_path="/tmp/labjack_quadpd.sock")
+        data = client.stream_in(["AIN1", "AIN3"], duration_s=.5, sampling_rate_Hz=100e3, do_trigger=True)
+        data.records["AIN1"]["V"]
+
+        for header, block in client.subscribe():  # blocks of every capture run on the server
+            ...
+    """
+
+    def __init__(self, *, unix_path: str | None = None, host: str = "127.0.0.1", port: int | None = None,
+                 timeout_s: float | None = None) -> None:
+        """
+        Parameters:
+            unix_path (str or None)     : Path of the server's Unix domain socket. None for TCP.
+            host (str), port (int)      : TCP address of the server.
+            timeout_s (float or None)   : Socket timeout. None for blocking sockets.
+        """
+        if unix_path is None and port is None:
+            raise ValueError("Either unix_path or port should be given.")
+        self._unix_path = unix_path
+        self._address = (host, port)
+        self._timeout = timeout_s
+
+    def _open(self, request: dict) -> socket.socket:
+        if self._unix_path is not None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self._timeout)
+            sock.connect(self._unix_path)
+        else:
+            sock = socket.create_connection(self._address, timeout=self._timeout)
+        sock.sendall(_pack_frame(request))
+        return sock
+
+    def stream_in(
+            self,
+            scan_channels: list[str] = ["AIN0", "AIN1", "AIN2"],
+            duration_s: int = 1,
+            *,
+            sampling_rate_Hz: float = 100e3,
+            scans_per_read: int | None = None,
+            do_trigger: bool = False,
+            trigger_channel: str = "DIO0",
+            trigger_mode: LabJackTriggerModeEnum = LabJackTriggerModeEnum.ConditionalReset,
+            trigger_edge: LabJackTriggerEdgeEnum = LabJackTriggerEdgeEnum.Rising,
+        ) -> RemoteStreamIn:
+        """
+        Request a capture from the server and wait for its result. Arguments are the ones of `LabJackDevice.stream_in()`.
+
+        Returns:
+            RemoteStreamIn object
+        """
+        request = {
+            "type": "capture",
+            "stream_in": {
+                "scan_channels": list(scan_channels),
+                "duration_s": duration_s,
+                "sampling_rate_Hz": sampling_rate_Hz,
+                "scans_per_read": scans_per_read,
+                "do_trigger": do_trigger,
+                "trigger_channel": trigger_channel,
+                "trigger_mode": trigger_mode.name,
+                "trigger_edge": trigger_edge.name,
+            },
+        }
+        sock = self._open(request)
+        with sock:
+            start = None
+            blocks = []
+            while True:
+                header, payload = _recv_frame(sock)
+                if header["type"] == "start":
+                    start = header
+                elif header["type"] == "block":
+                    blocks.append((header, payload))
+                elif header["type"] == "end":
+                    return RemoteStreamIn(start, blocks, header)
+                elif header["type"] == "error":
+                    raise LabJackStreamReadError(f"Acquisition server error: {header['message']}")
+
+    def subscribe(self) -> Iterator[tuple[dict, np.ndarray]]:
+        """
+        Yield (header, block) of every block streamed by the server, where `block` is a (scans x channels) array.
+        Returns when the server closes the connection.
+        """
+        sock = self._open({"type": "subscribe"})
+        with sock:
+            while True:
+                try:
+                    header, payload = _recv_frame(sock)
+                except ConnectionError:
+                    return
+                if header["type"] == "error":
+                    raise LabJackStreamReadError(f"Acquisition server error: {header['message']}")
+                if header["type"] != "block":
+                    continue
+                block = np.frombuffer(payload, dtype="<f8").reshape(-1, len(header["scan_channels"]))
+                yield header, block
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="LabJack acquisition server")
+    parser.add_argument("device_identifier", help="IP address or serial number of the device")
+    parser.add_argument("--device-type", default="T7", choices=[e.name for e in LabJackDeviceTypeEnum])
+    parser.add_argument("--connection-type", default="ETHERNET", choices=[e.name for e in LabJackConnectionTypeEnum])
+    parser.add_argument("--unix", dest="unix_path", default=None, help="Unix domain socket path")
+    parser.add_argument("--port", type=int, default=5557, help="localhost TCP port (if --unix is not given)")
+    args = parser.parse_args()
+
+    with LabJackDevice(
+        device_type=LabJackDeviceTypeEnum[args.device_type],
+        connection_type=LabJackConnectionTypeEnum[args.connection_type],
+        device_identifier=args.device_identifier,
+    ) as lj_device:
+        with AcquisitionServer(lj_device, unix_path=args.unix_path, port=args.port) as server:
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
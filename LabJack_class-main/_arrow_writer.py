@@ -0,0 +1,255 @@
+import os
+import time
+from typing import Callable, Iterator, TYPE_CHECKING
+
+import numpy as np
+if TYPE_CHECKING:
+    import pyarrow as pa
+    from _stream_in import StreamIn
+
+
+def shot_summary_rows(stream_in: 'StreamIn') -> list[dict]:
+    """
+    Long-form summary of the last shot of `stream_in`: one row per channel.
+    Default reduction of `ShotResultWriter.write_shot()`.
+    """
+    clock = stream_in.clock
+    rows = []
+    for channel, record in stream_in.records.items():
+        rows.append({
+            'start_time_s': clock['start_time_s'] if clock is not None else np.nan,
+            'channel': channel,
+            'mean_V': float(np.nanmean(record['V'])),
+            'std_V': float(np.nanstd(record['V'])),
+            'num_scans': len(record['V']),
+            'skipped_samples': int(np.count_nonzero(np.isnan(record['V']))),
+        })
+    return rows
+
+
+class ShotResultWriter:
+    """
+    Append-only writer of per-shot results to an Arrow IPC stream (.arrows) or a Parquet file (.parquet), with
+    bounded memory: rows are buffered by column and written as one record batch (Parquet: one row group) every
+    `flush_rows` rows or `flush_interval_s` seconds, whichever comes first.
+
+    Readers:
+        - Arrow IPC stream: can be memory-mapped while it is being written; each flush appends complete record
+          batches. See `read_batches()`.
+        - Parquet: the footer is written on close(), so the file is readable only after that.
+
+    e.g.,
+        with ShotResultWriter("results.arrows") as writer:
+            writer.attach(stream_in)  # one summary row per channel and shot (see shot_summary_rows)
+            for _ in range(num_shots):
+                stream_in._stream_in()
+
+    The schema is given, or inferred from the first flushed batch; later rows must have the same columns.
+    """
+
+    # Read-only properties
+    @property
+    def path(self): return self._path
+    @property
+    def num_rows_written(self): return self._num_rows_written
+    @property
+    def num_rows_buffered(self): return self._num_rows_buffered
+
+    def __init__(self,
+                 path: str,
+                 schema: 'pa.Schema | None' = None,
+                 *,
+                 file_format: str | None = None,
+                 flush_rows: int = 10_000,
+                 flush_interval_s: float = 10.0,
+                 overwrite: bool = False,
+            ) -> None:
+        """
+        Parameters:
+            path (str)                  : Output file.
+            schema (pyarrow.Schema)     : Schema of the rows. None to infer it from the first batch.
+            file_format (str)           : "arrow" or "parquet". None to pick from the extension of `path`
+                                        (.parquet or .pq for Parquet, Arrow IPC stream otherwise).
+            flush_rows (int)            : Rows buffered before a batch is written. default: 10000
+            flush_interval_s (float)    : Seconds after which buffered rows are written (checked on each write).
+                                        default: 10
+            overwrite (bool)            : Whether to replace an existing file. default: False
+        """
+        import pyarrow  # fail early if the optional dependency is missing
+        if file_format is None:
+            file_format = "parquet" if path.lower().endswith((".parquet", ".pq")) else "arrow"
+        if file_format not in ("arrow", "parquet"):
+            raise ValueError(f"Unknown file format: {file_format}")
+        if os.path.exists(path) and not overwrite:
+            raise FileExistsError(f"{path} exists; pass overwrite=True to replace it.")
+        if flush_rows < 1:
+            raise ValueError("flush_rows should be 1 or bigger.")
+        self._path = path
+        self._format = file_format
+        self._schema = schema
+        self._flush_rows = int(flush_rows)
+        self._flush_interval = float(flush_interval_s)
+        self._columns = None  # column name -> list of buffered values
+        self._num_rows_buffered = 0
+        self._num_rows_written = 0
+        self._last_flush = time.monotonic()
+        self._sink = None
+        self._writer = None
+        self._num_shots = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        # a finalizer must not raise: __init__ may have failed, or pyarrow may be torn down at interpreter exit
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    # >>>>> writing >>>>>
+
+    def write(self, row: dict) -> None:
+        """Buffer one row (column name -> value); flush if `flush_rows` or `flush_interval_s` is reached."""
+        if self._columns is None:
+            self._columns = {name: [] for name in (self._schema.names if self._schema is not None else row)}
+        if row.keys() != self._columns.keys():
+            raise ValueError(f"Row columns {list(row)} differ from the writer columns {list(self._columns)}.")
+        for name, value in row.items():
+            self._columns[name].append(value)
+        self._num_rows_buffered += 1
+        if (self._num_rows_buffered >= self._flush_rows
+                or time.monotonic() - self._last_flush >= self._flush_interval):
+            self.flush()
+
+    def write_rows(self, rows: list[dict]) -> None:
+        for row in rows:
+            self.write(row)
+
+    def write_shot(self, stream_in: 'StreamIn', reduce: Callable[['StreamIn'], dict | list[dict]] | None = None) -> None:
+        """
+        Write the reduction of the last shot of `stream_in`.
+
+        Args:
+            reduce (callable)   : reduce(stream_in) returning a row or a list of rows. Each row gets a 'shot' column
+                                (count of shots written by this writer) first. default: shot_summary_rows
+        """
+        rows = (reduce or shot_summary_rows)(stream_in)
+        if isinstance(rows, dict):
+            rows = [rows]
+        for row in rows:
+            self.write({'shot': self._num_shots, **row})
+        self._num_shots += 1
+
+    def write_records(self, stream_in: 'StreamIn') -> None:
+        """
+        Write all samples of the last shot of `stream_in` in long form (shot, channel, t, V) as one batch, bypassing
+        the row buffer. 't' is seconds from scan 0 of the shot (see `StreamIn.to_dataframe()`).
+        Do not mix with write()/write_shot() in one writer (the columns differ).
+        """
+        import pyarrow as pa
+        if self._num_rows_buffered:
+            raise ValueError("write_records() cannot follow buffered rows of another schema.")
+        data = stream_in.to_numpy()
+        num_scans, num_channels = data.shape
+        channels = pa.DictionaryArray.from_arrays(
+            pa.array(np.repeat(np.arange(num_channels, dtype=np.int32), num_scans)),
+            pa.array(list(stream_in.scan_channels)),
+        )
+        batch = pa.RecordBatch.from_arrays([
+            pa.array(np.full(num_scans*num_channels, self._num_shots, dtype=np.int64)),
+            channels,
+            pa.array(np.tile(stream_in.scan_indices()/stream_in.scan_rate_Hz, num_channels)),
+            pa.array(data.T.ravel()),  # channel-major: the one copy of the long form
+        ], names=['shot', 'channel', 't', 'V'])
+        self._write_batch(batch)
+        self._num_shots += 1
+
+    def attach(self,
+               stream_in: 'StreamIn',
+               reduce: Callable[['StreamIn'], dict | list[dict]] | None = None,
+               *,
+               records: bool = False,
+            ) -> None:
+        """
+        Write every completed shot of `stream_in`: its reduction (see write_shot), or all samples if `records`.
+        """
+        if records:
+            stream_in.add_shot_handler(self.write_records)
+        else:
+            stream_in.add_shot_handler(lambda stream_in: self.write_shot(stream_in, reduce))
+
+    def flush(self) -> None:
+        """Write the buffered rows as one record batch (Parquet: one row group)."""
+        self._last_flush = time.monotonic()
+        if not self._num_rows_buffered:
+            return
+        import pyarrow as pa
+        if self._schema is not None:
+            batch = pa.RecordBatch.from_pydict(self._columns, schema=self._schema)
+        else:
+            batch = pa.RecordBatch.from_pydict(self._columns)
+        self._columns = {name: [] for name in self._columns}
+        self._num_rows_buffered = 0
+        self._write_batch(batch)
+
+    def _write_batch(self, batch: 'pa.RecordBatch') -> None:
+        if self._writer is None:
+            self._open(batch.schema)
+        elif self._schema is not None and batch.schema != self._schema:
+            batch = batch.cast(self._schema)
+        if self._format == "parquet":
+            import pyarrow as pa
+            self._writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            self._writer.write_batch(batch)
+            self._sink.flush()  # make the whole batch visible to readers
+        self._num_rows_written += batch.num_rows
+        self._last_flush = time.monotonic()
+
+    def _open(self, schema: 'pa.Schema') -> None:
+        import pyarrow as pa
+        if self._schema is None:
+            self._schema = schema
+        if self._format == "parquet":
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(self._path, self._schema)
+            return
+        self._sink = pa.OSFile(self._path, "wb")
+        self._writer = pa.ipc.new_stream(self._sink, self._schema)
+
+    # <<<<< writing <<<<<
+
+    def close(self) -> None:
+        if getattr(self, "_writer", None) is None and not getattr(self, "_num_rows_buffered", 0):
+            return
+        try:
+            self.flush()
+        finally:
+            # close the file even if the last batch fails (e.g., rows that do not fit the schema)
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            if self._sink is not None:
+                self._sink.close()
+                self._sink = None
+
+
+def read_batches(path: str) -> Iterator['pa.RecordBatch']:
+    """
+    Memory-map an Arrow IPC stream written by ShotResultWriter and yield its complete record batches, also while it
+    is being written (a batch still being appended at the end is not yielded).
+    """
+    import pyarrow as pa
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_stream(source)
+        while True:
+            try:
+                yield reader.read_next_batch()
+            except StopIteration:
+                return
+            except (pa.ArrowInvalid, OSError):
+                return  # partial batch at the end of a file being written
@@ -0,0 +1,94 @@
+import numpy as np
+
+
+class ScansPerReadAutotuner:
+    """
+    Pick the `scans_per_read` of a StreamIn from the scan backlogs returned by eStreamRead
+    (https://support.labjack.com/docs/estreamread-ljm-user-s-guide).
+
+    LJM fixes `scans_per_read` at eStreamStart, so the block size is tuned between shots:
+    - The backlog (device + LJM scans waiting after each read) growing within a shot or exceeding
+      `backlog_bound_reads` blocks means the reads do not keep up: the block size is doubled
+      (fewer reads, i.e., less per-read overhead).
+    - A backlog staying below a quarter of a block means there is headroom: the block size is reduced by 25 %
+      toward `min_read_period_s` for lower latency.
+    The block size is kept between `min_read_period_s` and `max_read_period_s` worth of scans
+    (and at most the scans of a shot).
+
+    Intended to be created by StreamIn with `scans_per_read="auto"`; see `StreamIn.autotuner`.
+    """
+
+    # Read-only properties
+    @property
+    def scans_per_read(self): return self._scans_per_read
+    @property
+    def min_scans_per_read(self): return self._min
+    @property
+    def max_scans_per_read(self): return self._max
+    @property
+    def history(self): return list(self._history)
+
+    def __init__(self,
+                 scan_rate_Hz: float,
+                 num_scans: int,
+                 *,
+                 min_read_period_s: float = 0.02,
+                 max_read_period_s: float = 1.0,
+                 backlog_bound_reads: float = 2.0,
+            ) -> None:
+        """
+        Parameters:
+            scan_rate_Hz (float)        : Scan rate per channel.
+            num_scans (int)             : Number of scans per shot.
+            min_read_period_s (float)   : Smallest block, in seconds of scans (the starting point). default: 0.02
+            max_read_period_s (float)   : Largest block, in seconds of scans. default: 1.0
+            backlog_bound_reads (float) : Backlog (in blocks) above which the block size is increased. default: 2.0
+        """
+        if not 0 < min_read_period_s <= max_read_period_s:
+            raise ValueError("Read periods should satisfy 0 < min_read_period_s <= max_read_period_s.")
+        self._max = max(1, min(int(num_scans), int(scan_rate_Hz*max_read_period_s)))
+        self._min = max(1, min(self._max, int(scan_rate_Hz*min_read_period_s)))
+        self._scan_rate = float(scan_rate_Hz)
+        self._backlog_bound_reads = float(backlog_bound_reads)
+        self._scans_per_read = self._min
+        self._backlogs = []
+        self._history = []  # (scans_per_read used, peak backlog, backlog slope per read, new scans_per_read, reason)
+
+    def start_shot(self) -> None:
+        self._backlogs = []
+
+    def observe(self, device_scan_backlog: int, ljm_scan_backlog: int) -> None:
+        """Record the backlogs returned by one eStreamRead. Called from the read loop: keep it cheap."""
+        self._backlogs.append(device_scan_backlog + ljm_scan_backlog)
+
+    def end_shot(self) -> int:
+        """
+        Decide the block size for the next shot from the backlogs of this shot, and log the decision.
+
+        Returns:
+            int: scans_per_read for the next shot
+        """
+        spr = self._scans_per_read
+        if len(self._backlogs) == 0:
+            return spr
+
+        backlogs = np.asarray(self._backlogs, dtype=float)
+        peak = float(backlogs.max())
+        slope = float(np.polyfit(np.arange(len(backlogs)), backlogs, 1)[0]) if len(backlogs) >= 3 else 0.0
+
+        if peak > self._backlog_bound_reads*spr or slope > 0.05*spr:
+            new_spr = min(self._max, 2*spr)
+            reason = "backlog growing or above bound: larger reads"
+        elif len(backlogs) >= 2 and peak < 0.25*spr:
+            new_spr = max(self._min, int(0.75*spr))
+            reason = "backlog low: smaller reads for lower latency"
+        else:
+            new_spr = spr
+            reason = "backlog bounded: keep"
+
+        self._history.append((spr, peak, slope, new_spr, reason))
+        if new_spr != spr:
+            print(f"\tscans_per_read autotune: {spr} -> {new_spr} ({reason}; "
+                  f"peak backlog = {peak:.0f} scans, slope = {slope:.1f} scans/read)", flush=True)
+        self._scans_per_read = new_spr
+        return new_spr
@@ -0,0 +1,212 @@
+import ast
+
+import numpy as np
+
+
+_BINARY_UFUNCS = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide}
+
+
+class DerivedChannels:
+    """
+    Declarative channels computed from the streamed channels, e.g., the position and sum signals of a quadrant
+    photodiode:
+        DerivedChannels(
+            {'SUM': 'A + B + C + D', 'X': '(A + D - B - C)/SUM', 'Y': '(A + B - C - D)/SUM'},
+            aliases={'A': 'AIN0', 'B': 'AIN1', 'C': 'AIN2', 'D': 'AIN3'},
+            masks={'X': ('SUM', 0.05), 'Y': ('SUM', 0.05)},
+        )
+    Expressions use +, -, *, /, parentheses, numbers, streamed channel names (or their aliases) and the derived
+    channels defined before them. Each definition is compiled once (see `compile()`) into in-place numpy ufunc calls
+    writing straight into the output, with one scratch buffer for nested right operands and masks.
+
+    Use with `StreamIn.add_derived_channels()`, which evaluates them on each eStreamRead block and adds them to
+    `records` alongside the streamed channels.
+    """
+
+    # Read-only properties
+    @property
+    def names(self): return list(self._definitions)
+    @property
+    def definitions(self): return dict(self._definitions)
+
+    def __init__(self,
+                 definitions: dict[str, str],
+                 *,
+                 aliases: dict[str, str] | None = None,
+                 masks: dict[str, tuple[str, float]] | None = None,
+            ) -> None:
+        """
+        Parameters:
+            definitions (dict)  : Derived channel name -> expression, evaluated in order.
+            aliases (dict)      : Name used in expressions -> streamed channel name (e.g., 'A' -> 'AIN0').
+            masks (dict)        : Derived channel name -> (channel, threshold): samples where |channel| < threshold
+                                are set to NaN (e.g., normalized position where the SUM signal is too low), before
+                                the channels defined after it are evaluated. The channel is a streamed channel (or
+                                alias), the masked channel or a derived channel defined before it.
+        """
+        self._definitions = dict(definitions)
+        self._aliases = dict(aliases or {})
+        self._masks = dict(masks or {})
+        self._trees = {}
+        for name, expression in self._definitions.items():
+            if not name.isidentifier():
+                raise ValueError(f"Derived channel name should be an identifier: {name}")
+            try:
+                self._trees[name] = ast.parse(expression, mode='eval').body
+            except SyntaxError as ex:
+                raise ValueError(f"Invalid expression of {name}: {expression}") from ex
+        for name in self._masks:
+            if name not in self._definitions:
+                raise ValueError(f"Mask of an undefined derived channel: {name}")
+
+    def compile(self, scan_channels: list[str]) -> '_DerivedChannelsPlan':
+        """Evaluation plan for blocks whose columns are `scan_channels`."""
+        return _DerivedChannelsPlan(self, list(scan_channels))
+
+
+class _DerivedChannelsPlan:
+    """
+    DerivedChannels compiled for a scan list: a flat list of ufunc instructions
+        (ufunc, operand, operand or None, destination)
+    whose operands are ('raw', column), ('out', row), ('scratch', level) or ('const', value), and of mask
+    instructions (None, operand, threshold, destination) right after the instructions of their channel, so that the
+    channels defined after a masked one see its NaN.
+    """
+
+    @property
+    def names(self): return list(self._names)
+
+    def __init__(self, derived: DerivedChannels, scan_channels: list[str]) -> None:
+        self._names = derived.names
+        self._scan_channels = scan_channels
+        for name in self._names:
+            if name in scan_channels:
+                raise ValueError(f"Derived channel {name} has the name of a streamed channel.")
+        self._aliases = derived._aliases
+        self._rows = {}
+        self._instructions = []
+        self._num_levels = 0
+        for row, name in enumerate(self._names):
+            self._emit(derived._trees[name], ('out', row), 0, name)
+            self._rows[name] = row
+            if name in derived._masks:
+                ref, threshold = derived._masks[name]
+                self._instructions.append((None, self._operand(ast.Name(id=ref), name), float(threshold),
+                                           ('out', row)))
+                self._num_levels = max(self._num_levels, 1)
+
+    # >>>>> compilation >>>>>
+
+    def _operand(self, node: ast.AST, name: str) -> tuple[str, object] | None:
+        """Operand of a leaf node, or None for an operation."""
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return ('const', float(node.value))
+        if isinstance(node, ast.Name):
+            if node.id in self._rows:
+                return ('out', self._rows[node.id])
+            channel = self._aliases.get(node.id, node.id)
+            if channel in self._scan_channels:
+                return ('raw', self._scan_channels.index(channel))
+            raise ValueError(f"Unknown channel {node.id} in the expression of {name} "
+                             "(streamed channels, aliases or derived channels defined before it).")
+        if isinstance(node, (ast.BinOp, ast.UnaryOp)):
+            return None
+        raise ValueError(f"Unsupported expression in {name}: {ast.unparse(node)}")
+
+    def _emit(self, node: ast.AST, dst: tuple[str, int], level: int, name: str) -> None:
+        """Append the instructions writing `node` to `dst`, using scratch levels from `level` on."""
+        leaf = self._operand(node, name)
+        if leaf is not None:
+            self._instructions.append((np.positive, leaf, None, dst))  # copy
+            return
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.USub):
+                self._emit(node.operand, dst, level, name)
+                self._instructions.append((np.negative, dst, None, dst))
+            elif isinstance(node.op, ast.UAdd):
+                self._emit(node.operand, dst, level, name)
+            else:
+                raise ValueError(f"Unsupported operator in {name}: {ast.unparse(node)}")
+            return
+        ufunc = _BINARY_UFUNCS.get(type(node.op))
+        if ufunc is None:
+            raise ValueError(f"Unsupported operator in {name}: {ast.unparse(node)}")
+        left = self._operand(node.left, name)
+        right = self._operand(node.right, name)
+        if left is not None and right is not None:
+            self._instructions.append((ufunc, left, right, dst))
+        elif left is not None:
+            # dst = left op (right evaluated into dst)
+            self._emit(node.right, dst, level, name)
+            self._instructions.append((ufunc, left, dst, dst))
+        elif right is not None:
+            self._emit(node.left, dst, level, name)
+            self._instructions.append((ufunc, dst, right, dst))
+        else:
+            self._emit(node.left, dst, level, name)
+            scratch = ('scratch', level)
+            self._num_levels = max(self._num_levels, level + 1)
+            self._emit(node.right, scratch, level + 1, name)
+            self._instructions.append((ufunc, dst, scratch, dst))
+
+    # <<<<< compilation <<<<<
+
+    def evaluate(self, block: 'np.ndarray', out: 'np.ndarray', scratch: 'np.ndarray | None' = None) -> 'np.ndarray':
+        """
+        Evaluate the derived channels of a block.
+
+        Args:
+            block   : (scans x streamed channels) samples.
+            out     : (derived channels x scans) output, e.g., a slice of a preallocated shot buffer.
+            scratch : (levels x scans) scratch buffer reused across blocks (see `scratch_shape`). None to allocate.
+
+        Returns:
+            scratch buffer (pass it to the next call)
+        """
+        num_scans = block.shape[0]
+        if scratch is None or scratch.shape[1] < num_scans:
+            scratch = np.empty(self.scratch_shape(num_scans))
+        spaces = {'raw': block.T, 'out': out, 'scratch': scratch[:, :num_scans]}
+
+        def resolve(operand):
+            kind, value = operand
+            return value if kind == 'const' else spaces[kind][value]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for ufunc, a, b, dst in self._instructions:
+                if ufunc is None:
+                    # mask: the scratch levels are free between channels
+                    work = scratch[0, :num_scans]
+                    np.abs(resolve(a), out=work)
+                    np.copyto(resolve(dst), np.nan, where=work < b)
+                elif b is None:
+                    ufunc(resolve(a), out=resolve(dst))
+                else:
+                    ufunc(resolve(a), resolve(b), out=resolve(dst))
+        return scratch
+
+    def scratch_shape(self, num_scans: int) -> tuple[int, int]:
+        return (self._num_levels, num_scans)
+
+
+def quad_photodiode_channels(
+        a: str,
+        b: str,
+        c: str,
+        d: str,
+        *,
+        min_sum_V: float = 0.0,
+    ) -> DerivedChannels:
+    """
+    SUM, X and Y of a quadrant photodiode from its four quadrant channels
+        B | A
+        --+--     X = (A + D - B - C)/SUM,  Y = (A + B - C - D)/SUM
+        C | D
+    with X and Y set to NaN where |SUM| < min_sum_V.
+    """
+    masks = {'X': ('SUM', min_sum_V), 'Y': ('SUM', min_sum_V)} if min_sum_V > 0 else None
+    return DerivedChannels(
+        {'SUM': 'A + B + C + D', 'X': '(A + D - B - C)/SUM', 'Y': '(A + B - C - D)/SUM'},
+        aliases={'A': a, 'B': b, 'C': c, 'D': d},
+        masks=masks,
+    )
@@ -0,0 +1,224 @@
+from labjack_device import LabJackDevice
+from _ljm_aux import *
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeoutError
+
+
+# default location of the discovery cache
+DEFAULT_DISCOVERY_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "labjack_quadpd", "devices.json")
+
+
+def _enum_name(enum_class, value: int) -> str | int:
+    """Name of the enum member with `value`, or `value` itself if the enum does not have it (e.g., LJM_ctTCP)."""
+    try:
+        return enum_class(value).name
+    except ValueError:
+        return value
+
+
+def _read_cache(cache_path: str) -> dict:
+    try:
+        with open(cache_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache(cache_path: str, cache: dict) -> None:
+    # write to a temporary file and rename so that concurrent scripts never read a partial cache
+    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=1)
+    os.replace(tmp_path, cache_path)
+
+
+def discover_devices(
+        device_type: LabJackDeviceTypeEnum | None = None,
+        connection_type: LabJackConnectionTypeEnum | None = None,
+        *,
+        cache_path: str | None = DEFAULT_DISCOVERY_CACHE_PATH,
+        ttl_s: float = 300.0,
+        refresh: bool = False,
+    ) -> list[dict]:
+    """
+    List the LabJack devices reachable from this computer, using a disk cache to skip the (slow) scan.
+
+    Args:
+        device_type         : Device type to look for. None for any.
+        connection_type     : Connection type to look for. None for any.
+        cache_path (str)    : Path of the JSON cache file. None to disable caching.
+                            default: ~/.cache/labjack_quadpd/devices.json
+        ttl_s (float)       : Age in seconds after which cached results are scanned again. default: 300
+        refresh (bool)      : Whether to scan even if the cache is fresh. default: False
+
+    Returns:
+        list of dict (one per device found):
+            'device_type' (str or int)      : name of LabJackDeviceTypeEnum member (e.g., 'T7')
+            'connection_type' (str or int)  : name of LabJackConnectionTypeEnum member (e.g., 'ETHERNET')
+            'serial_number' (int)
+            'IP_address' (str or None)      : for TCP-based connections only
+
+    ljm methods used:
+    - https://support.labjack.com/docs/listalls-ljm-user-s-guide
+    """
+    device_type_name = "ANY" if device_type is None else device_type.name
+    connection_type_name = "ANY" if connection_type is None else connection_type.name
+    key = f"{device_type_name}/{connection_type_name}"
+
+    cache = _read_cache(cache_path) if cache_path is not None else {}
+    entry = cache.get(key)
+    if entry is not None and not refresh and time.time() - entry["time"] < ttl_s:
+        return entry["devices"]
+
+    print(f">>> Scanning for LabJack devices ({key})... ", end="", flush=True)
+    start = time.perf_counter()
+    try:
+        num_found, device_types, connection_types, serial_numbers, ip_addresses = \
+            ljm.listAllS(device_type_name, connection_type_name)
+    except ljm.LJMError as ljmex:
+        raise LabJackConnectionError("LabJack library-level error") from ljmex
+    except Exception as ex:
+        raise LabJackConnectionError("Non LabJack library-level error") from ex
+    td_exe = time.perf_counter() - start
+
+    devices = []
+    for i in range(num_found):
+        devices.append({
+            'device_type': _enum_name(LabJackDeviceTypeEnum, device_types[i]),
+            'connection_type': _enum_name(LabJackConnectionTypeEnum, connection_types[i]),
+            'serial_number': serial_numbers[i],
+            'IP_address': ljm.numberToIP(ip_addresses[i]) if ip_addresses[i] else None,
+        })
+    print(f"Found {num_found}. Execution time: {td_exe:.6f} s")
+
+    if cache_path is not None:
+        cache = _read_cache(cache_path)  # may have been updated by another process meanwhile
+        cache[key] = {"time": time.time(), "devices": devices}
+        _write_cache(cache_path, cache)
+    return devices
+
+
+def resolve_identifier(
+        config: LabJackConnectionConfigTypedDict,
+        *,
+        cache_path: str | None = DEFAULT_DISCOVERY_CACHE_PATH,
+        ttl_s: float = 300.0,
+    ) -> str:
+    """
+    Return the IP address of a TCP-connected device given by serial number if the discovery cache knows it, so that
+    the device is opened directly instead of through a network-wide search. Otherwise, return the identifier as is.
+    Never scans for devices.
+    """
+    identifier = str(config['deviceIdentifier'])
+    if config['connectionType'] is LabJackConnectionTypeEnum.USB or not identifier.isdigit() or cache_path is None:
+        return identifier
+    now = time.time()
+    for entry in _read_cache(cache_path).values():
+        if now - entry["time"] >= ttl_s:
+            continue
+        for device in entry["devices"]:
+            if str(device['serial_number']) == identifier and device['IP_address']:
+                return device['IP_address']
+    return identifier
+
+
+def connect_devices(
+        configs: list[LabJackConnectionConfigTypedDict],
+        *,
+        timeout_s: float | list[float] = 5.0,
+        max_workers: int | None = None,
+        use_cache: bool = True,
+        cache_path: str | None = DEFAULT_DISCOVERY_CACHE_PATH,
+    ) -> tuple[dict[str, LabJackDevice], dict[str, Exception]]:
+    """
+    Connect to many devices concurrently, each with its own deadline, so that an unreachable device neither
+    serializes nor stalls the others.
+
+    Args:
+        configs (list)          : Connection configuration of each device.
+        timeout_s (float or list): Deadline in seconds for each device (or one for all). default: 5
+        max_workers (int)       : Number of connection threads. None for one per device. With fewer, the devices
+                                wait for a thread in the order of their deadlines, and a device whose deadline passes
+                                while waiting is not opened.
+        use_cache (bool)        : Whether to open TCP devices given by serial number through the IP address
+                                found in the discovery cache (see `discover_devices`). default: True
+        cache_path (str)        : Path of the discovery cache.
+
+    Returns:
+        tuple of
+            dict: connected LabJackDevice objects keyed by the given device identifiers
+            dict: exception of each device that failed, keyed by the given device identifiers
+                  (TimeoutError if the deadline passed; the device is disconnected if it connects later)
+
+    cf. Each device is opened with the time left to its deadline as timeout, so that LJM gives up on dead IP
+        addresses instead of waiting for its default timeout. LJM_OPEN_TCP_DEVICE_TIMEOUT_MS is library-wide: it is
+        held at the longest timeout of the connections being opened (so a dead device may hold its thread up to the
+        longest deadline), and restored when the last one, abandoned or not, ends (see `LabJackOpenTCPTimeout`).
+        https://support.labjack.com/docs/ljm-library-configuration-functions
+    """
+    if not isinstance(timeout_s, (list, tuple)):
+        timeout_s = [timeout_s]*len(configs)
+    if len(timeout_s) != len(configs):
+        raise ValueError("timeout_s should be a number or have one value per device.")
+    if not configs:
+        return {}, {}
+
+    connected, failed = _connect_concurrently(configs, timeout_s, max_workers, use_cache, cache_path)
+    if failed:
+        print(f"Failed to connect to {len(failed)} device(s): {', '.join(failed)}")
+    return connected, failed
+
+
+def _connect_concurrently(
+        configs: list[LabJackConnectionConfigTypedDict],
+        timeout_s: list[float],
+        max_workers: int | None,
+        use_cache: bool,
+        cache_path: str | None,
+    ) -> tuple[dict[str, LabJackDevice], dict[str, Exception]]:
+    lock = threading.Lock()
+    abandoned = set()  # identifiers whose deadline passed
+
+    def connect(config: LabJackConnectionConfigTypedDict, deadline: float) -> LabJackDevice:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            # waited for a thread until past the deadline: do not tie one up with a connection nobody expects
+            raise TimeoutError(f"Connection to {config['deviceIdentifier']} did not start before its deadline.")
+        identifier = resolve_identifier(config, cache_path=cache_path) if use_cache else config['deviceIdentifier']
+        device = LabJackDevice(config['deviceType'], config['connectionType'], identifier,
+                               connect_timeout_s=remaining)
+        with lock:
+            if str(config['deviceIdentifier']) in abandoned:
+                # connected after its deadline: the caller no longer expects it
+                device._disconnect()
+        return device
+
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(configs))
+    start = time.monotonic()
+    futures: list[Future | None] = [None]*len(configs)
+    for i in sorted(range(len(configs)), key=lambda i: timeout_s[i]):  # earliest deadline first
+        futures[i] = executor.submit(connect, configs[i], start + timeout_s[i])
+
+    connected, failed = {}, {}
+    for config, future, timeout in zip(configs, futures, timeout_s):
+        identifier = str(config['deviceIdentifier'])
+        remaining = max(0.0, start + timeout - time.monotonic())
+        try:
+            connected[identifier] = future.result(timeout=remaining)
+        except FutureTimeoutError:
+            with lock:
+                if future.done() and future.exception() is None:
+                    connected[identifier] = future.result()
+                    continue
+                abandoned.add(identifier)
+            failed[identifier] = TimeoutError(f"Connection to {identifier} did not complete within {timeout} s.")
+        except Exception as ex:
+            failed[identifier] = ex
+    # do not wait for connections past their deadline
+    executor.shutdown(wait=False, cancel_futures=True)
+    return connected, failed
@@ -1,12 +1,37 @@
 # Created by Joonseok Hur
 # Custom functionsc for labJack control
 
-import numpy as np
+import importlib
+import math
+import threading
+import warnings
+from contextlib import contextmanager
 from enum import Enum
 
-from labjack import ljm
+from typing import TypedDict, Union, TYPE_CHECKING
+if TYPE_CHECKING:
+    import numpy as np
 
-from typing import TypedDict, Union
+
+# Lazy imports
+# `labjack.ljm` (loads the LJM shared library) and numpy are imported at first use so that importing this module,
+# `labjack_device` and the command-line entry point stays fast.
+class _LazyModule:
+    """Stand-in for a module that imports it at the first attribute access."""
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self) -> str:
+        state = "imported" if self._module is not None else "not imported yet"
+        return f"<lazy module '{self._name}' ({state})>"
+
+ljm = _LazyModule("labjack.ljm")
 
 
 # Enums
@@ -16,19 +41,19 @@ class LabJackDeviceTypeEnum(Enum):
     """Enum for LabJack device type.
     Refer to https://support.labjack.com/docs/gethandleinfo-ljm-user-s-guide
     """
-    T4 = ljm.constants.dtT4  # 4
-    T7 = ljm.constants.dtT7  # 7
-    T8 = ljm.constants.dtT8  # 8
-    DIGIT = ljm.constants.dtDIGIT  # 200
+    T4 = 4  # ljm.constants.dtT4
+    T7 = 7  # ljm.constants.dtT7
+    T8 = 8  # ljm.constants.dtT8
+    DIGIT = 200  # ljm.constants.dtDIGIT
 
 
 class LabJackConnectionTypeEnum(Enum):
     """Enum for LabJack connection type
     refer to https://support.labjack.com/docs/gethandleinfo-ljm-user-s-guide
     """
-    USB = ljm.constants.ctUSB  # 1
-    ETHERNET = ljm.constants.ctETHERNET  # 3
-    WIFI = ljm.constants.ctWIFI  # 4
+    USB = 1  # ljm.constants.ctUSB
+    ETHERNET = 3  # ljm.constants.ctETHERNET
+    WIFI = 4  # ljm.constants.ctWIFI
 
 
 class LabJackTriggerModeEnum(Enum):
@@ -48,11 +73,11 @@ class LabJackTriggerEdgeEnum(Enum):
     Rising = 1
     
 class LabJackStreamReturnEnum(Enum):
-    """Enum for LabJack trigger edge options
+    """Enum for LJM_STREAM_SCANS_RETURN options
     refer to https://support.labjack.com/docs/ljm-stream-configs#LJMStreamConfigs-LJM_STREAM_SCANS_RETURN
     """
-    ljm.constants.STREAM_SCANS_RETURN_ALL = 1
-    ljm.constants.STREAM_SCANS_RETURN_ALL_OR_NONE = 2
+    STREAM_SCANS_RETURN_ALL = 1  # ljm.constants.STREAM_SCANS_RETURN_ALL
+    STREAM_SCANS_RETURN_ALL_OR_NONE = 2  # ljm.constants.STREAM_SCANS_RETURN_ALL_OR_NONE
     
 
 
@@ -92,18 +117,90 @@ class LabJackStreamReadError(LabJackError):
     """Exception for errors while stream read"""
     pass
 
+class LabJackStreamPlanError(LabJackError):
+    """Exception for stream settings that the device or connection cannot sustain"""
+    pass
+
+class LabJackStreamBusyError(LabJackError):
+    """Exception for stream operations while another object streams on the device"""
+    pass
+
+# register read
+class LabJackRegisterReadError(LabJackError):
+    """Exception for errors while reading LabJack device registers (command-response)"""
+    pass
+
+
+
+
+# # errors after which a stream can be resumed by reconnecting (see `reconnect_attempts` of StreamIn)
+# names of ljm.errorcodes (resolved at first use to keep `labjack.ljm` lazily imported)
+LABJACK_RECOVERABLE_STREAM_ERRORS = (
+    "DEVICE_DISCONNECTED",
+    "DEVICE_NOT_OPEN",
+    "CANNOT_CONNECT",
+    "NO_RESPONSE_BYTES_RECEIVED",
+    "SOCKET_LEVEL_ERROR",
+    "RECONNECT_FAILED",
+    "CONNECTION_HAS_YIELDED_RECONNECT_FAILED",
+    "SYNCHRONIZATION_TIMEOUT",
+    "STREAM_NOT_RUNNING",
+    "LJM_BUFFER_FULL",
+)
+
+def LabJackIsRecoverableStreamError(ljmex: Exception) -> bool:
+    """Whether `ljmex` is an ljm.LJMError after which the stream can be resumed by reconnecting."""
+    if not isinstance(ljmex, ljm.LJMError):
+        return False
+    codes = {getattr(ljm.errorcodes, name) for name in LABJACK_RECOVERABLE_STREAM_ERRORS}
+    return ljmex.errorCode in codes
+
+
+# LJM_OPEN_TCP_DEVICE_TIMEOUT_MS is library-wide: every connection opened with a timeout goes through one owner
+_open_tcp_timeout_lock = threading.Lock()
+_open_tcp_timeouts_ms = []  # timeouts of the connections being opened
+_open_tcp_timeout_previous_ms = None  # value before the first of them
+
+@contextmanager
+def LabJackOpenTCPTimeout(timeout_ms: int):
+    """
+    Hold LJM_OPEN_TCP_DEVICE_TIMEOUT_MS at the largest timeout of the connections being opened (with this one) for
+    the duration of the `with` block; the value set before the first of them is restored when the last one exits.
+    Raises ljm.LJMError if the setting cannot be read or written (then nothing is held).
+    """
+    global _open_tcp_timeout_previous_ms
+    timeout_ms = int(timeout_ms)
+    with _open_tcp_timeout_lock:
+        if not _open_tcp_timeouts_ms:
+            _open_tcp_timeout_previous_ms = ljm.readLibraryConfigS("LJM_OPEN_TCP_DEVICE_TIMEOUT_MS")
+        if not _open_tcp_timeouts_ms or timeout_ms > max(_open_tcp_timeouts_ms):
+            ljm.writeLibraryConfigS("LJM_OPEN_TCP_DEVICE_TIMEOUT_MS", timeout_ms)
+        _open_tcp_timeouts_ms.append(timeout_ms)
+    try:
+        yield
+    finally:
+        with _open_tcp_timeout_lock:
+            _open_tcp_timeouts_ms.remove(timeout_ms)
+            try:
+                if not _open_tcp_timeouts_ms:
+                    ljm.writeLibraryConfigS("LJM_OPEN_TCP_DEVICE_TIMEOUT_MS", _open_tcp_timeout_previous_ms)
+                elif timeout_ms > max(_open_tcp_timeouts_ms):
+                    ljm.writeLibraryConfigS("LJM_OPEN_TCP_DEVICE_TIMEOUT_MS", max(_open_tcp_timeouts_ms))
+            except ljm.LJMError as ljmex:
+                warnings.warn(f"LJM_OPEN_TCP_DEVICE_TIMEOUT_MS could not be restored ({ljmex}).", UserWarning)
+
 
 
 
 # data handling
-def LabJackaData2chData(aData, numAddresses, scanRate=np.nan):
+def LabJackaData2chData(aData, numAddresses, scanRate=math.nan):
     """sort interleaved data from streaming (refer to https://support.labjack.com/docs/estreamread-ljm-user-s-guide)
     to the 2D array indexed by channel and time order
 
     Args:
         aData (list or numpy.array): interleaved data returned from streaming
         numAddresses (int): number of input channels streamed
-        scanRate (float, optional): scan rate to determine measured time of data. Defaults to np.nan.
+        scanRate (float, optional): scan rate to determine measured time of data. Defaults to nan (i.e., no 't').
 
     Returns:
         list: list of dict for data per hannel
@@ -112,6 +209,7 @@ def LabJackaData2chData(aData, numAddresses, scanRate=np.nan):
                 'idx' (np.array of int): index of data in the input streamed data "aData"
                 't' (np.array of float, optional): time elapsed for the measurement.
     """
+    import numpy as np
     aData = np.array(aData)
 
     # chData = [aData[idx::numAddresses] for idx in range(numAddresses)]
@@ -122,7 +220,7 @@ def LabJackaData2chData(aData, numAddresses, scanRate=np.nan):
         ichs = idxs[i::numAddresses]
         chData[i]['idx'] = ichs
         chData[i]['V'] = np.array(aData[ichs])
-        if scanRate is not np.nan:
+        if not math.isnan(scanRate):
             chData[i]['t'] = ichs/scanRate
 
     return chData
@@ -159,9 +257,9 @@ class LabJackStreamingConfigTypedDict(TypedDict):
 
 
 class LabJackStreamChDataTypedDict(TypedDict):
-    V: np.ndarray
-    idx: np.ndarray
-    t: np.ndarray
+    V: 'np.ndarray'
+    idx: 'np.ndarray'
+    t: 'np.ndarray'
 
 
 class LabJackStreamDataTypedDict(TypedDict):
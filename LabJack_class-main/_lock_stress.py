@@ -0,0 +1,116 @@
+from _ljm_aux import *
+
+import threading
+import time
+from typing import TypedDict, TYPE_CHECKING
+
+import numpy as np
+if TYPE_CHECKING:
+    from labjack_device import LabJackDevice
+
+
+class LabJackLockStressTypedDict(TypedDict):
+    """Result of `stress_device_lock()` per kind of thread ('read', 'configure', 'stream')."""
+    kind: str
+    num_threads: int
+    num_ops: int
+    ops_per_s: float
+    latency_median_ms: float
+    latency_max_ms: float
+    num_errors: int
+
+
+def stress_device_lock(
+        device: 'LabJackDevice',
+        *,
+        duration_s: float = 5.0,
+        num_readers: int = 4,
+        registers: list[str] = ["AIN0", "AIN1", "TEMPERATURE_DEVICE_K"],
+        configure: dict[str, int | float] | None = None,
+        stream_channels: list[str] | None = None,
+        stream_duration_s: float = 0.5,
+        sampling_rate_Hz: float = 10e3,
+    ) -> list[LabJackLockStressTypedDict]:
+    """
+    Run threads contending for one device for `duration_s` and measure their throughput and latency:
+    `num_readers` threads reading `registers` (`LabJackDevice.read()`), optionally a thread re-applying `configure`
+    (`LabJackDevice.configure_register()`) and a thread streaming shots of `stream_channels`. A second StreamIn is
+    also started once during a shot to check that the stream ownership rejects it (counted as an error otherwise).
+
+    Compare with `num_readers=1` and no other thread to see the cost of the contention.
+
+    Returns:
+        list of LabJackLockStressTypedDict, one per kind of thread
+    """
+    stop = threading.Event()
+    latencies = {'read': [], 'configure': [], 'stream': []}
+    errors = {'read': 0, 'configure': 0, 'stream': 0}
+    results_lock = threading.Lock()
+
+    def run(kind, operation):
+        local_latencies, local_errors = [], 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                operation()
+            except LabJackError:
+                local_errors += 1
+                continue
+            local_latencies.append(time.perf_counter() - start)
+        with results_lock:
+            latencies[kind].extend(local_latencies)
+            errors[kind] += local_errors
+
+    threads = [threading.Thread(target=run, args=('read', lambda: device.read(registers)), daemon=True)
+               for _ in range(num_readers)]
+    num_threads = {'read': num_readers, 'configure': 0, 'stream': 0}
+    if configure:
+        threads.append(threading.Thread(target=run, args=('configure', lambda: device.configure_register(**configure)),
+                                        daemon=True))
+        num_threads['configure'] = 1
+    if stream_channels:
+        stream_in = device.stream_in(stream_channels, stream_duration_s, sampling_rate_Hz=sampling_rate_Hz,
+                                     scans_per_read=max(1, int(sampling_rate_Hz/len(stream_channels)/20)))
+        rejected = []
+
+        def try_second_stream(stream_in, *_):
+            # while the first stream runs, another StreamIn must not be able to configure the device
+            if rejected:
+                return
+            try:
+                device.stream_in(stream_channels, stream_duration_s, sampling_rate_Hz=sampling_rate_Hz)
+            except LabJackStreamBusyError:
+                rejected.append(True)
+            else:
+                rejected.append(False)
+
+        stream_in.add_block_handler(try_second_stream)
+        threads.append(threading.Thread(target=run, args=('stream', stream_in._stream_in), daemon=True))
+        num_threads['stream'] = 1
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    stop.wait(duration_s)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if stream_channels and rejected and not rejected[0]:
+        errors['stream'] += 1
+
+    results = []
+    for kind, kind_latencies in latencies.items():
+        if num_threads[kind] == 0:
+            continue
+        kind_latencies = np.array(kind_latencies)*1e3
+        results.append(LabJackLockStressTypedDict(
+            kind=kind,
+            num_threads=num_threads[kind],
+            num_ops=len(kind_latencies),
+            ops_per_s=len(kind_latencies)/elapsed,
+            latency_median_ms=float(np.median(kind_latencies)) if len(kind_latencies) else float('nan'),
+            latency_max_ms=float(np.max(kind_latencies)) if len(kind_latencies) else float('nan'),
+            num_errors=errors[kind],
+        ))
+    return results
@@ -0,0 +1,285 @@
+import math
+import warnings
+from typing import TYPE_CHECKING
+
+import numpy as np
+if TYPE_CHECKING:
+    from _stream_in import StreamIn
+
+
+class LockIn:
+    """
+    Multi-channel digital lock-in amplifier for the blocks of a StreamIn: each channel is mixed with a complex local
+    oscillator, low-passed and decimated to `output_rate_Hz`, giving I, Q, R (V rms) and theta (rad) records.
+
+    - Reference: a fixed `frequency_Hz`, or a streamed `reference_channel` (e.g., the modulation signal or a chopper
+      TTL). With a reference channel, the reference is demodulated like the signals; the oscillator frequency follows
+      its phase drift between blocks, and the outputs are given relative to the reference phase.
+    - The oscillator table exp(j*omega*k) is cached per block length and rotated to the running phase, so the
+      oscillator stays phase-continuous across eStreamRead blocks (and across resume gaps, by the missing scans).
+    - Low-pass: `filter_order` cascaded first-order stages of time constant `time_constant_s` at the scan rate (as in
+      analog lock-ins, so that they reject the 2f mixing product before decimation), followed by a boxcar average
+      over each output period (decimation).
+    - Skipped samples (NaN) hold the filter stages and are left out of the averages; each stage starts at the first
+      finite sample of its channel (outputs before it are NaN).
+
+    For a signal A*cos(2*pi*f*t + theta): I = A/sqrt(2)*cos(theta), Q = A/sqrt(2)*sin(theta), R = A/sqrt(2).
+
+    e.g.,
+        lockin = LockIn(stream_in.scan_rate_Hz, stream_in.scan_channels, ["AIN0", "AIN1"], frequency_Hz=1234.5,
+                        output_rate_Hz=100)
+        lockin.attach(stream_in)
+        stream_in._stream_in()
+        lockin.records['AIN0_R']['V'], lockin.records['AIN0_R']['t']
+    """
+
+    # Read-only properties
+    @property
+    def scan_rate_Hz(self): return self._scan_rate
+    @property
+    def channels(self): return list(self._channels)
+    @property
+    def reference_channel(self): return self._reference_channel
+    @property
+    def output_rate_Hz(self): return self._scan_rate/self._decimation
+    @property
+    def decimation(self): return self._decimation
+    @property
+    def frequency_Hz(self): return self._omega*self._scan_rate/(2*math.pi)
+    @property
+    def records(self): return self._records
+
+    def __init__(self,
+                 scan_rate_Hz: float,
+                 scan_channels: list[str],
+                 channels: list[str],
+                 *,
+                 frequency_Hz: float | None = None,
+                 reference_channel: str | None = None,
+                 output_rate_Hz: float = 100.0,
+                 time_constant_s: float | None = None,
+                 filter_order: int = 2,
+                 harmonic: int = 1,
+                 tracking_gain: float = 0.5,
+            ) -> None:
+        """
+        Parameters:
+            scan_rate_Hz (float)        : Scan rate per channel of the stream.
+            scan_channels (list)        : Streamed channels, in the order of the scan list.
+            channels (list)             : Channels to demodulate.
+            frequency_Hz (float)        : Reference frequency. With `reference_channel`, the starting estimate
+                                        (None to estimate it from the zero crossings of the first block).
+            reference_channel (str)     : Streamed reference channel. None for the fixed `frequency_Hz`.
+            output_rate_Hz (float)      : Output rate; rounded to scan_rate_Hz/integer (see `output_rate_Hz`).
+                                        default: 100
+            time_constant_s (float)     : Time constant of the filter stages. None for the boxcar only.
+            filter_order (int)          : Number of first-order stages (6 dB/octave each). default: 2
+            harmonic (int)              : Demodulate at this harmonic of the reference. default: 1
+            tracking_gain (float)       : Fraction of the reference frequency error corrected after each block.
+                                        default: 0.5
+        """
+        if frequency_Hz is None and reference_channel is None:
+            raise ValueError("Give frequency_Hz, reference_channel or both.")
+        for channel in list(channels) + ([reference_channel] if reference_channel is not None else []):
+            if channel not in scan_channels:
+                raise ValueError(f"{channel} is not a streamed channel.")
+        self._scan_rate = float(scan_rate_Hz)
+        self._scan_channels = list(scan_channels)
+        self._channels = list(channels)
+        self._columns = [self._scan_channels.index(channel) for channel in self._channels]
+        self._reference_channel = reference_channel
+        self._harmonic = int(harmonic)
+        self._decimation = max(1, int(round(self._scan_rate/output_rate_Hz)))
+        self._time_constant = time_constant_s
+        self._filter_order = int(filter_order) if time_constant_s else 0
+        self._tracking_gain = float(tracking_gain)
+        self._frequency_input = frequency_Hz
+        self._table_cache = {}
+        self._records = None
+        self.reset()
+
+    def reset(self) -> None:
+        """Start a new shot: oscillator phase 0 at the next sample, empty filters and outputs."""
+        self._omega = (2*math.pi*self._frequency_input/self._scan_rate
+                       if self._frequency_input is not None else None)  # rad/sample of the reference
+        self._phase = 0.0               # oscillator phase of the next sample (rad)
+        self._num_samples = 0           # samples since the start of the shot, including gaps
+        self._carry = None              # mixed samples of the incomplete output period
+        self._carry_start = 0           # sample index of the first carried sample
+        self._stages = None             # states of the filter stages
+        self._reference_phase = None    # unwrapped reference phase of the last output
+        self._outputs = []              # (sample index of window centers, outputs: windows x channels)
+
+    # >>>>> demodulation >>>>>
+
+    def _oscillator(self, num_samples: int) -> 'np.ndarray':
+        """exp(-j*(phase + omega*k)) (fundamental) for the next `num_samples` samples; advances the phase."""
+        key = (self._omega, num_samples)
+        table = self._table_cache.get(key)
+        if table is None:
+            if len(self._table_cache) >= 8:
+                self._table_cache.clear()  # the frequency is being tracked: keep the cache small
+            table = np.exp(-1j*self._omega*np.arange(num_samples))
+            self._table_cache[key] = table
+        oscillator = table*np.exp(-1j*self._phase)
+        self._phase = (self._phase + self._omega*num_samples) % (2*math.pi)
+        return oscillator
+
+    def _estimate_frequency(self, reference: 'np.ndarray') -> float:
+        """rad/sample from the rising zero crossings of the reference (first block without a frequency)."""
+        centered = reference - np.nanmean(reference)
+        rising = np.nonzero((centered[:-1] < 0) & (centered[1:] >= 0))[0]
+        if len(rising) < 2:
+            raise ValueError("Reference frequency cannot be estimated: fewer than 2 periods in the first block. "
+                             "Give frequency_Hz.")
+        return 2*math.pi*(len(rising) - 1)/(rising[-1] - rising[0])
+
+    def update(self, block: 'np.ndarray') -> None:
+        """Demodulate contiguous (scans x streamed channels) samples continuing the previous update."""
+        num_samples = len(block)
+        if num_samples == 0:
+            return
+        columns = self._columns
+        if self._reference_channel is not None:
+            columns = columns + [self._scan_channels.index(self._reference_channel)]
+            if self._omega is None:
+                self._omega = self._estimate_frequency(block[:, columns[-1]])
+        fundamental = self._oscillator(num_samples)
+        oscillator = fundamental if self._harmonic == 1 else fundamental**self._harmonic
+        mixed = np.empty((num_samples, len(columns)), dtype=complex)
+        np.multiply(block[:, self._columns], oscillator[:, None], out=mixed[:, :len(self._columns)])
+        if self._reference_channel is not None:
+            # the reference is demodulated at its fundamental
+            np.multiply(block[:, columns[-1]], fundamental, out=mixed[:, -1])
+        mixed = self._filter(mixed)
+        start = self._num_samples
+        self._num_samples += num_samples
+        if self._carry is not None:
+            mixed = np.concatenate((self._carry, mixed))
+            start = self._carry_start
+
+        # boxcar average over each output period, leaving out NaN
+        m = self._decimation
+        num_windows = len(mixed)//m
+        self._carry = mixed[num_windows*m:]
+        self._carry_start = start + num_windows*m
+        if num_windows == 0:
+            return
+        windows = mixed[:num_windows*m].reshape(num_windows, m, -1)
+        valid = ~np.isnan(windows)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            averages = np.where(valid, windows, 0).sum(axis=1)/valid.sum(axis=1)
+
+        if self._reference_channel is not None:
+            averages = self._relative_to_reference(averages)
+        centers = start + m*np.arange(num_windows) + (m - 1)/2
+        self._outputs.append((centers, averages))
+
+    def _filter(self, mixed: 'np.ndarray') -> 'np.ndarray':
+        """Cascaded first-order low-pass stages at the scan rate, continuing from the previous update."""
+        if self._filter_order == 0:
+            return mixed
+        a = math.exp(-1/(self._scan_rate*self._time_constant))
+        # chunks short enough that a**-chunk stays below 1e6 (precision of the closed form, see _first_order_stage)
+        chunk = max(1, int(math.log(1e6)*self._scan_rate*self._time_constant))
+        if self._stages is None:
+            self._stages = [np.full(mixed.shape[1], np.nan, dtype=complex) for _ in range(self._filter_order)]
+        for stage in self._stages:
+            mixed = self._first_order_stage(mixed, stage, a, chunk)
+        return mixed
+
+    @staticmethod
+    def _first_order_stage(x: 'np.ndarray', state: 'np.ndarray', a: float, chunk: int) -> 'np.ndarray':
+        """
+        y[n] = a*y[n-1] + (1 - a)*x[n] over (samples x channels), holding y over NaN samples. `state` (y before x, NaN
+        until the first finite sample of the channel, which starts the stage) is updated in place.
+        """
+        y = np.empty_like(x)
+        valid = ~np.isnan(x)
+        index = np.arange(min(chunk, len(x)))[:, None]
+        for begin in range(0, len(x), chunk):
+            xs = x[begin:begin + chunk]
+            vs = valid[begin:begin + chunk]
+            starting = np.isnan(state) & vs.any(axis=0)
+            if starting.any():
+                first = vs.argmax(axis=0)
+                state[starting] = xs[first[starting], np.nonzero(starting)[0]]
+            # closed form: y[n] = a**c[n]*(state + (1 - a)*sum(x[k]*a**-c[k], k <= n)), c[n] = valid samples up to n
+            scale = a**-np.cumsum(vs, axis=0)
+            ys = (state + (1 - a)*np.cumsum(np.where(vs, xs, 0)*scale, axis=0))/scale
+            if starting.any():
+                ys[(index[:len(xs)] < first) & starting] = np.nan
+            state[:] = ys[-1]
+            y[begin:begin + chunk] = ys
+        return y
+
+    def _relative_to_reference(self, averages: 'np.ndarray') -> 'np.ndarray':
+        """Rotate the signals by the reference phase and correct the oscillator frequency by its drift."""
+        reference = averages[:, -1]
+        phase = np.unwrap(np.angle(reference[np.isfinite(reference)]))  # NaN until the reference stages start
+        if len(phase) == 0:
+            drift = 0.0
+        elif self._reference_phase is not None:
+            # continue the unwrapped phase of the previous block
+            phase += np.round((self._reference_phase - phase[0])/(2*math.pi))*2*math.pi
+            drift = (phase[-1] - self._reference_phase)/(len(phase)*self._decimation)  # rad/sample
+        elif len(phase) >= 2:
+            drift = (phase[-1] - phase[0])/((len(phase) - 1)*self._decimation)
+        else:
+            drift = 0.0
+        if len(phase):
+            self._reference_phase = phase[-1]
+        if np.isfinite(drift):
+            # the demodulated reference phase advances by (omega_ref - omega) per sample
+            self._omega += self._tracking_gain*drift
+        rotation = np.exp(-1j*self._harmonic*np.angle(reference))
+        return averages[:, :-1]*rotation[:, None]
+
+    def skip(self, num_samples: int) -> None:
+        """Advance the oscillator over missing samples (e.g., a resume gap); the incomplete output period is dropped."""
+        self._phase = (self._phase + self._omega*num_samples) % (2*math.pi) if self._omega is not None else 0.0
+        self._num_samples += num_samples
+        self._carry = None
+
+    def end_shot(self) -> dict[str, dict[str, 'np.ndarray']]:
+        """
+        Build the records of the shot: '<channel>_I', '_Q', '_R' (V rms) and '_theta' (rad), each a dict of 'V' and
+        't' (s from scan 0 of the shot, at the center of each output period).
+        """
+        if self._outputs:
+            centers = np.concatenate([centers for centers, _ in self._outputs])
+            outputs = np.concatenate([outputs for _, outputs in self._outputs])*math.sqrt(2)
+        else:
+            centers = np.empty(0)
+            outputs = np.empty((0, len(self._channels)), dtype=complex)
+        t = centers/self._scan_rate
+        records = {}
+        for ich, channel in enumerate(self._channels):
+            z = outputs[:, ich]
+            records[f"{channel}_I"] = {'V': z.real, 't': t}
+            records[f"{channel}_Q"] = {'V': z.imag, 't': t}
+            records[f"{channel}_R"] = {'V': np.abs(z), 't': t}
+            records[f"{channel}_theta"] = {'V': np.angle(z), 't': t}
+        self._records = records
+        omega = self._omega
+        self.reset()
+        if self._reference_channel is not None and omega is not None:
+            self._omega = omega  # the tracked frequency is the estimate of the next shot
+        return records
+
+    # <<<<< demodulation <<<<<
+
+    def attach(self, stream_in: 'StreamIn') -> None:
+        """Demodulate every eStreamRead block of `stream_in` (in its stacking thread); records are set per shot."""
+        stream_in.add_block_handler(self._on_block)
+        stream_in.add_shot_handler(lambda stream_in: self.end_shot())
+
+    def _on_block(self, stream_in: 'StreamIn', ir: int, a_data: 'np.ndarray', *_) -> None:
+        if ir == 0 and self._num_samples:
+            warnings.warn("LockIn: a shot started before the previous one ended; its outputs are dropped.",
+                          UserWarning)
+            self.reset()
+        for _, missing_scans in stream_in._block_gaps():
+            self.skip(missing_scans)
+        num_channels = len(self._scan_channels)
+        self.update(a_data[:len(a_data)//num_channels*num_channels].reshape(-1, num_channels))
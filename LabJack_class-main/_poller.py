@@ -0,0 +1,252 @@
+from _ljm_aux import *
+
+import collections
+import threading
+import time
+import warnings
+from typing import Callable, TYPE_CHECKING
+
+import numpy as np
+if TYPE_CHECKING:
+    from labjack_device import LabJackDevice
+
+
+# Modbus feedback (MBFB) packet sizes: https://support.labjack.com/docs/protocol-details-direct-modbus-tcp
+_MBFB_HEADER_BYTES = 8      # MBAP header (7) + function code (1)
+_MBFB_READ_FRAME_BYTES = 4  # frame type, address (2), number of registers
+_DATA_TYPE_BYTES = {0: 2, 1: 4, 2: 4, 3: 4}  # ljm.constants UINT16, UINT32, INT32, FLOAT32
+
+
+class _RegisterPacket:
+    """Registers read by one eReadAddresses call (i.e., one command-response round trip)."""
+
+    def __init__(self, names: list[str], addresses: list[int], data_types: list[int]) -> None:
+        self.names = names
+        self.addresses = addresses
+        self.data_types = data_types
+
+    def read(self, handle: int) -> list[float]:
+        return ljm.eReadAddresses(handle, len(self.addresses), self.addresses, self.data_types)
+
+
+def pack_registers(names: list[str], max_bytes_per_MB: int) -> list[_RegisterPacket]:
+    """
+    Group registers into as few packets as `max_bytes_per_MB` allows for both the request (one read frame per
+    register) and the response (the register values).
+
+    ljm methods used:
+    - https://support.labjack.com/docs/namestoaddresses-ljm-user-s-guide
+    """
+    names = list(dict.fromkeys(names))  # read each register once
+    try:
+        addresses, data_types = ljm.namesToAddresses(len(names), names)
+    except ljm.LJMError as ljmex:
+        raise LabJackRegisterReadError("LabJack library-level error") from ljmex
+    packets = []
+    current = ([], [], [])
+    request_bytes = response_bytes = _MBFB_HEADER_BYTES
+    for name, address, data_type in zip(names, addresses, data_types):
+        if data_type not in _DATA_TYPE_BYTES:
+            raise ValueError(f"{name} is not a numeric register.")
+        value_bytes = _DATA_TYPE_BYTES[data_type]
+        if current[0] and (request_bytes + _MBFB_READ_FRAME_BYTES > max_bytes_per_MB
+                           or response_bytes + value_bytes > max_bytes_per_MB):
+            packets.append(_RegisterPacket(*current))
+            current = ([], [], [])
+            request_bytes = response_bytes = _MBFB_HEADER_BYTES
+        current[0].append(name)
+        current[1].append(address)
+        current[2].append(data_type)
+        request_bytes += _MBFB_READ_FRAME_BYTES
+        response_bytes += value_bytes
+    if current[0]:
+        packets.append(_RegisterPacket(*current))
+    return packets
+
+
+def read_registers(device: 'LabJackDevice', names: list[str]) -> dict[str, float]:
+    """Read registers in as few round trips as possible. See `LabJackDevice.read()`."""
+    device._check_connection()
+    values = {}
+    try:
+        for packet in pack_registers(names, device.max_bytes_per_MB):
+            with device._command_lock:  # per packet, so other threads interleave
+                values.update(zip(packet.names, packet.read(device._handle)))
+    except ljm.LJMError as ljmex:
+        raise LabJackRegisterReadError("LabJack library-level error") from ljmex
+    return values
+
+
+class RegisterPoller:
+    """
+    Poll groups of registers at per-group intervals on one background thread. At each tick, the registers of all due
+    groups are read together in as few packets as `max_bytes_per_MB` allows, so polling many values costs about one
+    round trip per tick instead of one per register.
+
+    e.g.,
+        with device.poll({'temperatures': (["TEMPERATURE_DEVICE_K", "AIN10"], 1.0),
+                          'dc': (["AIN4", "AIN5"], 0.1)}) as poller:
+            time.sleep(10)
+            t, values = poller.data('dc')  # t: (ticks,), values: (ticks x registers)
+
+    Results are kept per group in a bounded history (`max_ticks`), and can also be pushed to `callback`.
+    """
+
+    # Read-only properties
+    @property
+    def groups(self): return {name: (list(names), interval) for name, (names, interval) in self._groups.items()}
+    @property
+    def num_ticks(self): return self._num_ticks
+    @property
+    def num_round_trips(self): return self._num_round_trips
+    @property
+    def num_errors(self): return self._num_errors
+    @property
+    def running(self): return self._thread is not None and self._thread.is_alive()
+
+    def __init__(self,
+                 device: 'LabJackDevice',
+                 groups: dict[str, tuple[list[str], float]],
+                 *,
+                 max_ticks: int = 100_000,
+                 callback: Callable[[str, float, dict[str, float]], None] | None = None,
+                 max_consecutive_errors: int = 3,
+            ) -> None:
+        """
+        Parameters:
+            device (LabJackDevice)          : Connected device.
+            groups (dict)                   : Group name -> (register names, interval in seconds).
+            max_ticks (int)                 : Ticks kept per group. default: 100000
+            callback (callable)             : callback(group, timestamp, {register: value}) run on the polling
+                                            thread after each read of a group. Keep it short.
+            max_consecutive_errors (int)    : Failed ticks in a row after which polling stops (the error is raised
+                                            by `stop()`). default: 3
+        """
+        if not groups:
+            raise ValueError("No group to poll.")
+        for name, (names, interval) in groups.items():
+            if interval <= 0:
+                raise ValueError(f"Interval of group {name} should be bigger than 0.")
+            if not names:
+                raise ValueError(f"Group {name} has no register.")
+        self._device = device
+        self._groups = {name: (list(names), float(interval)) for name, (names, interval) in groups.items()}
+        self._callback = callback
+        self._max_consecutive_errors = int(max_consecutive_errors)
+        self._history = {name: collections.deque(maxlen=max_ticks) for name in self._groups}
+        self._lock = threading.Lock()
+        self._packets = {}  # frozenset of due groups -> packets (the due combinations repeat)
+        self._stop = threading.Event()
+        self._thread = None
+        self._error = None
+        self._num_ticks = 0
+        self._num_round_trips = 0
+        self._num_errors = 0
+
+    def __enter__(self):
+        if not self.running:
+            self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self) -> None:
+        if self.running:
+            raise RuntimeError("RegisterPoller is already running.")
+        self._device._check_connection()
+        self._stop.clear()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="RegisterPoller", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop polling. Raises the error that stopped polling, if any."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            if isinstance(error, ljm.LJMError):
+                raise LabJackRegisterReadError("LabJack library-level error") from error
+            raise LabJackRegisterReadError("Non LabJack library-level error") from error
+
+    # >>>>> polling thread >>>>>
+
+    def _run(self) -> None:
+        start = time.monotonic()
+        next_due = {name: start for name in self._groups}
+        consecutive_errors = 0
+        while not self._stop.is_set():
+            now = time.monotonic()
+            due = frozenset(name for name, t in next_due.items() if t <= now)
+            if not due:
+                self._stop.wait(min(next_due.values()) - now)
+                continue
+            try:
+                self._tick(due)
+                consecutive_errors = 0
+            except Exception as ex:
+                self._num_errors += 1
+                consecutive_errors += 1
+                if consecutive_errors >= self._max_consecutive_errors:
+                    self._error = ex
+                    return
+                warnings.warn(f"RegisterPoller: read failed ({ex}); retrying at the next tick.", UserWarning)
+            for name in due:
+                interval = self._groups[name][1]
+                # keep the schedule of each group; skip ticks missed while reading
+                next_due[name] += interval*max(1, int((now - next_due[name])//interval) + 1)
+
+    def _tick(self, due: frozenset) -> None:
+        packets = self._packets.get(due)
+        if packets is None:
+            names = [register for name in sorted(due) for register in self._groups[name][0]]
+            packets = self._packets[due] = pack_registers(names, self._device.max_bytes_per_MB)
+        command_lock = self._device._command_lock
+        values = {}
+        t_start = time.time()
+        for packet in packets:
+            with command_lock:
+                values.update(zip(packet.names, packet.read(self._device._handle)))
+        timestamp = (t_start + time.time())/2  # middle of the round trips
+        self._num_round_trips += len(packets)
+        self._num_ticks += 1
+        with self._lock:
+            for name in due:
+                registers = self._groups[name][0]
+                self._history[name].append((timestamp, [values[register] for register in registers]))
+        if self._callback is not None:
+            for name in due:
+                self._callback(name, timestamp, {register: values[register] for register in self._groups[name][0]})
+
+    # <<<<< polling thread <<<<<
+
+    def data(self, group: str, *, clear: bool = False) -> tuple['np.ndarray', 'np.ndarray']:
+        """
+        Timestamped values of a group polled so far.
+
+        Returns:
+            tuple of (ticks,) host POSIX times and (ticks x registers) values, registers in the order of the group
+        """
+        with self._lock:
+            history = list(self._history[group])
+            if clear:
+                self._history[group].clear()
+        num_registers = len(self._groups[group][0])
+        if not history:
+            return np.empty(0), np.empty((0, num_registers))
+        t, values = zip(*history)
+        return np.array(t), np.array(values, dtype=float)
+
+    def latest(self) -> dict[str, tuple[float, float]]:
+        """Last (timestamp, value) of every register polled."""
+        latest = {}
+        with self._lock:
+            for name, history in self._history.items():
+                if history:
+                    timestamp, values = history[-1]
+                    latest.update((register, (timestamp, value))
+                                  for register, value in zip(self._groups[name][0], values))
+        return latest
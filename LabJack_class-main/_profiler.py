@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+import warnings
+from contextlib import nullcontext
+from typing import TypedDict
+
+
+class LabJackStageTimingTypedDict(TypedDict):
+    """Timing of one acquisition stage within a shot (see `AcquisitionProfiler.report()`)."""
+    stage: str
+    count: int
+    total_ms: float
+    mean_ms: float
+    max_ms: float
+
+
+# stages instrumented by LabJackDevice and StreamIn, in acquisition order
+PROFILER_STAGES = (
+    'connect', 'configure', 'trigger_arm', 'stream_start', 'trigger_wait', 'read', 'stacking', 'stream_stop',
+    'deinterleave', 'record_assembly', 'shot_handlers', 'shot', 'disconnect',
+)
+
+
+class _Span:
+    __slots__ = ('_profiler', '_name', '_args', '_start')
+
+    def __init__(self, profiler: 'AcquisitionProfiler', name: str, args: dict | None) -> None:
+        self._profiler = profiler
+        self._name = name
+        self._args = args
+
+    def __enter__(self) -> '_Span':
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self._profiler.record(self._name, self._start, time.perf_counter_ns(), self._args)
+
+
+class AcquisitionProfiler:
+    """
+    Spans of the acquisition stages (see PROFILER_STAGES), timed with the monotonic time.perf_counter_ns and tagged
+    with the shot and thread they ran in, e.g.,
+        profiler = device.enable_profiling()
+        stream_in._stream_in()
+        print(profiler.format_report())       # per-stage timing of the last shot
+        profiler.export_chrome_trace("acquisition.json")  # open in https://ui.perfetto.dev or chrome://tracing
+
+    When profiling is disabled, the instrumented code uses NULL_PROFILER, whose `span()` returns a shared no-op
+    context manager (one method call per span, nothing recorded).
+    """
+
+    enabled = True
+
+    # Read-only properties
+    @property
+    def num_shots(self): return self._shot + 1
+    @property
+    def num_spans(self): return min(len(self._spans), self._max_spans)
+
+    def __init__(self, *, max_spans: int = 1_000_000) -> None:
+        """
+        Parameters:
+            max_spans (int) : Spans kept (about 100 bytes each); later spans are dropped with a warning.
+                            default: 1000000
+        """
+        self._origin = time.perf_counter_ns()
+        self._max_spans = int(max_spans)
+        self._spans = []  # (name, start ns, end ns, shot, thread id, args)
+        self._thread_names = {}
+        self._shot = -1  # shot being acquired; -1 before the first one
+
+    def span(self, name: str, **args) -> _Span:
+        """Context manager timing a stage; keyword arguments are kept as trace arguments."""
+        return _Span(self, name, args or None)
+
+    def record(self, name: str, start_ns: int, end_ns: int, args: dict | None = None) -> None:
+        """Add a span timed elsewhere (perf_counter_ns values)."""
+        if len(self._spans) >= self._max_spans:
+            if len(self._spans) == self._max_spans:
+                warnings.warn(f"AcquisitionProfiler: {self._max_spans} spans recorded; later spans are dropped.",
+                              UserWarning)
+                self._spans.append(None)  # marks the warning as given
+            return
+        thread = threading.current_thread()
+        self._thread_names.setdefault(thread.ident, thread.name)
+        self._spans.append((name, start_ns, end_ns, self._shot, thread.ident, args))
+
+    def begin_shot(self) -> int:
+        """Start tagging spans with a new shot index (called by StreamIn at each shot); returns it."""
+        self._shot += 1
+        return self._shot
+
+    def clear(self) -> None:
+        self._spans = []
+        self._shot = -1
+
+    # >>>>> reports >>>>>
+
+    def _iter_spans(self):
+        return (span for span in self._spans if span is not None)
+
+    def report(self, shot: int = -1) -> list[LabJackStageTimingTypedDict]:
+        """
+        Per-stage timing of a shot (negative indices count from the last shot). Spans recorded before the first
+        shot (e.g., connect) are in the trace only.
+        """
+        if shot < 0:
+            shot = self._shot + 1 + shot
+        durations = {}
+        for name, start, end, span_shot, _, _ in self._iter_spans():
+            if span_shot == shot:
+                durations.setdefault(name, []).append((end - start)/1e6)
+        order = {stage: i for i, stage in enumerate(PROFILER_STAGES)}
+        return [LabJackStageTimingTypedDict(stage=name, count=len(values), total_ms=sum(values),
+                                            mean_ms=sum(values)/len(values), max_ms=max(values))
+                for name, values in sorted(durations.items(), key=lambda item: order.get(item[0], len(order)))]
+
+    def format_report(self, shot: int = -1) -> str:
+        lines = [f"\t{'stage':<18s}{'count':>7s}{'total ms':>11s}{'mean ms':>10s}{'max ms':>10s}"]
+        for row in self.report(shot):
+            lines.append(f"\t{row['stage']:<18s}{row['count']:7d}{row['total_ms']:11.3f}{row['mean_ms']:10.3f}"
+                         f"{row['max_ms']:10.3f}")
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> dict:
+        """Spans as a Chrome trace event dict (complete events, microseconds since the profiler was created)."""
+        pid = os.getpid()
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                  for tid, name in self._thread_names.items()]
+        for name, start, end, shot, tid, args in self._iter_spans():
+            event_args = {'shot': shot}
+            if args:
+                event_args.update(args)
+            events.append({'name': name, 'cat': 'labjack', 'ph': 'X', 'pid': pid, 'tid': tid,
+                           'ts': (start - self._origin)/1e3, 'dur': (end - start)/1e3, 'args': event_args})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome_trace(self, path: str) -> None:
+        """Write the spans as a Chrome/Perfetto trace JSON file."""
+        import json
+        with open(path, 'w') as file:
+            json.dump(self.chrome_trace(), file)
+
+    # <<<<< reports <<<<<
+
+
+class _NullProfiler:
+    """Profiler used while profiling is disabled: records nothing."""
+
+    enabled = False
+    _span = nullcontext()
+
+    def span(self, name: str, **args) -> nullcontext:
+        return self._span
+
+    def record(self, name: str, start_ns: int, end_ns: int, args: dict | None = None) -> None:
+        pass
+
+    def begin_shot(self) -> int:
+        return -1
+
+
+NULL_PROFILER = _NullProfiler()
@@ -0,0 +1,402 @@
+from _ljm_aux import *
+from _stream_in import StreamIn
+from _profiler import NULL_PROFILER
+from _shot_store import SHOT_STORE_CODECS, available_codecs
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+import numpy as np
+if TYPE_CHECKING:
+    from _profiler import AcquisitionProfiler
+
+
+# >>>>> file layout >>>>>
+# "LJRR" version(uint8), then records: type(char) body length(uint32) body
+#   'S' shot start: JSON metadata of the stream (channels, scan list, rates, scans per read, ...)
+#   'G' gap: first scan (int64), missing scans (int64), written before the first read after the gap
+#   'R' read: read index (uint32), device backlog (int32), LJM backlog (int32), POSIX time of the return (float64),
+#       number of values (uint32), compressed byte-shuffled float64 data (-9999 for skipped samples, as returned)
+#   'X' shot end (empty body)
+
+_MAGIC = b"LJRR"
+_VERSION = 1
+_RECORD = struct.Struct("<cI")
+_READ = struct.Struct("<IiidI")
+_GAP = struct.Struct("<qq")
+
+
+def _shuffle(data: 'np.ndarray') -> bytes:
+    # bytes of the same significance together (sign/exponent bytes of the samples compress well)
+    return np.ascontiguousarray(data, dtype=np.float64).view(np.uint8).reshape(-1, 8).T.tobytes()
+
+
+def _unshuffle(data: bytes, num_values: int) -> 'np.ndarray':
+    planes = np.frombuffer(data, dtype=np.uint8).reshape(8, num_values)
+    return np.ascontiguousarray(planes.T).view(np.float64).reshape(num_values)
+
+# <<<<< file layout <<<<<
+
+
+class RawReadRecorder:
+    """
+    Log of the raw eStreamRead returns of the shots of a StreamIn (see `StreamIn.record_raw()`), written by its
+    stacking worker thread before the reads are stacked, i.e., the data as returned by LJM (skipped samples as
+    -9999, STREAM_OUT# and folded slow register entries included).
+
+    Each shot is self-describing and flushed when it ends, so a log whose recorder did not close is readable up to
+    its last complete shot (see RawReadLog).
+    """
+
+    # Read-only properties
+    @property
+    def path(self): return self._path
+    @property
+    def num_shots(self): return self._num_shots
+    @property
+    def num_reads(self): return self._num_reads
+    @property
+    def num_bytes(self): return self._num_bytes
+    @property
+    def closed(self): return self._file.closed
+
+    def __init__(self,
+                 path: str,
+                 *,
+                 codec: str = 'zlib',
+                 level: int | None = None,
+                 overwrite: bool = False,
+            ) -> None:
+        """
+        Parameters:
+            path (str)          : Log file (e.g., "session.ljrr").
+            codec (str)         : One of SHOT_STORE_CODECS. default: 'zlib'
+            level (int)         : Compression level. None for the codec default (fast).
+            overwrite (bool)    : Whether to replace an existing file. default: False
+        """
+        if codec not in SHOT_STORE_CODECS:
+            raise ValueError(f"Unknown codec: {codec} (available: {available_codecs()})")
+        self._compress, _, default_level = SHOT_STORE_CODECS[codec]()
+        if os.path.exists(path) and not overwrite:
+            raise FileExistsError(f"{path} exists; pass overwrite=True to replace it.")
+        self._path = path
+        self._codec = codec
+        self._level = default_level if level is None else int(level)
+        self._num_shots = 0
+        self._num_reads = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "wb")
+        self._file.write(_MAGIC + bytes([_VERSION]))
+        self._num_bytes = len(_MAGIC) + 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write(self, kind: bytes, body: bytes) -> None:
+        with self._lock:
+            self._file.write(_RECORD.pack(kind, len(body)))
+            self._file.write(body)
+            self._num_bytes += _RECORD.size + len(body)
+
+    def _begin_shot(self, stream_in: 'StreamIn', scan_list: list[int]) -> None:
+        """Called by StreamIn before the stream starts."""
+        slow = stream_in._slow
+        meta = {
+            'scan_channels': list(stream_in.scan_channels),
+            'scan_list': [int(address) for address in scan_list],
+            'num_stream_outs': len(stream_in._stream_outs),
+            'folded_registers': slow.registers if slow is not None and slow.num_folded else {},
+            'folded_addresses': [int(address) for address in stream_in._slow_addresses],
+            'duration_s': stream_in.duration_input_s,
+            'sampling_rate_Hz': stream_in.sampling_rate_Hz,
+            'scan_rate_Hz': stream_in.scan_rate_Hz,
+            'scans_per_read': stream_in._scans_per_read,
+            'num_reads': stream_in._num_reads,
+            'autotuned': stream_in.autotuner is not None,
+            'do_trigger': bool(stream_in.do_trigger),
+            'start_time_s': time.time(),
+            'codec': self._codec,
+        }
+        self._gaps_written = 0
+        self._write(b"S", json.dumps(meta).encode())
+
+    def _on_read(self, stream_in: 'StreamIn', ir: int, timestamp_read_return: datetime, ret: tuple) -> None:
+        """Called by the stacking worker with each read, before it is stacked."""
+        gaps = stream_in._gaps
+        while self._gaps_written < len(gaps) and gaps[self._gaps_written][0] <= ir*stream_in._scans_per_read:
+            self._write(b"G", _GAP.pack(*gaps[self._gaps_written]))
+            self._gaps_written += 1
+        data = np.asarray(ret[0], dtype=np.float64)
+        header = _READ.pack(ir, ret[1], ret[2], timestamp_read_return.timestamp(), len(data))
+        self._write(b"R", header + self._compress(_shuffle(data), self._level))
+        self._num_reads += 1
+
+    def _end_shot(self, stream_in: 'StreamIn') -> None:
+        """Called by StreamIn once all reads of the shot are stacked."""
+        self._write(b"X", b"")
+        self._file.flush()
+        self._num_shots += 1
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+
+class RawReadLog:
+    """
+    Shots of a log written by RawReadRecorder. Only complete shots are listed.
+
+    e.g.,
+        log = RawReadLog("session.ljrr")
+        meta = log.meta(0)                  # channels, rates, scans per read, ... of shot 0
+        for kind, values in log.records(0):  # ('gap', (first scan, missing scans)) or
+            ...                              # ('read', (read index, data, device backlog, LJM backlog, POSIX time))
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        with open(path, "rb") as file:
+            if file.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"{path} is not a raw read log.")
+            self._content = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)  # reads are decoded on demand
+        self._shots = self._read_index()  # (metadata, [(kind, body offset, body length), ...])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._shots)
+
+    def _read_index(self) -> list[tuple[dict, list]]:
+        shots, meta, records = [], None, []
+        content, offset = self._content, len(_MAGIC) + 1
+        while offset + _RECORD.size <= len(content):
+            kind, length = _RECORD.unpack_from(content, offset)
+            body = offset + _RECORD.size
+            if body + length > len(content):
+                break  # partially written record
+            if kind == b"S":
+                meta, records = json.loads(content[body:body + length]), []
+            elif kind == b"X":
+                if meta is not None:
+                    shots.append((meta, records))
+                meta = None
+            elif kind in (b"R", b"G"):
+                records.append((kind, body, length))
+            else:
+                raise ValueError(f"{self._path}: unknown record {kind!r} at byte {offset}.")
+            offset = body + length
+        return shots
+
+    def meta(self, shot: int) -> dict:
+        """Metadata of the stream of `shot`, as recorded at its start."""
+        return self._shots[shot][0]
+
+    def records(self, shot: int):
+        """
+        Gaps and reads of `shot` in acquisition order:
+            ('gap', (first scan, missing scans))
+            ('read', (read index, interleaved data, device backlog, LJM backlog, POSIX time of the return))
+        """
+        meta, records = self._shots[shot]
+        _, decompress, _ = SHOT_STORE_CODECS[meta['codec']]()
+        for kind, body, length in records:
+            if kind == b"G":
+                yield 'gap', _GAP.unpack_from(self._content, body)
+                continue
+            ir, device_backlog, ljm_backlog, timestamp, num_values = _READ.unpack_from(self._content, body)
+            payload = self._content[body + _READ.size:body + length]
+            yield 'read', (ir, _unshuffle(decompress(payload), num_values), device_backlog, ljm_backlog, timestamp)
+
+    def close(self) -> None:
+        self._content.close()
+
+
+# >>>>> replay >>>>>
+
+class _ReplayDevice:
+    """Stands for the LabJackDevice of a ReplayStreamIn: no connection, configuration calls do nothing."""
+
+    _handle = -1
+    device_type = None
+    max_bytes_per_MB = None
+
+    def __init__(self, profiler: 'AcquisitionProfiler | None') -> None:
+        self._command_lock = threading.RLock()
+        self._profiler = NULL_PROFILER if profiler is None else profiler
+
+    def configure_register(self, **kwargs) -> None:
+        pass
+
+    def configure_library(self, **kwargs) -> None:
+        pass
+
+    def _check_stream_free(self, owner) -> None:
+        pass
+
+    def _acquire_stream(self, owner) -> None:
+        pass
+
+    def _release_stream(self, owner) -> None:
+        pass
+
+
+class _ReplayAutotuner:
+    """Stands for the _autotune.ScansPerReadAutotuner of a recorded shot: its block size comes from the log."""
+
+    def __init__(self, scans_per_read: int) -> None:
+        self.scans_per_read = scans_per_read
+
+    def start_shot(self) -> None:
+        pass
+
+    def observe(self, device_scan_backlog: int, ljm_scan_backlog: int) -> None:
+        pass
+
+    def end_shot(self) -> int:
+        return self.scans_per_read
+
+
+class _ReplayReader:
+    """Returns the recorded reads of a shot in place of _stream_read.StreamReader."""
+
+    fast = False  # the decoded arrays are owned by the shot, as those of the ljm.eStreamRead() fallback
+
+    def __init__(self, stream_in: 'ReplayStreamIn', log: RawReadLog, shot: int, realtime: bool) -> None:
+        meta = log.meta(shot)
+        self._stream_in = stream_in
+        self._records = log.records(shot)
+        self._realtime = realtime
+        self._start_time = meta['start_time_s']
+        self._replay_start = None
+        self._timestamp = None
+        self._num_outs = meta['num_stream_outs']
+        self._scan_width = len(meta['scan_channels']) + len(meta['folded_addresses'])
+        self._scans_per_read = meta['scans_per_read']
+
+    def read(self, handle: int) -> tuple['np.ndarray', int, int]:
+        for kind, record in self._records:
+            if kind == 'gap':
+                self._stream_in._gaps.append(record)
+                continue
+            _, data, device_backlog, ljm_backlog, timestamp = record
+            if self._realtime:
+                # as many seconds after the replay start as the read returned after the recorded stream start
+                if self._replay_start is None:
+                    self._replay_start = time.monotonic()
+                delay = self._replay_start + (timestamp - self._start_time) - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            if self._num_outs and len(data) == self._scans_per_read*(self._scan_width + self._num_outs):
+                # the STREAM_OUT# entries are dropped by StreamIn only when it has the stream-outs
+                data = data.reshape(self._scans_per_read, -1)[:, :self._scan_width].ravel()
+            self._timestamp = datetime.fromtimestamp(timestamp)
+            return data, device_backlog, ljm_backlog
+        raise ValueError("No read left in the recorded shot.")
+
+    def timestamp(self) -> datetime:
+        return self._timestamp
+
+
+class ReplayStreamIn(StreamIn):
+    """
+    StreamIn fed with the reads of a raw read log (see `StreamIn.record_raw()`) instead of a device: every shot goes
+    through the same read loop, stacking, deinterleaving, derived channels, shot clock and shot/block handlers as
+    when it was acquired, with the recorded backlogs, read-return times and gaps. Use it to reprocess sessions
+    offline (e.g., with other derived channels) or to benchmark the pipeline deterministically, e.g.,
+        replay = ReplayStreamIn("session.ljrr")
+        replay.add_derived_channels(quad_photodiode_channels("AIN0", "AIN1", "AIN2", "AIN3"))
+        for shot in range(replay.num_shots):
+            replay.replay(shot)
+            # process replay.records ...
+
+    Slow registers folded into the scans ('scan' mode) are averaged again from the log; slow registers read between
+    reads ('poll' mode) and stream-out values are not logged, hence not replayed. Autotuned shots are replayed with
+    their recorded block sizes.
+    """
+
+    # Read-only properties
+    @property
+    def log(self): return self._log
+    @property
+    def num_shots(self): return len(self._log)
+    @property
+    def next_shot(self): return self._next_shot
+    @property
+    def realtime(self): return self._realtime
+
+    def __init__(self,
+                 log: str | RawReadLog,
+                 *,
+                 realtime: bool = False,
+                 profiler: 'AcquisitionProfiler | None' = None,
+            ) -> None:
+        """
+        Parameters:
+            log (str or RawReadLog)     : Raw read log (or its path).
+            realtime (bool)             : Whether to return each read at its recorded time after the start of the
+                                        shot (the original pace) instead of as fast as possible. default: False
+            profiler                    : _profiler.AcquisitionProfiler timing the stages of the replayed shots.
+                                        default: None
+        """
+        self._log = RawReadLog(log) if isinstance(log, str) else log
+        if len(self._log) == 0:
+            raise ValueError("The raw read log has no complete shot.")
+        self._realtime = bool(realtime)
+        self._next_shot = 0
+        meta = self._log.meta(0)
+        super().__init__(_ReplayDevice(profiler), meta['scan_channels'], meta['duration_s'],
+                         sampling_rate_Hz=meta['sampling_rate_Hz'], scans_per_read=meta['scans_per_read'])
+        if meta['folded_registers']:
+            from _slow_registers import SlowRegisters
+            self._slow = SlowRegisters(meta['folded_registers'], mode='scan')
+            self._slow_addresses = meta['folded_addresses']
+        self._replay_scan_list = meta['scan_list']
+        self._scans_per_read_max = max(self._log.meta(shot)['scans_per_read'] for shot in range(len(self._log)))
+
+    def replay(self, shot: int | None = None) -> None:
+        """Replay `shot` (None for the shot after the last replayed one) into `records`."""
+        self._next_shot = self._next_shot if shot is None else int(shot)
+        if not 0 <= self._next_shot < len(self._log):
+            raise IndexError(f"No shot {self._next_shot} in the raw read log ({len(self._log)} shots).")
+        self._stream_in()
+
+    async def _run_stream_in(self) -> None:
+        shot = self._next_shot
+        meta = self._log.meta(shot)
+        if meta['scan_channels'] != list(self._scan_channels) or meta['folded_addresses'] != self._slow_addresses:
+            raise ValueError(f"Shot {shot} of the raw read log was streamed with other channels.")
+        self._set_scans_per_read(meta['scans_per_read'])
+        # autotuned shots keep the length of the shot independent of the block size, as when recorded
+        self._autotuner = _ReplayAutotuner(meta['scans_per_read']) if meta['autotuned'] else None
+        self._do_trigger = meta['do_trigger']  # labels the first read as the trigger wait when profiling
+        self._replay_scan_list = meta['scan_list']
+        self._stream_reader = _ReplayReader(self, self._log, shot, self._realtime)
+        self._next_shot = shot + 1
+        await super()._run_stream_in()
+
+    def add_slow_registers(self, registers: dict[str, float], *, mode: str = 'poll') -> None:
+        raise ValueError("Slow registers cannot be added to a replay; folded registers are replayed from the log.")
+
+    def _scan_list(self) -> list[int]:
+        return list(self._replay_scan_list)
+
+    def _ljm_stream_start(self, handle: int, scans_per_read: int, scan_list: list[int], scan_rate_Hz: float) -> None:
+        pass
+
+    def _ljm_stream_stop(self, handle: int) -> None:
+        pass
+
+# <<<<< replay <<<<<
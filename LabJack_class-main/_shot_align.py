@@ -0,0 +1,287 @@
+import time
+from typing import TypedDict
+
+import numpy as np
+
+
+SHOT_SHIFT_METHODS = ('fft', 'linear')
+SHOT_DETREND_METHODS = ('diff', 'mean')
+
+
+def _next_fast_len(n: int) -> int:
+    """Smallest 2^a*3^b*5^c >= n (sizes numpy.fft transforms quickly)."""
+    best = 1 << max(0, int(n) - 1).bit_length()
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            p = p35
+            while p < n:
+                p *= 2
+            best = min(best, p)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
+def _centered(shots: 'np.ndarray') -> 'np.ndarray':
+    """Shots minus their mean, skipped samples (NaN) set to 0 (i.e., to the mean)."""
+    with np.errstate(invalid='ignore'):
+        centered = shots - np.nanmean(shots, axis=-1, keepdims=True)
+    return np.nan_to_num(centered, nan=0.0)
+
+
+def _tukey(num_samples: int, taper: float) -> 'np.ndarray':
+    """Tukey window: cosine tapers over `taper`/2 of the samples at each end, 1 in between."""
+    window = np.ones(num_samples)
+    width = int(taper*num_samples/2)
+    if width > 0:
+        edge = 0.5 - 0.5*np.cos(np.pi*(np.arange(width) + 0.5)/width)
+        window[:width] = edge
+        window[num_samples - width:] = edge[::-1]
+    return window
+
+
+def estimate_delays(
+        shots: 'np.ndarray',
+        reference: 'np.ndarray | int | None' = None,
+        *,
+        max_lag: int | None = None,
+        detrend: str = 'diff',
+        taper: float = 0.5,
+        batch_size: int = 512,
+    ) -> tuple['np.ndarray', 'np.ndarray']:
+    """
+    Sub-sample delay of each shot against a reference, from the peak of their cross-correlation: one batched
+    numpy.fft.rfft of the detrended shots (zero-padded, so the correlation is linear up to `max_lag`), the product
+    with the conjugate reference spectrum, one batched irfft, then a parabola through the peak and its two
+    neighbours.
+
+    Args:
+        shots (array)       : (shots x samples) array, e.g., one channel of triggered shots. Skipped samples (NaN)
+                            count as the mean of their shot.
+        reference           : (samples,) array, index of the reference shot, or None for the mean of the shots.
+                            default: None
+        max_lag (int)       : Largest |delay| searched, in samples; bounds the padding and the search. None for
+                            samples - 1 (any overlap). default: None
+        detrend (str)       : 'diff' to correlate the first differences of the shots: offsets drop out and steps
+                            (e.g., a pulse edge) become peaks, with no bias from the shot edges, at the cost of
+                            more weight on the noise. 'mean' to remove the mean of each shot and taper it (see
+                            `taper`): less noise-sensitive for oscillations well inside the shots. default: 'diff'
+        taper (float)       : Fraction of the samples tapered by a Tukey window (half at each end) with
+                            detrend='mean'. Without it, the mean-removed baseline correlates as a triangle whose
+                            slope pulls the peak toward lag 0. default: 0.5
+        batch_size (int)    : Shots per FFT batch (bounds the memory). default: 512
+
+    Returns:
+        tuple of
+        - delays (float array, samples): > 0 if the shot lags the reference, i.e., shot[t] ~ reference[t - delay]
+        - peak normalized correlation (float array, -1..1): low values flag shots the delay cannot be trusted for
+    """
+    if detrend not in SHOT_DETREND_METHODS:
+        raise ValueError(f"detrend should be one of {SHOT_DETREND_METHODS}: {detrend}")
+    shots = np.asarray(shots, dtype=float)
+    if shots.ndim != 2:
+        raise ValueError(f"shots should be a (shots x samples) array: {shots.shape}")
+    num_shots, num_samples = shots.shape
+    max_lag = num_samples - 1 if max_lag is None else int(min(max(max_lag, 1), num_samples - 1))
+    if reference is None:
+        with np.errstate(invalid='ignore'):
+            reference = np.nanmean(shots, axis=0)
+    elif np.ndim(reference) == 0:
+        reference = shots[int(reference)]
+    reference = np.asarray(reference, dtype=float)
+    if reference.shape != (num_samples,):
+        raise ValueError(f"reference should have {num_samples} samples: {reference.shape}")
+
+    if detrend == 'diff':
+        prepare = lambda data: np.diff(_centered(data), axis=-1)
+    else:
+        window = _tukey(num_samples, taper)
+        prepare = lambda data: _centered(data)*window
+    nfft = _next_fast_len(num_samples + max_lag)
+    reference = prepare(reference)
+    reference_spectrum = np.conj(np.fft.rfft(reference, nfft))
+    reference_norm = np.sqrt(np.sum(reference**2))
+
+    delays = np.empty(num_shots)
+    correlation = np.empty(num_shots)
+    rows = np.arange(min(batch_size, num_shots))
+    for start in range(0, num_shots, batch_size):
+        batch = prepare(shots[start:start + batch_size])
+        cc = np.fft.irfft(np.fft.rfft(batch, nfft, axis=1)*reference_spectrum, nfft, axis=1)
+        # lags -max_lag..max_lag (negative lags wrap to the end of the circular correlation)
+        lags = np.concatenate((cc[:, nfft - max_lag:], cc[:, :max_lag + 1]), axis=1)
+        peak = np.argmax(lags, axis=1)
+        r = rows[:len(batch)]
+        y0 = lags[r, peak]
+        y_left = lags[r, np.maximum(peak - 1, 0)]
+        y_right = lags[r, np.minimum(peak + 1, 2*max_lag)]
+        curvature = y_left - 2*y0 + y_right
+        inner = (peak > 0) & (peak < 2*max_lag) & (curvature < 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            offset = np.where(inner, 0.5*(y_left - y_right)/curvature, 0.0)
+        delays[start:start + len(batch)] = peak - max_lag + offset
+        with np.errstate(invalid='ignore', divide='ignore'):
+            correlation[start:start + len(batch)] = y0/(np.sqrt(np.sum(batch**2, axis=1))*reference_norm)
+    return delays, np.nan_to_num(correlation)
+
+
+def shift_shots(
+        shots: 'np.ndarray',
+        delays: 'np.ndarray',
+        *,
+        method: str = 'fft',
+        batch_size: int = 512,
+    ) -> 'np.ndarray':
+    """
+    Shots shifted earlier by their (fractional) delays, i.e., aligned[t] = shot[t + delay], on the same sample grid.
+
+    Args:
+        shots (array)       : (shots x samples) or (shots x samples x channels) array; the delay of a shot applies to
+                            all of its channels (the channels of a scan share the trigger).
+        delays (array)      : Delay of each shot in samples (see estimate_delays()).
+        method (str)        : 'fft' for a band-limited shift (phase ramp on the zero-padded spectrum; skipped
+                            samples count as the mean of their shot), or 'linear' for linear interpolation between
+                            neighbouring samples (cheaper, attenuates frequencies near Nyquist). default: 'fft'
+        batch_size (int)    : Shots per FFT batch. default: 512
+
+    Returns:
+        float array shaped as `shots`; samples shifted in from outside the shot are NaN.
+    """
+    if method not in SHOT_SHIFT_METHODS:
+        raise ValueError(f"method should be one of {SHOT_SHIFT_METHODS}: {method}")
+    shots = np.asarray(shots, dtype=float)
+    delays = np.asarray(delays, dtype=float)
+    if shots.ndim not in (2, 3) or delays.shape != (shots.shape[0],):
+        raise ValueError(f"shots should be (shots x samples [x channels]) with one delay per shot: "
+                         f"{shots.shape}, {delays.shape}")
+    num_samples = shots.shape[1]
+    expand = (slice(None),) + (None,)*(shots.ndim - 1)  # delays broadcast over samples (and channels)
+    t = np.arange(num_samples).reshape((1, -1) + (1,)*(shots.ndim - 2))
+
+    if method == 'linear':
+        position = t + delays[expand]
+        i0 = np.floor(position).astype(np.int64)
+        fraction = position - i0
+        i0_clipped = np.clip(i0, 0, num_samples - 1)
+        i1_clipped = np.clip(i0 + 1, 0, num_samples - 1)
+        aligned = np.take_along_axis(shots, np.broadcast_to(i0_clipped, shots.shape), axis=1)*(1 - fraction)
+        aligned += np.take_along_axis(shots, np.broadcast_to(i1_clipped, shots.shape), axis=1)*fraction
+        outside = (position < 0) | (position > num_samples - 1)
+        aligned[np.broadcast_to(outside, shots.shape)] = np.nan
+        return aligned
+
+    max_shift = int(np.ceil(np.max(np.abs(delays)))) if len(delays) else 0
+    nfft = _next_fast_len(num_samples + max_shift + 1)
+    k = np.arange(nfft//2 + 1).reshape((1, -1) + (1,)*(shots.ndim - 2))
+    pad_ramp = (np.arange(1, nfft - num_samples + 1)/(nfft - num_samples + 1)).reshape((1, -1) + (1,)*(shots.ndim - 2))
+    aligned = np.empty_like(shots)
+    for start in range(0, len(shots), batch_size):
+        batch = shots[start:start + batch_size]
+        with np.errstate(invalid='ignore'):
+            mean = np.nanmean(batch, axis=1, keepdims=True)
+        padded = np.empty((len(batch), nfft) + shots.shape[2:])
+        padded[:, :num_samples] = np.nan_to_num(batch - mean, nan=0.0)
+        # pad with a ramp from the last sample back to the first: the periodic continuation has no jump to ring at
+        first, last = padded[:, :1], padded[:, num_samples - 1:num_samples]
+        padded[:, num_samples:] = last + (first - last)*pad_ramp
+        # x[t + d] <-> X[k] exp(2 pi i k d / nfft)
+        phase = np.exp(2j*np.pi*k*delays[start:start + batch_size][expand]/nfft)
+        shifted = np.fft.irfft(np.fft.rfft(padded, axis=1)*phase, nfft, axis=1)[:, :num_samples]
+        aligned[start:start + batch_size] = shifted + mean
+    outside = (t + delays[expand] < 0) | (t + delays[expand] > num_samples - 1)
+    aligned[np.broadcast_to(outside, shots.shape)] = np.nan
+    return aligned
+
+
+def align_shots(
+        shots: 'np.ndarray',
+        reference: 'np.ndarray | int | None' = None,
+        *,
+        channel: int = 0,
+        max_lag: int | None = None,
+        detrend: str = 'diff',
+        taper: float = 0.5,
+        method: str = 'fft',
+        batch_size: int = 512,
+    ) -> tuple['np.ndarray', 'np.ndarray', 'np.ndarray']:
+    """
+    Align triggered shots to a reference before averaging them, e.g., to undo the sample-level trigger jitter of
+    ConditionalReset triggering:
+        shots = np.stack([...])                        # (shots x scans x channels), e.g., StreamIn.to_numpy() copies
+        aligned, delays, correlation = align_shots(shots, channel=0, max_lag=20)
+        average = np.nanmean(aligned[correlation > 0.9], axis=0)
+
+    Args:
+        shots (array)   : (shots x samples) or (shots x samples x channels) array.
+        reference       : Reference samples of the delay channel, index of the reference shot, or None for the mean
+                        of the shots (see estimate_delays()). default: None
+        channel (int)   : Channel the delays are estimated on, for (shots x samples x channels) arrays. default: 0
+        max_lag, detrend, taper, batch_size : See estimate_delays().
+        method (str)    : See shift_shots(). default: 'fft'
+
+    Returns:
+        tuple of aligned shots (see shift_shots()), delays (samples) and peak normalized correlation of each shot
+    """
+    shots = np.asarray(shots, dtype=float)
+    signal = shots[:, :, channel] if shots.ndim == 3 else shots
+    delays, correlation = estimate_delays(signal, reference, max_lag=max_lag, detrend=detrend, taper=taper,
+                                          batch_size=batch_size)
+    return shift_shots(shots, delays, method=method, batch_size=batch_size), delays, correlation
+
+
+class LabJackShotAlignBenchTypedDict(TypedDict):
+    """Result of `benchmark_shot_alignment()`."""
+    method: str
+    num_shots: int
+    num_samples: int
+    estimate_ms: float
+    shift_ms: float
+    shots_per_s: float  # estimate + shift
+    rms_error_samples: float  # of the estimated delays against the applied ones
+
+
+def benchmark_shot_alignment(
+        num_shots: int = 2000,
+        num_samples: int = 1000,
+        *,
+        max_lag: int = 20,
+        jitter_samples: float = 3.0,
+        noise: float = 0.01,
+        repeat: int = 3,
+        seed: int = 0,
+    ) -> list[LabJackShotAlignBenchTypedDict]:
+    """
+    Time align_shots() on synthetic triggered shots (a damped oscillation delayed by a random sub-sample jitter plus
+    white noise) and check the estimated delays against the applied ones.
+
+    Returns:
+        list of LabJackShotAlignBenchTypedDict, one per shift method, best of `repeat`
+    """
+    rng = np.random.default_rng(seed)
+    applied = rng.uniform(-jitter_samples, jitter_samples, num_shots)
+    t = np.arange(num_samples)[None, :] - applied[:, None] - num_samples/4
+    shots = np.where(t > 0, np.exp(-t/(num_samples/5))*np.sin(2*np.pi*t/50), 0.0)
+    shots += noise*rng.standard_normal(shots.shape)
+    # the mean of the shots is the reference by default: compare delays relative to the mean delay
+    applied = applied - applied.mean()
+
+    results = []
+    for method in SHOT_SHIFT_METHODS:
+        best_estimate, best_shift = float('inf'), float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            delays, _ = estimate_delays(shots, max_lag=max_lag)
+            middle = time.perf_counter()
+            shift_shots(shots, delays, method=method)
+            best_estimate = min(best_estimate, middle - start)
+            best_shift = min(best_shift, time.perf_counter() - middle)
+        error = (delays - delays.mean()) - applied
+        results.append(LabJackShotAlignBenchTypedDict(
+            method=method, num_shots=num_shots, num_samples=num_samples,
+            estimate_ms=best_estimate*1e3, shift_ms=best_shift*1e3,
+            shots_per_s=num_shots/(best_estimate + best_shift),
+            rms_error_samples=float(np.sqrt(np.mean(error**2))),
+        ))
+    return results
@@ -0,0 +1,281 @@
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from multiprocessing import shared_memory
+from typing import Any, Callable, Iterator, TYPE_CHECKING
+
+import numpy as np
+if TYPE_CHECKING:
+    from _stream_in import StreamIn
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    Attach to an existing shared memory block without letting this process own it.
+    The block is created and unlinked by the parent (ShotAnalysisPool).
+    cf. Before Python 3.13, attaching also registers the block to the resource tracker, which is shared with the parent
+        (registration is idempotent), so the parent's unlink() still accounts for it.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python >= 3.13
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _run_shot_analysis(
+        shm_name: str,
+        layout: list[tuple[str, str, int, int]],
+        func: Callable,
+        args: tuple,
+        kwargs: dict,
+    ) -> Any:
+    """
+    Worker-side entry point. Rebuild the records of a shot as NumPy views on the shared memory block
+    and call the analysis function with them.
+    `layout` is the (channel, field, start, stop) of each array, in float64 elements of the block.
+    """
+    shm = _attach_shared_memory(shm_name)
+    try:
+        num_values = layout[-1][3] if layout else 0
+        block = np.ndarray((num_values,), dtype=np.float64, buffer=shm.buf)
+        block.flags.writeable = False
+        records = {}
+        for channel, field, start, stop in layout:
+            records.setdefault(channel, {})[field] = block[start:stop]
+        return func(records, *args, **kwargs)
+    finally:
+        records = None; block = None
+        try:
+            shm.close()
+        except BufferError:
+            # the result still holds a view on the block; it is released once the result is pickled.
+            pass
+
+
+class _ShotSlot:
+    """A shared memory block reused across shots."""
+
+    def __init__(self, nbytes: int) -> None:
+        self.shm = shared_memory.SharedMemory(create=True, size=max(int(nbytes), 1))
+
+    @property
+    def nbytes(self) -> int: return self.shm.size
+
+    def release(self) -> None:
+        try:
+            self.shm.close()
+        finally:
+            self.shm.unlink()
+
+
+class ShotAnalysisPool:
+    """
+    Dispatch completed shots to a process pool for GIL-bound analysis (fits, FFTs, valley extraction, ...).
+
+    The records of each shot are copied once into a `multiprocessing.shared_memory` block and the workers
+    receive only the block name, so no sample data is pickled. The analysis function is called in the worker as
+        func(records, *args, **kwargs)
+    where `records` has the layout of `StreamIn.records` (i.e., {channel: {'V': ..., 't': ...}}) and each array is
+    a read-only NumPy view on the shared block. `func` must be picklable (i.e., defined at module level).
+    Only the (small) return value of `func` is sent back.
+
+    Results are collected in shot order.
+
+    Example usage:
+        with ShotAnalysisPool(max_workers=4) as pool:
+            stream_in = lj_device.stream_in(["AIN1", "AIN3"], 0.5, do_trigger=True)
+            pool.attach(stream_in, find_valleys, threshold=0.005)  # dispatch every completed shot
+            for _ in range(100):
+                stream_in._stream_in()
+                for shot_index, result in pool.completed():
+                    ... # results of finished shots, in shot order
+            for shot_index, result in pool.results():  # wait for the remaining shots
+                ...
+    """
+
+    # Read-only properties
+    @property
+    def max_workers(self): return self._max_workers
+    @property
+    def max_pending_shots(self): return self._max_pending
+    @property
+    def num_submitted(self): return self._num_submitted
+    @property
+    def num_pending(self): return len(self._pending)
+
+    def __init__(self, max_workers: int | None = None, *, max_pending_shots: int | None = None) -> None:
+        """
+        Parameters:
+            max_workers (int or None)       : Number of worker processes.
+                                            None for `os.cpu_count()` (cf. ProcessPoolExecutor).
+            max_pending_shots (int or None) : Number of shots that may be in flight at once, i.e., the number of shared
+                                            memory blocks. `submit` blocks when all of them are busy.
+                                            None for 2*max_workers.
+        """
+        self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        self._max_workers = self._executor._max_workers
+        if max_pending_shots is None:
+            max_pending_shots = 2*self._max_workers
+        if max_pending_shots < 1:
+            raise ValueError("max_pending_shots should be bigger than 0.")
+        self._max_pending = int(max_pending_shots)
+
+        self._free_slots: list[_ShotSlot] = []
+        self._num_slots = 0
+        self._slot_available = threading.Condition()
+        self._pending: deque[tuple[int, Future]] = deque()
+        self._num_submitted = 0
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close(wait=exc_type is None)
+
+    def __del__(self) -> None:
+        try:
+            self.close(wait=False)
+        except Exception:
+            pass
+
+    # >>>>> shared memory slots >>>>>
+
+    def _acquire_slot(self, nbytes: int) -> _ShotSlot:
+        with self._slot_available:
+            while not self._free_slots and self._num_slots >= self._max_pending:
+                self._slot_available.wait()
+            if self._free_slots:
+                slot = self._free_slots.pop()
+                if slot.nbytes >= nbytes:
+                    return slot
+                # too small for this shot: replace it
+                slot.release()
+                self._num_slots -= 1
+            self._num_slots += 1
+        try:
+            return _ShotSlot(nbytes)
+        except Exception:
+            with self._slot_available:
+                self._num_slots -= 1
+                self._slot_available.notify()
+            raise
+
+    def _release_slot(self, slot: _ShotSlot) -> None:
+        with self._slot_available:
+            if self._closed:
+                slot.release()
+                self._num_slots -= 1
+            else:
+                self._free_slots.append(slot)
+            self._slot_available.notify()
+
+    # <<<<< shared memory slots <<<<<
+
+    # >>>>> submission >>>>>
+
+    def submit_records(self, records: dict[str, dict[str, np.ndarray]], func: Callable, *args, **kwargs) -> int:
+        """
+        Copy the records of a shot into shared memory and dispatch `func` on them.
+
+        Args:
+            records (dict)  : Records in the layout of `StreamIn.records`. The arrays may differ in length and fields
+                            (e.g., the slow-register records, see StreamIn.add_slow_registers()).
+            func (callable) : Module-level analysis function called as `func(records, *args, **kwargs)`.
+
+        Returns:
+            int: shot index (order of submission) of this shot.
+        """
+        if self._closed:
+            raise RuntimeError("ShotAnalysisPool is closed.")
+        if not records:
+            raise ValueError("No records to analyze.")
+
+        # each array back to back in one block: (channel, field, start, stop) in float64 elements
+        layout = []
+        num_values = 0
+        for channel, record in records.items():
+            for field, value in record.items():
+                if isinstance(value, np.ndarray):
+                    layout.append((channel, field, num_values, num_values + len(value)))
+                    num_values += len(value)
+        nbytes = num_values*np.dtype(np.float64).itemsize
+
+        slot = self._acquire_slot(nbytes)
+        try:
+            block = np.ndarray((num_values,), dtype=np.float64, buffer=slot.shm.buf)
+            for channel, field, start, stop in layout:
+                block[start:stop] = records[channel][field]
+            del block
+            future = self._executor.submit(
+                _run_shot_analysis, slot.shm.name, layout, func, args, kwargs,
+            )
+        except Exception:
+            self._release_slot(slot)
+            raise
+        future.add_done_callback(lambda _, slot=slot: self._release_slot(slot))
+
+        shot_index = self._num_submitted
+        self._num_submitted += 1
+        self._pending.append((shot_index, future))
+        return shot_index
+
+    def submit(self, stream_in: 'StreamIn', func: Callable, *args, **kwargs) -> int:
+        """
+        Dispatch `func` on the current records of `stream_in`. See `submit_records`.
+        """
+        if stream_in.records is None:
+            raise ValueError("StreamIn object has no records yet.")
+        return self.submit_records(stream_in.records, func, *args, **kwargs)
+
+    def attach(self, stream_in: 'StreamIn', func: Callable, *args, **kwargs) -> None:
+        """
+        Dispatch `func` automatically on every shot completed by `stream_in`.
+        """
+        stream_in.add_shot_handler(lambda s: self.submit(s, func, *args, **kwargs))
+
+    # <<<<< submission <<<<<
+
+    # >>>>> results >>>>>
+
+    def completed(self) -> Iterator[tuple[int, Any]]:
+        """
+        Yield (shot index, result) of already finished shots in shot order without blocking.
+        Stops at the first shot that is still running, even if later shots are done.
+        Exceptions raised by the analysis function are re-raised here.
+        """
+        while self._pending and self._pending[0][1].done():
+            shot_index, future = self._pending.popleft()
+            yield shot_index, future.result()
+
+    def results(self, timeout: float | None = None) -> Iterator[tuple[int, Any]]:
+        """
+        Yield (shot index, result) of all submitted shots in shot order, waiting for each.
+
+        Args:
+            timeout (float or None) : Maximum wait in seconds for each shot. None for indefinite wait.
+        """
+        while self._pending:
+            shot_index, future = self._pending[0]
+            result = future.result(timeout=timeout)
+            self._pending.popleft()
+            yield shot_index, result
+
+    # <<<<< results <<<<<
+
+    def close(self, wait: bool = True) -> None:
+        """
+        Shut down the worker processes and free the shared memory blocks.
+
+        Args:
+            wait (bool) : Whether to wait for the pending shots to finish.
+        """
+        if getattr(self, "_closed", True):
+            return
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+        with self._slot_available:
+            self._closed = True
+            for slot in self._free_slots:
+                slot.release()
+                self._num_slots -= 1
+            self._free_slots.clear()
@@ -0,0 +1,411 @@
+import json
+import os
+import struct
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+import numpy as np
+if TYPE_CHECKING:
+    from _stream_in import StreamIn
+
+
+# >>>>> codecs >>>>>
+# name -> (compress(data, level), decompress(data), default level). zstd and lz4 are optional packages.
+
+def _zlib_codec():
+    import zlib
+    return (lambda data, level: zlib.compress(data, level)), zlib.decompress, 1
+
+
+def _lzma_codec():
+    import lzma
+    return (lambda data, level: lzma.compress(data, preset=level)), lzma.decompress, 0
+
+
+def _bz2_codec():
+    import bz2
+    return (lambda data, level: bz2.compress(data, level)), bz2.decompress, 9
+
+
+def _zstd_codec():
+    import zstandard
+    return (lambda data, level: zstandard.ZstdCompressor(level=level).compress(data),
+            lambda data: zstandard.ZstdDecompressor().decompress(data), 3)
+
+
+def _lz4_codec():
+    import lz4.frame
+    return (lambda data, level: lz4.frame.compress(data, compression_level=level)), lz4.frame.decompress, 0
+
+
+def _none_codec():
+    return (lambda data, level: bytes(data)), bytes, 0
+
+
+SHOT_STORE_CODECS = {
+    'zlib': _zlib_codec,
+    'lzma': _lzma_codec,
+    'bz2': _bz2_codec,
+    'zstd': _zstd_codec,  # requires zstandard
+    'lz4': _lz4_codec,    # requires lz4
+    'none': _none_codec,
+}
+
+
+def available_codecs() -> list[str]:
+    """Codecs of SHOT_STORE_CODECS whose package is installed."""
+    available = []
+    for name, codec in SHOT_STORE_CODECS.items():
+        try:
+            codec()
+        except ImportError:
+            continue
+        available.append(name)
+    return available
+
+# <<<<< codecs <<<<<
+
+
+# >>>>> filters >>>>>
+# int16 counts of a block (scans x channels) -> channel-major deltas -> byte shuffle (low bytes, then high bytes)
+
+_NAN_COUNT = -32768  # count of skipped samples (NaN)
+
+
+def _quantize(data: 'np.ndarray', scale: 'np.ndarray', offset: 'np.ndarray') -> 'np.ndarray':
+    # clip before marking NaN: a sample that rounds to -32768 must not read back as skipped
+    counts = np.clip(np.rint((data - offset)/scale), -32767, 32767)
+    counts[np.isnan(counts)] = _NAN_COUNT
+    return counts.astype(np.int16)
+
+
+def _dequantize(counts: 'np.ndarray', scale: 'np.ndarray', offset: 'np.ndarray') -> 'np.ndarray':
+    data = counts*scale + offset
+    data[counts == _NAN_COUNT] = np.nan
+    return data
+
+
+def _encode_block(counts: 'np.ndarray') -> bytes:
+    channel_major = np.ascontiguousarray(counts.T)
+    deltas = np.diff(channel_major, axis=1, prepend=np.int16(0))  # int16 wraparound is undone by cumsum
+    return deltas.view(np.uint8).reshape(-1, 2).T.tobytes()
+
+
+def _decode_block(data: bytes, num_scans: int, num_channels: int) -> 'np.ndarray':
+    shuffled = np.frombuffer(data, dtype=np.uint8).reshape(2, -1)
+    deltas = np.ascontiguousarray(shuffled.T).view(np.int16).reshape(num_channels, num_scans)
+    return np.cumsum(deltas, axis=1, dtype=np.int16).T
+
+# <<<<< filters <<<<<
+
+
+_MAGIC = b"LJQS"
+_VERSION = 1
+_SHOT_MAGIC = b"SHOT"
+_FOOTER = struct.Struct("<Q4s")  # offset of the JSON index, magic
+
+
+class ShotStoreWriter:
+    """
+    Append StreamIn shots to a compressed shot store: samples are kept as int16 counts with a per-channel
+    scale/offset, delta-encoded along time, byte-shuffled and compressed in blocks of `block_scans` scans.
+
+    File layout:
+        "LJQS" version(uint8)
+        per shot: "SHOT" len(uint32) JSON metadata (channels, scale, offset, block sizes, ...) compressed blocks
+        JSON index of shot offsets, offset of the index (uint64), "LJQS"   <- written on close()
+    Shots are self-describing, so a store whose writer did not close is still readable (the index is rebuilt by
+    scanning the shot headers).
+
+    Quantization: unless `scale_V` is given, each shot's per-channel scale spans its min..max in 65534 counts, i.e.,
+    about the 16-bit ADC resolution for a full-range signal (and finer for smaller signals). Skipped samples (NaN)
+    are kept as NaN.
+    """
+
+    # Read-only properties
+    @property
+    def path(self): return self._path
+    @property
+    def num_shots(self): return len(self._offsets)
+
+    def __init__(self,
+                 path: str,
+                 *,
+                 codec: str = 'zlib',
+                 level: int | None = None,
+                 block_scans: int = 65536,
+                 scale_V: float | list[float] | None = None,
+                 offset_V: float | list[float] | None = None,
+                 overwrite: bool = False,
+            ) -> None:
+        """
+        Parameters:
+            path (str)                  : Output file (e.g., "shots.ljqs").
+            codec (str)                 : One of SHOT_STORE_CODECS. default: 'zlib'
+            level (int)                 : Compression level. None for the codec default (fast).
+            block_scans (int)           : Scans per compressed block (the unit of random access and of parallel
+                                        decoding). default: 65536
+            scale_V (float or list)     : Volts per count (per channel). None to fit each shot's range.
+            offset_V (float or list)    : Volts at count 0 (per channel). None to fit each shot's range
+                                        (0 if `scale_V` is given).
+            overwrite (bool)            : Whether to replace an existing file. default: False
+        """
+        if codec not in SHOT_STORE_CODECS:
+            raise ValueError(f"Unknown codec: {codec} (available: {available_codecs()})")
+        self._compress, _, default_level = SHOT_STORE_CODECS[codec]()
+        if os.path.exists(path) and not overwrite:
+            raise FileExistsError(f"{path} exists; pass overwrite=True to replace it.")
+        self._path = path
+        self._codec = codec
+        self._level = default_level if level is None else int(level)
+        self._block_scans = int(block_scans)
+        self._scale = scale_V
+        self._offset = offset_V
+        self._offsets = []
+        self._file = open(path, "wb")
+        self._file.write(_MAGIC + bytes([_VERSION]))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_shot(self, stream_in: 'StreamIn') -> int:
+        """Append the last shot of `stream_in`. Returns its index in the store."""
+        clock = stream_in.clock
+        return self.write_array(stream_in.to_numpy(), list(stream_in.scan_channels), stream_in.scan_rate_Hz,
+                                start_time_s=clock['start_time_s'] if clock is not None else None)
+
+    def write_array(self,
+                    data: 'np.ndarray',
+                    channels: list[str],
+                    scan_rate_Hz: float,
+                    *,
+                    start_time_s: float | None = None,
+                ) -> int:
+        """Append a (scans x channels) array of volts. Returns its index in the store."""
+        data = np.asarray(data, dtype=float)
+        num_scans, num_channels = data.shape
+        if len(channels) != num_channels:
+            raise ValueError("channels should name each column of data.")
+        scale, offset = self._fit_scale(data)
+
+        blocks = []
+        for start in range(0, num_scans, self._block_scans):
+            counts = _quantize(data[start:start + self._block_scans], scale, offset)
+            blocks.append(self._compress(_encode_block(counts), self._level))
+
+        meta = {
+            'channels': channels, 'num_scans': num_scans, 'scan_rate_Hz': float(scan_rate_Hz),
+            'start_time_s': start_time_s, 'scale_V': scale.tolist(), 'offset_V': offset.tolist(),
+            'codec': self._codec, 'block_scans': self._block_scans, 'block_sizes': [len(b) for b in blocks],
+        }
+        meta_bytes = json.dumps(meta).encode()
+        self._offsets.append(self._file.tell())
+        self._file.write(_SHOT_MAGIC + struct.pack("<I", len(meta_bytes)) + meta_bytes)
+        for block in blocks:
+            self._file.write(block)
+        self._file.flush()
+        return len(self._offsets) - 1
+
+    def attach(self, stream_in: 'StreamIn') -> None:
+        """Append every completed shot of `stream_in`."""
+        stream_in.add_shot_handler(self.write_shot)
+
+    def _fit_scale(self, data: 'np.ndarray') -> tuple['np.ndarray', 'np.ndarray']:
+        num_channels = data.shape[1]
+        if self._scale is not None:
+            scale = np.broadcast_to(np.asarray(self._scale, dtype=float), (num_channels,)).copy()
+            offset = 0.0 if self._offset is None else self._offset  # may be an array: no `or`
+            offset = np.broadcast_to(np.asarray(offset, dtype=float), (num_channels,)).copy()
+            return scale, offset
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # "All-NaN slice encountered" (fully skipped channels)
+            low, high = np.nanmin(data, axis=0), np.nanmax(data, axis=0)
+        low, high = np.nan_to_num(low), np.nan_to_num(high)  # all-NaN channels
+        offset = (high + low)/2 if self._offset is None else \
+            np.broadcast_to(np.asarray(self._offset, dtype=float), (num_channels,)).copy()
+        half_span = np.maximum(high - offset, offset - low)
+        scale = np.where(half_span > 0, half_span/32767, 1.0)
+        return scale, offset
+
+    def close(self) -> None:
+        if self._file is None or self._file.closed:
+            return
+        index_offset = self._file.tell()
+        self._file.write(json.dumps({'offsets': self._offsets}).encode())
+        self._file.write(_FOOTER.pack(index_offset, _MAGIC))
+        self._file.close()
+
+
+class ShotStoreReader:
+    """
+    Random access to the shots of a store written by ShotStoreWriter; the blocks of a shot are decoded by a thread
+    pool (the codecs release the GIL).
+
+    e.g.,
+        with ShotStoreReader("shots.ljqs") as store:
+            data = store[3]               # (scans x channels) volts of shot 3
+            channels = store.meta(3)['channels']
+    """
+
+    def __init__(self, path: str, *, max_workers: int | None = None) -> None:
+        """
+        Parameters:
+            path (str)          : Store file.
+            max_workers (int)   : Decoding threads. None for the ThreadPoolExecutor default.
+        """
+        self._path = path
+        self._file = open(path, "rb")
+        if self._file.read(len(_MAGIC) + 1)[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"{path} is not a shot store.")
+        self._offsets = self._read_index()
+        self._metas = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, index: int) -> 'np.ndarray':
+        return self.read(index)
+
+    def _read_index(self) -> list[int]:
+        size = os.fstat(self._file.fileno()).st_size
+        if size >= len(_MAGIC) + 1 + _FOOTER.size:
+            self._file.seek(size - _FOOTER.size)
+            index_offset, magic = _FOOTER.unpack(self._file.read(_FOOTER.size))
+            if magic == _MAGIC and index_offset < size:
+                self._file.seek(index_offset)
+                return json.loads(self._file.read(size - _FOOTER.size - index_offset))['offsets']
+        # not closed: scan the shot headers
+        offsets, offset = [], len(_MAGIC) + 1
+        while offset + 8 <= size:
+            self._file.seek(offset)
+            header = self._file.read(8)
+            if header[:4] != _SHOT_MAGIC:
+                break
+            meta_len = struct.unpack("<I", header[4:])[0]
+            meta = json.loads(self._file.read(meta_len))
+            end = offset + 8 + meta_len + sum(meta['block_sizes'])
+            if end > size:
+                break  # partially written shot
+            offsets.append(offset)
+            offset = end
+        return offsets
+
+    def meta(self, index: int) -> dict:
+        """Metadata of shot `index` (channels, num_scans, scan_rate_Hz, start_time_s, scale_V, offset_V, ...)."""
+        if index not in self._metas:
+            self._file.seek(self._offsets[index])
+            header = self._file.read(8)
+            meta = json.loads(self._file.read(struct.unpack("<I", header[4:])[0]))
+            self._metas[index] = meta
+        return self._metas[index]
+
+    def read(self, index: int) -> 'np.ndarray':
+        """(scans x channels) volts of shot `index`."""
+        meta = self.meta(index)
+        self._file.seek(self._offsets[index])
+        header = self._file.read(8)
+        meta_len = struct.unpack("<I", header[4:])[0]
+        self._file.seek(meta_len, os.SEEK_CUR)
+        raw_blocks = [self._file.read(size) for size in meta['block_sizes']]
+
+        _, decompress, _ = SHOT_STORE_CODECS[meta['codec']]()
+        num_scans, num_channels, block_scans = meta['num_scans'], len(meta['channels']), meta['block_scans']
+        scale, offset = np.asarray(meta['scale_V']), np.asarray(meta['offset_V'])
+        out = np.empty((num_scans, num_channels))
+
+        def decode(i_block: int) -> None:
+            start = i_block*block_scans
+            stop = min(num_scans, start + block_scans)
+            counts = _decode_block(decompress(raw_blocks[i_block]), stop - start, num_channels)
+            out[start:stop] = _dequantize(counts, scale, offset)
+
+        list(self._executor.map(decode, range(len(raw_blocks))))
+        return out
+
+    def close(self) -> None:
+        self._executor.shutdown()
+        self._file.close()
+
+
+# >>>>> benchmark >>>>>
+
+def benchmark_shot_store(
+        directory: str,
+        *,
+        num_scans: int = 200_000,
+        num_channels: int = 4,
+        codecs: list[str] | None = None,
+        repeat: int = 3,
+    ) -> list[dict]:
+    """
+    Write/read throughput (MB/s of float64 samples) and compression ratio (float64 bytes/file bytes) of the shot
+    store against CSV and .npy, on a synthetic 16-bit quad photodiode shot (a sine sweep plus noise, quantized like
+    the ADC).
+
+    Returns:
+        list of dict: 'format', 'write_MBps', 'read_MBps', 'ratio', 'max_error_V'
+    """
+    rng = np.random.default_rng(0)
+    t = np.arange(num_scans)/100e3
+    data = np.stack([2.0*np.sin(2*np.pi*(50 + 10*ich)*t) + 0.01*rng.standard_normal(num_scans)
+                     for ich in range(num_channels)], axis=1)
+    lsb = 20/65536
+    data = np.rint(data/lsb)*lsb  # quantized like a +-10 V 16-bit ADC
+    channels = [f"AIN{ich}" for ich in range(num_channels)]
+    megabytes = data.nbytes/1e6
+
+    def timed(func) -> float:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    results = []
+
+    def add(name: str, path: str, write, read) -> None:
+        write_s = timed(write)
+        read_s = timed(read)
+        results.append({
+            'format': name,
+            'write_MBps': megabytes/write_s,
+            'read_MBps': megabytes/read_s,
+            'ratio': data.nbytes/os.path.getsize(path),
+            'max_error_V': float(np.nanmax(np.abs(read() - data))),
+        })
+        os.remove(path)
+
+    path = os.path.join(directory, "bench.csv")
+    add("csv", path,
+        lambda: np.savetxt(path, data, delimiter=",", header=",".join(channels), comments="", fmt="%.9g"),
+        lambda: np.loadtxt(path, delimiter=",", skiprows=1))
+    path = os.path.join(directory, "bench.npy")
+    add("npy", path, lambda: np.save(path, data), lambda: np.load(path))
+
+    for codec in codecs or available_codecs():
+        path = os.path.join(directory, f"bench.{codec}.ljqs")
+
+        def write() -> None:
+            with ShotStoreWriter(path, codec=codec, overwrite=True) as writer:
+                writer.write_array(data, channels, 100e3)
+
+        def read() -> 'np.ndarray':
+            with ShotStoreReader(path) as reader:
+                return reader[0]
+        add(f"ljqs/{codec}", path, write, read)
+    return results
+
+# <<<<< benchmark <<<<<
@@ -0,0 +1,304 @@
+import threading
+import time
+import warnings
+from collections import deque
+from datetime import datetime
+from typing import Callable, TypedDict, TYPE_CHECKING
+
+import numpy as np
+if TYPE_CHECKING:
+    from _stream_in import StreamIn
+
+
+SINK_POLICIES = ('block', 'drop', 'coalesce')
+SINK_KINDS = ('shot', 'block')
+
+
+class LabJackShotItemTypedDict(TypedDict):
+    """Completed shot passed to 'shot' sinks."""
+    shot: int  # index of the shot since the router was attached
+    records: dict  # StreamIn.records of the shot (arrays shared with the StreamIn, do not write to them)
+    clock: dict | None  # StreamIn.clock of the shot
+    gaps: list  # StreamIn.gaps of the shot
+    skipped_samples: int
+    scan_rate_Hz: float
+
+
+class LabJackBlockItemTypedDict(TypedDict):
+    """eStreamRead block passed to 'block' sinks."""
+    shot: int
+    read: int
+    data: 'np.ndarray'  # interleaved block, skipped samples as np.nan (owned by the shot, do not write to it)
+    device_scan_backlog: int
+    ljm_scan_backlog: int
+    timestamp: datetime  # host time of the return of the eStreamRead
+
+
+class LabJackSinkStatsTypedDict(TypedDict):
+    """Counters of one sink (see `SinkRouter.stats()`)."""
+    name: str
+    kind: str
+    policy: str
+    num_offered: int
+    num_delivered: int
+    num_dropped: int  # rejected ('drop') or replaced by a newer item ('coalesce')
+    num_errors: int
+    queue_depth: int
+    max_queue_depth: int
+    latency_median_ms: float  # from routing to the end of the sink call, over the last calls
+    latency_max_ms: float
+    call_median_ms: float  # duration of the sink call
+    blocked_ms: float  # total time the acquisition waited for a full 'block' queue
+
+
+class _Sink:
+    """A sink with its bounded queue and worker thread."""
+
+    def __init__(self, name: str, func: Callable, kind: str, policy: str, max_queue: int,
+                 history: int) -> None:
+        self.name = name
+        self.func = func
+        self.kind = kind
+        self.policy = policy
+        self.max_queue = max_queue
+        self.queue = deque()  # (routing time, item)
+        self.condition = threading.Condition()
+        self.busy = False
+        self.closing = False
+        self.num_offered = 0
+        self.num_delivered = 0
+        self.num_dropped = 0
+        self.num_errors = 0
+        self.max_queue_depth = 0
+        self.blocked_s = 0.0
+        self.latencies = deque(maxlen=history)  # seconds
+        self.call_times = deque(maxlen=history)
+        self.thread = threading.Thread(target=self._run, name=f"sink-{name}", daemon=True)
+        self.thread.start()
+
+    def offer(self, item) -> None:
+        """Enqueue `item` by the policy; only 'block' can wait."""
+        with self.condition:
+            if self.closing:
+                return
+            self.num_offered += 1
+            if len(self.queue) >= self.max_queue:
+                if self.policy == 'drop':
+                    self.num_dropped += 1
+                    return
+                if self.policy == 'coalesce':
+                    # keep the newest items: the oldest pending one is superseded
+                    self.queue.popleft()
+                    self.num_dropped += 1
+                else:
+                    start = time.perf_counter()
+                    while len(self.queue) >= self.max_queue and not self.closing:
+                        self.condition.wait()
+                    self.blocked_s += time.perf_counter() - start
+                    if self.closing:
+                        self.num_dropped += 1
+                        return
+            self.queue.append((time.perf_counter(), item))
+            self.max_queue_depth = max(self.max_queue_depth, len(self.queue))
+            self.condition.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                while not self.queue and not self.closing:
+                    self.condition.wait()
+                if not self.queue:
+                    return  # closing and drained
+                routed, item = self.queue.popleft()
+                self.busy = True
+                self.condition.notify_all()  # room for a blocked offer()
+            start = time.perf_counter()
+            try:
+                self.func(item)
+            except Exception as ex:
+                self.num_errors += 1
+                if self.num_errors == 1:
+                    warnings.warn(f"Sink '{self.name}' raised {ex!r}; later errors are only counted.", UserWarning)
+            end = time.perf_counter()
+            with self.condition:
+                self.busy = False
+                self.num_delivered += 1
+                self.latencies.append(end - routed)
+                self.call_times.append(end - start)
+                self.condition.notify_all()
+
+    def wait_idle(self, deadline: float | None) -> bool:
+        with self.condition:
+            while self.queue or self.busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def close(self, wait: bool) -> None:
+        with self.condition:
+            if not wait:
+                self.num_dropped += len(self.queue)
+                self.queue.clear()
+            self.closing = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    def stats(self) -> LabJackSinkStatsTypedDict:
+        with self.condition:
+            latencies = np.array(self.latencies)*1e3
+            call_times = np.array(self.call_times)*1e3
+            return LabJackSinkStatsTypedDict(
+                name=self.name, kind=self.kind, policy=self.policy,
+                num_offered=self.num_offered, num_delivered=self.num_delivered, num_dropped=self.num_dropped,
+                num_errors=self.num_errors, queue_depth=len(self.queue), max_queue_depth=self.max_queue_depth,
+                latency_median_ms=float(np.median(latencies)) if len(latencies) else float('nan'),
+                latency_max_ms=float(np.max(latencies)) if len(latencies) else float('nan'),
+                call_median_ms=float(np.median(call_times)) if len(call_times) else float('nan'),
+                blocked_ms=self.blocked_s*1e3,
+            )
+
+
+class SinkRouter:
+    """
+    Fan-out of the completed shots (and optionally of the eStreamRead blocks) of a StreamIn to several sinks
+    (console, CSV, InfluxDB, plotting, ...), each with its own worker thread and bounded queue, so that a slow sink
+    does not hold up the acquisition or the other sinks. Created by `StreamIn.add_sink()`, e.g.,
+        stream_in.add_sink("influx", upload_shot, policy='drop', max_queue=16)
+        stream_in.add_sink("plot", update_plot, policy='coalesce', max_queue=1)  # only the latest shot is plotted
+        stream_in.add_sink("csv", append_csv, policy='block')                     # never lose a shot
+        ...
+        print(stream_in.sink_router.format_stats())
+
+    Sinks are called as `func(item)` in their worker thread, with a LabJackShotItemTypedDict ('shot' sinks) or a
+    LabJackBlockItemTypedDict ('block' sinks). Routing costs one enqueue per sink in the acquisition thread (shots) or
+    the stacking thread (blocks); the data is not copied, since each shot allocates new arrays.
+
+    What happens when a sink's queue is full (`policy`):
+    - 'block': wait until the sink takes an item (no loss; a stalled sink stalls the acquisition, see `blocked_ms`)
+    - 'drop': drop the new item
+    - 'coalesce': drop the oldest pending item, i.e., the sink gets the newest items
+    """
+
+    # Read-only properties
+    @property
+    def sinks(self): return list(self._sinks)
+    @property
+    def num_shots(self): return self._num_shots
+
+    def __init__(self, *, history: int = 1024) -> None:
+        """
+        Parameters:
+            history (int)   : Calls per sink kept for the latency statistics. default: 1024
+        """
+        self._sinks = {}
+        self._history = int(history)
+        self._num_shots = 0
+        self._lock = threading.Lock()  # guards the sink lists against add/remove during routing
+        self._shot_sinks = ()
+        self._block_sinks = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close(wait=exc_type is None)
+
+    def add_sink(self,
+                 name: str,
+                 func: Callable,
+                 *,
+                 kind: str = 'shot',
+                 policy: str = 'drop',
+                 max_queue: int = 8,
+            ) -> None:
+        """
+        Parameters:
+            name (str)          : Unique name of the sink (its worker thread is "sink-<name>").
+            func (callable)     : Called as func(item) in the worker thread of the sink.
+            kind (str)          : 'shot' for completed shots or 'block' for eStreamRead blocks. default: 'shot'
+            policy (str)        : 'block', 'drop' or 'coalesce' (see above). default: 'drop'
+            max_queue (int)     : Items waiting for the sink at most. default: 8
+        """
+        if not callable(func):
+            raise ValueError(f"Sink should be callable: {func}")
+        if kind not in SINK_KINDS:
+            raise ValueError(f"kind should be one of {SINK_KINDS}: {kind}")
+        if policy not in SINK_POLICIES:
+            raise ValueError(f"policy should be one of {SINK_POLICIES}: {policy}")
+        if max_queue < 1:
+            raise ValueError("max_queue should be bigger than 0.")
+        with self._lock:
+            if name in self._sinks:
+                raise ValueError(f"A sink named '{name}' exists.")
+            self._sinks[name] = _Sink(name, func, kind, policy, int(max_queue), self._history)
+            self._update_sink_lists()
+
+    def remove_sink(self, name: str, *, wait: bool = True) -> None:
+        """Stop routing to sink `name`; with `wait`, its pending items are delivered first."""
+        with self._lock:
+            sink = self._sinks.pop(name)
+            self._update_sink_lists()
+        sink.close(wait)
+
+    def _update_sink_lists(self) -> None:
+        # tuples swapped at once: routing iterates over them without the lock
+        self._shot_sinks = tuple(sink for sink in self._sinks.values() if sink.kind == 'shot')
+        self._block_sinks = tuple(sink for sink in self._sinks.values() if sink.kind == 'block')
+
+    # >>>>> routing >>>>>
+
+    def attach(self, stream_in: 'StreamIn') -> None:
+        """Route every completed shot and eStreamRead block of `stream_in`."""
+        stream_in.add_block_handler(self._on_block)
+        stream_in.add_shot_handler(self._on_shot)
+
+    def _on_block(self, stream_in: 'StreamIn', ir: int, a_data: 'np.ndarray', device_scan_backlog: int,
+                  ljm_scan_backlog: int, timestamp_read_return: datetime) -> None:
+        sinks = self._block_sinks
+        if not sinks:
+            return
+        item = LabJackBlockItemTypedDict(shot=self._num_shots, read=ir, data=a_data,
+                                         device_scan_backlog=device_scan_backlog, ljm_scan_backlog=ljm_scan_backlog,
+                                         timestamp=timestamp_read_return)
+        for sink in sinks:
+            sink.offer(item)
+
+    def _on_shot(self, stream_in: 'StreamIn') -> None:
+        sinks = self._shot_sinks
+        if sinks:
+            item = LabJackShotItemTypedDict(shot=self._num_shots, records=stream_in.records, clock=stream_in.clock,
+                                            gaps=stream_in.gaps, skipped_samples=stream_in.skipped_samples,
+                                            scan_rate_Hz=stream_in.scan_rate_Hz)
+            for sink in sinks:
+                sink.offer(item)
+        self._num_shots += 1
+
+    # <<<<< routing <<<<<
+
+    def flush(self, timeout_s: float | None = None) -> bool:
+        """Wait until every sink has taken and processed its pending items. Returns False on timeout."""
+        deadline = None if timeout_s is None else time.monotonic() + timeout_s
+        return all(sink.wait_idle(deadline) for sink in list(self._sinks.values()))
+
+    def stats(self) -> list[LabJackSinkStatsTypedDict]:
+        return [sink.stats() for sink in list(self._sinks.values())]
+
+    def format_stats(self) -> str:
+        lines = [f"\t{'sink':<14s}{'policy':<10s}{'offered':>9s}{'done':>7s}{'dropped':>9s}{'errors':>8s}"
+                 f"{'queue':>7s}{'lat med ms':>12s}{'lat max ms':>12s}{'blocked ms':>12s}"]
+        for row in self.stats():
+            lines.append(f"\t{row['name']:<14s}{row['policy']:<10s}{row['num_offered']:9d}{row['num_delivered']:7d}"
+                         f"{row['num_dropped']:9d}{row['num_errors']:8d}{row['queue_depth']:7d}"
+                         f"{row['latency_median_ms']:12.3f}{row['latency_max_ms']:12.3f}{row['blocked_ms']:12.3f}")
+        return "\n".join(lines)
+
+    def close(self, wait: bool = True) -> None:
+        """Stop all sinks; with `wait`, their pending items are delivered first."""
+        with self._lock:
+            sinks = list(self._sinks.values())
+            self._sinks = {}
+            self._update_sink_lists()
+        for sink in sinks:
+            sink.close(wait)
@@ -0,0 +1,153 @@
+from _ljm_aux import *
+
+import time
+import warnings
+
+import numpy as np
+
+
+SLOW_REGISTER_MODES = ('poll', 'scan')
+
+
+class SlowRegisters:
+    """
+    Slowly changing registers (temperatures, DC levels, digital states, ...) acquired along with a StreamIn, in the
+    same device session, and aligned to the scans of the stream:
+
+    - mode='poll': read (command-response) between eStreamRead calls on the stream's handle, in the read loop, so the
+      reads never overlap the stream reads. The registers due after a read are read together in as few packets as
+      `max_bytes_per_MB` allows (see _poller.pack_registers()). Each value is placed at the scan the device was
+      acquiring at the middle of the round trip (scans read + missing scans + scan backlogs). Intervals shorter than
+      an eStreamRead period give one value per read.
+    - mode='scan': appended to the scan list after the streamed channels, i.e., sampled in every scan, then averaged
+      (NaN-ignoring boxcar) over `interval_s` worth of scans in the stacking thread. Registers should be streamable
+      (e.g., AIN#, FIO_STATE, see https://support.labjack.com/docs/3-2-stream-mode-t-series-datasheet), and each
+      adds one sample per scan to the device sampling rate.
+
+    Created by `StreamIn.add_slow_registers()`; the records of each shot are added to `StreamIn.records` as
+        records[register] = {'V': values, 't': time (same convention as the streamed records), 'scan': scan index}
+    where 'scan' counts from scan 0 of the shot, including the scans missing at gaps (see `StreamIn.timestamps()`).
+    """
+
+    # Read-only properties
+    @property
+    def registers(self): return dict(self._registers)
+    @property
+    def mode(self): return self._mode
+    @property
+    def num_folded(self): return len(self._registers) if self._mode == 'scan' else 0
+    @property
+    def num_errors(self): return self._num_errors
+
+    def __init__(self, registers: dict[str, float], *, mode: str = 'poll') -> None:
+        """
+        Parameters:
+            registers (dict)    : Register name -> interval in seconds (the output period in 'scan' mode).
+            mode (str)          : 'poll' or 'scan' (see above). default: 'poll'
+        """
+        if mode not in SLOW_REGISTER_MODES:
+            raise ValueError(f"mode should be one of {SLOW_REGISTER_MODES}: {mode}")
+        if not registers:
+            raise ValueError("No slow register.")
+        for name, interval in registers.items():
+            if interval <= 0:
+                raise ValueError(f"Interval of {name} should be bigger than 0.")
+        self._registers = {name: float(interval) for name, interval in registers.items()}
+        self._mode = mode
+        self._packets = {}  # frozenset of due registers -> packets ('poll')
+        self._max_bytes_per_MB = None
+        self._num_errors = 0
+        self._start_shot()
+
+    def _bind(self, max_bytes_per_MB: int) -> list[int]:
+        """Resolve the registers for a device; returns the addresses to fold into the scan list ('scan')."""
+        from _poller import pack_registers
+        self._max_bytes_per_MB = max_bytes_per_MB
+        self._packets = {frozenset(self._registers): pack_registers(list(self._registers), max_bytes_per_MB)}
+        if self._mode == 'scan':
+            return [address for packet in self._packets[frozenset(self._registers)] for address in packet.addresses]
+        return []
+
+    def _start_shot(self) -> None:
+        self._next_due = {name: 0.0 for name in self._registers}  # host monotonic time ('poll')
+        self._values = {name: ([], []) for name in self._registers}  # register -> (scan indices, values)
+        self._carry = None  # samples of the incomplete averaging window of each register ('scan')
+        self._num_missing = 0
+
+    # >>>>> poll mode: read loop >>>>>
+
+    def _poll(self, handle: int, acquired_scans: int, scan_rate_Hz: float) -> None:
+        """
+        Read the due registers; `acquired_scans` is the scan the device was acquiring when eStreamRead returned.
+        A failed read is skipped with a warning (connection errors surface at the next eStreamRead).
+        """
+        t_return = time.monotonic()
+        due = frozenset(name for name, t in self._next_due.items() if t <= t_return)
+        if not due:
+            return
+        packets = self._packets.get(due)
+        if packets is None:
+            from _poller import pack_registers
+            packets = self._packets[due] = pack_registers([name for name in self._registers if name in due],
+                                                          self._max_bytes_per_MB)
+        values = {}
+        try:
+            for packet in packets:
+                values.update(zip(packet.names, packet.read(handle)))
+        except ljm.LJMError as ljmex:
+            self._num_errors += 1
+            warnings.warn(f"Slow register read failed ({ljmex}); skipped.", UserWarning)
+            return
+        t_end = time.monotonic()
+        scan = acquired_scans + ((t_return + t_end)/2 - t_return)*scan_rate_Hz
+        for name in due:
+            scans, register_values = self._values[name]
+            scans.append(scan)
+            register_values.append(values[name])
+            self._next_due[name] = t_return + self._registers[name]
+
+    # <<<<< poll mode: read loop <<<<<
+
+    # >>>>> scan mode: stacking thread >>>>>
+
+    def _decimation(self, scan_rate_Hz: float) -> list[int]:
+        return [max(1, int(round(interval*scan_rate_Hz))) for interval in self._registers.values()]
+
+    def _on_scans(self, columns: 'np.ndarray', first_scan: int, num_missing: int, scan_rate_Hz: float) -> None:
+        """
+        Average the folded (scans x registers) columns of a block.
+
+        Args:
+            columns         : Folded samples of the block, -9999 for skipped samples.
+            first_scan      : Index in the data of the first scan of the block.
+            num_missing     : Scans missing at the gaps so far; a change means the block does not continue the carry.
+        """
+        columns = np.where(columns == -9999.0, np.nan, columns)
+        if self._carry is None or num_missing != self._num_missing:
+            # each register carries the scans of its incomplete window: (index in the data of its first scan, samples)
+            self._carry = [(first_scan, columns[:0, icol]) for icol in range(len(self._registers))]
+        self._num_missing = num_missing
+        for icol, (name, m) in enumerate(zip(self._registers, self._decimation(scan_rate_Hz))):
+            start, carry = self._carry[icol]
+            samples = np.concatenate((carry, columns[:, icol])) if len(carry) else columns[:, icol]
+            num_windows = len(samples)//m
+            if num_windows:
+                windows = samples[:num_windows*m].reshape(num_windows, m)
+                valid = ~np.isnan(windows)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    averages = np.where(valid, windows, 0).sum(axis=1)/valid.sum(axis=1)
+                scans, values = self._values[name]
+                scans.extend(start + num_missing + m*np.arange(num_windows) + (m - 1)/2)
+                values.extend(averages)
+            self._carry[icol] = (start + num_windows*m, samples[num_windows*m:].copy())
+
+    # <<<<< scan mode: stacking thread <<<<<
+
+    def _end_shot(self, num_channels: int, scan_rate_Hz: float) -> dict[str, dict[str, 'np.ndarray']]:
+        """Records of the shot; 't' follows the streamed records (scan*num_channels/scan_rate_Hz)."""
+        records = {}
+        for name, (scans, values) in self._values.items():
+            scans = np.array(scans, dtype=float)
+            records[name] = {'V': np.array(values, dtype=float), 't': scans*num_channels/scan_rate_Hz, 'scan': scans}
+        self._start_shot()
+        return records
@@ -0,0 +1,198 @@
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+import numpy as np
+if TYPE_CHECKING:
+    from _stream_in import StreamIn
+
+
+# >>>>> windows >>>>>
+
+_WINDOWS = {
+    'hann': lambda n: 0.5 - 0.5*np.cos(2*np.pi*np.arange(n)/n),  # periodic (DFT-even), as scipy.signal.welch
+    'hamming': lambda n: 0.54 - 0.46*np.cos(2*np.pi*np.arange(n)/n),
+    'blackman': lambda n: np.blackman(n + 1)[:-1],
+    'boxcar': lambda n: np.ones(n),
+}
+
+
+@lru_cache(maxsize=16)
+def _window(name: str, nperseg: int) -> tuple['np.ndarray', float]:
+    """Window of `nperseg` samples (as a column for (segments x samples x channels) arrays) and sum of its squares."""
+    if name not in _WINDOWS:
+        raise ValueError(f"Unknown window: {name} (available: {list(_WINDOWS)})")
+    window = _WINDOWS[name](nperseg)
+    window.flags.writeable = False
+    return window[:, None], float(np.sum(window**2))
+
+# <<<<< windows <<<<<
+
+
+class WelchPSD:
+    """
+    Welch-averaged power spectral density of each channel of a StreamIn, computed incrementally as the eStreamRead
+    blocks arrive, so that the spectrum of a shot is ready right after the stream stops.
+
+    - The samples after the last full segment of a block are carried over, so segments (with `overlap`) span
+      eStreamRead boundaries. The carry is dropped at each shot start and at each resume gap (see StreamIn.gaps).
+    - All complete segments of a block and all channels go through one batched numpy.fft.rfft.
+    - Segments with skipped samples (NaN) are left out of the average (see `num_segments_skipped`).
+    - The window and its normalization are cached per (window, nperseg).
+
+    PSD scaling (V^2/Hz, one-sided, mean-detrended segments) matches scipy.signal.welch(..., scaling='density').
+
+    e.g.,
+        psd = WelchPSD(stream_in.scan_rate_Hz, stream_in.scan_channels, nperseg=8192)
+        psd.attach(stream_in)
+        stream_in._stream_in()
+        f, asd = psd.frequencies, psd.asd['AIN0']  # V/sqrt(Hz)
+    """
+
+    # Read-only properties
+    @property
+    def scan_rate_Hz(self): return self._scan_rate
+    @property
+    def channels(self): return list(self._channels)
+    @property
+    def nperseg(self): return self._nperseg
+    @property
+    def frequencies(self): return np.fft.rfftfreq(self._nfft, 1/self._scan_rate)
+    @property
+    def num_segments(self): return self._num_segments
+    @property
+    def num_segments_skipped(self): return self._num_segments_skipped
+    @property
+    def num_shots(self): return self._num_shots
+
+    def __init__(self,
+                 scan_rate_Hz: float,
+                 channels: list[str],
+                 *,
+                 nperseg: int = 4096,
+                 overlap: float = 0.5,
+                 window: str = 'hann',
+                 nfft: int | None = None,
+                 average_shots: bool = False,
+            ) -> None:
+        """
+        Parameters:
+            scan_rate_Hz (float)    : Scan rate per channel (i.e., the sampling rate of each channel).
+            channels (list)         : Channel names, in the order of the scan list.
+            nperseg (int)           : Samples per segment. default: 4096
+            overlap (float)         : Fraction of a segment overlapping the next one, in [0, 1). default: 0.5
+            window (str)            : 'hann', 'hamming', 'blackman' or 'boxcar'. default: 'hann'
+            nfft (int)              : FFT size (zero-padded segments). None for nperseg.
+            average_shots (bool)    : Whether to keep averaging across shots (e.g., triggered shots) instead of
+                                    starting over at each shot. default: False
+        """
+        if not 0 <= overlap < 1:
+            raise ValueError("overlap should be in [0, 1).")
+        self._scan_rate = float(scan_rate_Hz)
+        self._channels = list(channels)
+        self._nperseg = int(nperseg)
+        self._step = max(1, self._nperseg - int(round(overlap*self._nperseg)))
+        self._nfft = int(nfft) if nfft is not None else self._nperseg
+        if self._nfft < self._nperseg:
+            raise ValueError("nfft should be nperseg or bigger.")
+        self._window_name = window
+        _window(window, self._nperseg)  # validate and cache
+        self._average_shots = bool(average_shots)
+        self.reset()
+
+    def reset(self) -> None:
+        """Drop the accumulated spectrum and the carried-over samples."""
+        self._power_sum = np.zeros((self._nfft//2 + 1, len(self._channels)))
+        self._num_segments = 0
+        self._num_segments_skipped = 0
+        self._num_shots = 0
+        self._carry = np.empty((0, len(self._channels)))
+
+    # >>>>> accumulation >>>>>
+
+    def update(self, data: 'np.ndarray') -> None:
+        """
+        Add contiguous (scans x channels) samples, continuing the samples of the previous update.
+        """
+        data = np.concatenate((self._carry, data)) if len(self._carry) else data
+        num_segments = (len(data) - self._nperseg)//self._step + 1 if len(data) >= self._nperseg else 0
+        if num_segments > 0:
+            # (segments x nperseg x channels) strided view: no copy until detrending
+            segments = np.lib.stride_tricks.sliding_window_view(data, self._nperseg, axis=0)[::self._step]
+            segments = segments[:num_segments].transpose(0, 2, 1)
+            valid = ~np.isnan(segments).any(axis=(1, 2))
+            if not valid.all():
+                self._num_segments_skipped += int(np.count_nonzero(~valid))
+                segments = segments[valid]
+            if len(segments):
+                window, _ = _window(self._window_name, self._nperseg)
+                segments = (segments - segments.mean(axis=1, keepdims=True))*window
+                spectra = np.fft.rfft(segments, n=self._nfft, axis=1)
+                self._power_sum += np.sum(spectra.real**2 + spectra.imag**2, axis=0)
+                self._num_segments += len(segments)
+        # keep the samples from the next segment start on (a copy, so the block buffer can be released)
+        self._carry = data[num_segments*self._step:].copy()
+
+    def end_shot(self) -> None:
+        """Close a shot: drop the carry (shots are not contiguous) and count the shot."""
+        self._carry = np.empty((0, len(self._channels)))
+        self._num_shots += 1
+
+    def attach(self, stream_in: 'StreamIn') -> None:
+        """Update with every eStreamRead block of `stream_in` (in its stacking thread) and close each shot."""
+        stream_in.add_block_handler(self._on_block)
+        stream_in.add_shot_handler(lambda stream_in: self.end_shot())
+
+    def _on_block(self, stream_in: 'StreamIn', ir: int, a_data: 'np.ndarray', *_) -> None:
+        if ir == 0:
+            if self._average_shots:
+                self._carry = np.empty((0, len(self._channels)))
+            else:
+                self.reset()
+        if stream_in._block_gaps():
+            # the stream was resumed before this block: it does not continue the carried-over samples
+            self._carry = np.empty((0, len(self._channels)))
+        num_channels = len(self._channels)
+        self.update(a_data[:len(a_data)//num_channels*num_channels].reshape(-1, num_channels))
+
+    # <<<<< accumulation <<<<<
+
+    # >>>>> results >>>>>
+
+    @property
+    def psd(self) -> dict[str, 'np.ndarray']:
+        """One-sided PSD (V^2/Hz) of each channel, averaged over the segments so far."""
+        if self._num_segments == 0:
+            return {channel: np.full(self._nfft//2 + 1, np.nan) for channel in self._channels}
+        _, window_power = _window(self._window_name, self._nperseg)
+        psd = self._power_sum/(self._num_segments*self._scan_rate*window_power)
+        # one-sided: double all but DC (and Nyquist for even nfft)
+        psd[1:-1 if self._nfft % 2 == 0 else None] *= 2
+        return {channel: psd[:, ich] for ich, channel in enumerate(self._channels)}
+
+    @property
+    def asd(self) -> dict[str, 'np.ndarray']:
+        """One-sided amplitude spectral density (V/sqrt(Hz)) of each channel."""
+        return {channel: np.sqrt(psd) for channel, psd in self.psd.items()}
+
+    def noise_floor(self, f_min_Hz: float = 0.0, f_max_Hz: float = np.inf) -> dict[str, float]:
+        """Median ASD (V/sqrt(Hz)) of each channel over [f_min_Hz, f_max_Hz], robust to spectral lines."""
+        f = self.frequencies
+        band = (f >= f_min_Hz) & (f <= f_max_Hz)
+        return {channel: float(np.median(asd[band])) for channel, asd in self.asd.items()}
+
+    # <<<<< results <<<<<
+
+
+def welch_psd(data: 'np.ndarray', scan_rate_Hz: float, **kwargs) -> tuple['np.ndarray', 'np.ndarray']:
+    """
+    Welch PSD of a (scans x channels) array (e.g., StreamIn.to_numpy()) in one call.
+
+    Returns:
+        tuple of frequencies (Hz) and (frequencies x channels) PSD (V^2/Hz)
+    """
+    data = np.asarray(data, dtype=float)
+    if data.ndim == 1:
+        data = data[:, None]
+    estimator = WelchPSD(scan_rate_Hz, [str(ich) for ich in range(data.shape[1])], **kwargs)
+    estimator.update(data)
+    return estimator.frequencies, np.stack(list(estimator.psd.values()), axis=1)
@@ -1,17 +1,76 @@
 from labjack_device import LabJackDevice
 from labjack import ljm
 from _ljm_aux import *
+from _timebase import fit_shot_clock, scan_times, clock_datetime
 
-import asyncio
 import threading
 import queue
+import time
 
 import numpy as np
 from datetime import datetime
-from pprint import pprint, pformat
-from copy import deepcopy
-from textwrap import indent
 import warnings
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from _derived_channels import DerivedChannels
+    from _stream_out import StreamOut
+    from _slow_registers import SlowRegisters
+    from _raw_log import RawReadRecorder
+    from _sink_router import SinkRouter
+    import pandas as pd
+    import xarray as xr
+
+def _skipped_runs(mask: np.ndarray, first_scan: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Run-length encode a (scans x channels) boolean mask of skipped samples in one vectorized pass.
+    
+    Returns:
+        tuple of int arrays (channel index, start scan, stop scan) of each run, sorted by channel then start.
+    """
+    num_channels = mask.shape[1]
+    padded = np.zeros((num_channels, mask.shape[0] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask.T
+    edges = np.diff(padded, axis=1)
+    ch_starts, starts = np.nonzero(edges == 1)
+    _, stops = np.nonzero(edges == -1)
+    return ch_starts, starts + first_scan, stops + first_scan
+
+
+def _merge_skipped_runs(runs: list, num_channels: int, num_scans: int) -> list[np.ndarray]:
+    """
+    Combine the runs of all reads into per-channel (n x 2) [start, stop) arrays, joining runs that continue across
+    read boundaries and clipping them to `num_scans`.
+    """
+    if not runs:
+        return [np.empty((0, 2), dtype=np.int64) for _ in range(num_channels)]
+    channels = np.concatenate([r[0] for r in runs])
+    starts = np.concatenate([r[1] for r in runs])
+    stops = np.concatenate([r[2] for r in runs])
+    order = np.lexsort((starts, channels))
+    channels, starts, stops = channels[order], starts[order], stops[order]
+    spans = []
+    for ich in range(num_channels):
+        sel = channels == ich
+        spans.append(_union_spans(np.stack((starts[sel], stops[sel]), axis=1), num_scans))
+    return spans
+
+
+def _union_spans(spans: np.ndarray, num_scans: int | None = None) -> np.ndarray:
+    """Merge overlapping or touching [start, stop) spans, optionally clipped to [0, num_scans)."""
+    spans = np.asarray(spans, dtype=np.int64).reshape(-1, 2)
+    if num_scans is not None:
+        spans = np.clip(spans, 0, num_scans)
+        spans = spans[spans[:, 1] > spans[:, 0]]
+    if len(spans) <= 1:
+        return spans
+    spans = spans[np.argsort(spans[:, 0], kind='stable')]
+    # a span starts a new group if it begins after the furthest stop so far
+    furthest = np.maximum.accumulate(spans[:, 1])
+    new_group = np.concatenate(([True], spans[1:, 0] > furthest[:-1]))
+    group_starts = spans[new_group, 0]
+    group_stops = np.maximum.reduceat(spans[:, 1], np.nonzero(new_group)[0])
+    return np.stack((group_starts, group_stops), axis=1)
+
 
 class StreamIn:
     """
@@ -37,6 +96,8 @@ class StreamIn:
     @property
     def scans_per_read(self): return self._scans_per_read
     @property
+    def autotuner(self): return self._autotuner
+    @property
     def do_trigger(self): return self._do_trigger
     @property
     def trigger_channel(self): return self._trigger_channel
@@ -60,6 +121,44 @@ class StreamIn:
     def records(self): return self._records
     @property
     def skipped_samples(self): return self._skipped_samples
+    _skipped_spans = []
+    _num_record_scans = 0
+    @property
+    def skipped_spans(self):
+        """dict of channel name to (n x 2) int array of [start, stop) scan indices of skipped (NaN) samples"""
+        return dict(zip(self._scan_channels, self._skipped_spans))
+    @property
+    def stream_outs(self): return list(self._stream_outs)
+    @property
+    def num_record_scans(self): return self._num_record_scans
+    _clock = None
+    @property
+    def clock(self):
+        """LabJackShotClockTypedDict of the last shot (start time and clock ratio), or None before the first shot"""
+        return self._clock
+    @property
+    def start_datetime(self):
+        """Start time of the last shot (scan 0) as a timezone-aware UTC datetime"""
+        return None if self._clock is None else clock_datetime(self._clock)
+    @property
+    def missing_scans(self): return sum(missing for _, missing in self._gaps)
+    @property
+    def reconnect_attempts(self): return self._reconnect_attempts
+    _gaps = ()
+    @property
+    def gaps(self): return list(self._gaps)
+    _stream_reader = None
+    _raw_recorder = None
+    _shot_recorder = None
+    _sink_router = None
+    @property
+    def sink_router(self): return self._sink_router
+    @property
+    def raw_recorder(self): return self._raw_recorder
+    @property
+    def fast_read(self):
+        """Whether the last shot was read through the ctypes path (see _stream_read.StreamReader), None before"""
+        return None if self._stream_reader is None else self._stream_reader.fast
 
     def __init__(self,
                 device: LabJackDevice,
@@ -67,12 +166,15 @@ class StreamIn:
                 duration_s: int = 1,
                 *,
                 sampling_rate_Hz: float = 100e3,
-                scans_per_read: int | None = None,
+                scans_per_read: int | str | None = None,
                 do_trigger: bool = False,
                 trigger_channel : str = "DIO0",
                 trigger_mode: LabJackTriggerModeEnum = LabJackTriggerModeEnum.ConditionalReset,
                 trigger_edge: LabJackTriggerEdgeEnum = LabJackTriggerEdgeEnum.Rising,
                 trigger_timeout_s: float | None = None,
+                reconnect_attempts: int = 0,
+                reconnect_delay_s: float = 1.0,
+                stream_outs: list['StreamOut'] | None = None,
             )  -> None:
         """
         Initialize the LabJackDevice.
@@ -85,7 +187,9 @@ class StreamIn:
             sampling_rate_Hz (float)  : sampling rate (over all channel) in Hz. defaults: 100e3. 
                                         cf. scan rate (per channel) = [sampling_rate_Hz / len(scan_channels)] Hz.
             scans_per_read              : Number of scans per channel per eStreamRead.
-            (int or 'None')             None for max scans (i.e., stream over scan_duration_s at once)
+            (int or 'None' or "auto")   None for max scans (i.e., stream over scan_duration_s at once)
+                                        "auto" to tune it between shots from the scan backlogs
+                                        (see _autotune.ScansPerReadAutotuner and `autotuner`).
                                         default: None
             do_trigger (bool)           : Whether to use triggered streaming.
                                         default: False
@@ -98,6 +202,18 @@ class StreamIn:
             trigger_timeout_s (float)   : Duration of waiting for trigger
                                         > 0 or None for indefinite wait.
                                         default: None
+            reconnect_attempts (int)    : Number of reconnections allowed per capture to resume the stream after a
+                                        recoverable connection error (see _ljm_aux.LABJACK_RECOVERABLE_STREAM_ERRORS).
+                                        The stream/trigger configuration is re-applied and the missing scans are
+                                        recorded in `gaps` and in the time of `records`.
+                                        0 to raise LabJackStreamReadError instead.
+                                        default: 0
+            reconnect_delay_s (float)   : Wait before each reconnection.
+                                        default: 1.0
+            stream_outs (list)          : _stream_out.StreamOut outputs clocked by the scans of this stream
+                                        (see LabJackDevice.stream_out()). With refilled outputs, scans_per_read=None
+                                        is capped to leave margin for the refills.
+                                        default: None
         """
         
         # Device
@@ -119,11 +235,20 @@ class StreamIn:
         self._duration = duration = num_scans/scan_rate_Hz
         self._num_samples = num_samples = num_scans*num_channels        
         
-        if scans_per_read is None:
-            scans_per_read = int(scan_rate_Hz*duration_s)
-        self._scans_per_read = scans_per_read
-        num_reads = int(np.ceil(float(num_scans)/scans_per_read))
-        self._num_reads = num_reads
+        self._autotuner = None
+        if scans_per_read == "auto":
+            from _autotune import ScansPerReadAutotuner
+            self._autotuner = ScansPerReadAutotuner(scan_rate_Hz, num_scans)
+            scans_per_read = self._autotuner.scans_per_read
+            self._scans_per_read_max = self._autotuner.max_scans_per_read
+        else:
+            if scans_per_read is None:
+                scans_per_read = int(scan_rate_Hz*duration_s)
+                if stream_outs:
+                    from _stream_out import refill_scans_per_read
+                    scans_per_read = min(scans_per_read, refill_scans_per_read(stream_outs) or scans_per_read)
+            self._scans_per_read_max = scans_per_read
+        self._set_scans_per_read(scans_per_read)
 
         # trigger configuration
         self._do_trigger = do_trigger
@@ -136,6 +261,27 @@ class StreamIn:
             trigger_timeout_s = 0
         self._trigger_timeout = trigger_timeout_s
         
+        # resilience configuration
+        if reconnect_attempts < 0:
+            raise ValueError("reconnect_attempts should be 0 or bigger.")
+        self._reconnect_attempts = int(reconnect_attempts)
+        self._reconnect_delay = float(reconnect_delay_s)
+        
+        # callables run on each completed shot (see add_shot_handler())
+        self._shot_handlers = []
+        # callables run on each eStreamRead block (see add_block_handler())
+        self._block_handlers = []
+        self._publisher = None
+        self._derived = None  # compiled DerivedChannels
+        self._slow = None  # SlowRegisters
+        self._slow_addresses = []  # addresses of slow registers folded into the scan list
+        
+        # hardware-timed outputs sharing the scan clock
+        self._stream_outs = list(stream_outs or [])
+        if self._stream_outs:
+            from _stream_out import check_stream_outs
+            check_stream_outs(self._stream_outs, self._scans_per_read_max)
+        
         # configure stream
         self._configure()
         
@@ -148,28 +294,39 @@ class StreamIn:
         #self._stream_in()
 
 
+    def _set_scans_per_read(self, scans_per_read: int) -> None:
+        self._scans_per_read = int(scans_per_read)
+        self._num_reads = int(np.ceil(float(self._num_scans)/self._scans_per_read))
+
+    # register config for stream, applied by _configure() (LabJackDevice.stream_in() plans the rate with it)
+    _STREAM_REGISTERS = {
+        # Ensure triggered stream is disabled initially.
+        "STREAM_TRIGGER_INDEX": int(0), 
+        # Enable internally-clocked stream.
+        "STREAM_CLOCK_SOURCE": int(0), 
+        # # settling time in microseconds
+        # https://support.labjack.com/docs/analog-input-settling-time-app-note#AnalogInputSettlingTime(AppNote)-T7SamplingDetails
+        "STREAM_SETTLING_US": int(0), # default: 0
+        # The resolution index for stream readings
+        # under https://support.labjack.com/docs/a-3-analog-input-t-series-datasheet
+        # e.g., https://support.labjack.com/docs/a-3-2-2-t7-noise-and-resolution-t-series-datasheet#A-3-2-2T7NoiseandResolution[T-SeriesDatasheet]-ADCNoiseandResolution
+        "STREAM_RESOLUTION_INDEX": int(0),
+        # range of all analog inputs in +-V (written by configure_register() anyway, as its default)
+        "AIN_ALL_RANGE": 10.0,
+    }
+    
     def _configure(self) -> None:
         """
         Device configuration for streaming
         https://support.labjack.com/docs/3-2-stream-mode-t-series-datasheet#id-3.2StreamMode[T-SeriesDatasheet]-ConfiguringAINforStream
         """
+        # never reconfigure (or stop) a stream run by another object
+        self._device._check_stream_free(self)
         print(f">>> Configuring LabJack for streaming... ", end="")
-        # register config for stream
-        config_resister = {
-            # Ensure triggered stream is disabled initially.
-            "STREAM_TRIGGER_INDEX": int(0), 
-            # Enable internally-clocked stream.
-            "STREAM_CLOCK_SOURCE": int(0), 
-            # # settling time in microseconds
-            # https://support.labjack.com/docs/analog-input-settling-time-app-note#AnalogInputSettlingTime(AppNote)-T7SamplingDetails
-            "STREAM_SETTLING_US": int(0), # default: 0
-            # The resolution index for stream readings
-            # under https://support.labjack.com/docs/a-3-analog-input-t-series-datasheet
-            # e.g., https://support.labjack.com/docs/a-3-2-2-t7-noise-and-resolution-t-series-datasheet#A-3-2-2T7NoiseandResolution[T-SeriesDatasheet]-ADCNoiseandResolution
-            "STREAM_RESOLUTION_INDEX": int(0),
-        }
+        config_resister = dict(self._STREAM_REGISTERS)
         
         start = datetime.now()
+        span_start = time.perf_counter_ns()
         # self._device.configure_register(**config_resister)
         try:
             self._device.configure_register(**config_resister)
@@ -180,8 +337,10 @@ class StreamIn:
                 isinstance(ex.__cause__, ljm.LJMError) and \
                 ex.__cause__.errorCode == 2605:
                 warnings.warn("Stream was active. Attempting to stop stream... ", category='UserWarning')
-                ljm.eStreamStop(self._handle)
+                with self._device._command_lock:
+                    self._ljm_stream_stop(self._handle)
                 warnings.warn("Stream stopped.", category='UserWarning')
+        self._device._profiler.record('configure', span_start, time.perf_counter_ns())
         end = datetime.now()
         td_exe = end - start
         print(f"Done. Execution time: {td_exe.total_seconds():.6f} s")
@@ -192,9 +351,11 @@ class StreamIn:
         """
         Configure the device for trigger.
         """
+        self._device._check_stream_free(self)
         print(f">>> Configuring LabJack for trigger...", end="")
         
         start = datetime.now()
+        span_start = time.perf_counter_ns()
         # library config
         config_library_trigger = {
             ljm.constants.STREAM_SCANS_RETURN: ljm.constants.STREAM_SCANS_RETURN_ALL,
@@ -236,6 +397,7 @@ class StreamIn:
         # #  Enable the trigger
         self._device.configure_register(**{f"{self._trigger_channel}_EF_ENABLE": 1})
         
+        self._device._profiler.record('trigger_arm', span_start, time.perf_counter_ns())
         end = datetime.now()
         td_exe = end - start
         
@@ -252,19 +414,50 @@ class StreamIn:
         stack the return of each eStreamRead() to this instance.
         Intended to be asyncio.queue'd in _stream() method.
         """
-        a_data = np.array(ret[0]) # stream data read
+        a_data = np.asarray(ret[0], dtype=float) # stream data read (owned by this shot, see _run_stream_in)
+        num_outs = len(self._stream_outs)
+        num_folded = len(self._slow_addresses)
+        scan_width = self._num_channels + num_folded
+        if num_outs and len(a_data) == self._scans_per_read*(scan_width + num_outs):
+            # drop the entries of the STREAM_OUT# channels if the scans include them
+            a_data = a_data.reshape(self._scans_per_read, -1)[:, :scan_width].ravel()
+        if num_folded:
+            # split off the slow registers folded into the scans
+            scans = a_data[:len(a_data)//scan_width*scan_width].reshape(-1, scan_width)
+            # gaps before this block only: the read loop may already have appended the gap of a later read
+            num_missing = sum(missing for first_scan, missing in self._gaps if first_scan <= self._scans)
+            self._slow._on_scans(scans[:, self._num_channels:], self._scans, num_missing, self._scan_rate)
+            a_data = scans[:, :self._num_channels].ravel()
         device_scan_backlog = ret[1]
         ljm_scan_backlog = ret[2]
         
-        # Count skipped samples (indicated by -9999 values)
-        skipped_samples = np.sum(a_data == -9999.0)
+        # Count skipped samples (indicated by -9999 values) and convert them to np.nan with a single mask
+        skipped_mask = a_data == -9999.0
+        skipped_samples = int(np.count_nonzero(skipped_mask))
         self._skipped_samples += skipped_samples
+        if skipped_samples:
+            a_data[skipped_mask] = np.nan
+            # run-length index of the skipped spans of this block (in scans since the start of the shot)
+            num_scans_block = len(a_data)//self._num_channels
+            self._skipped_runs.append(_skipped_runs(
+                skipped_mask[:num_scans_block*self._num_channels].reshape(num_scans_block, self._num_channels),
+                first_scan=self._scans,
+            ))
         
-        # conver skipped samples to np.nan
-        a_data[a_data == -9999.0] = np.nan
+        # derived channels of this block, straight into the shot buffer
+        if self._derived is not None:
+            num_scans_block = len(a_data)//self._num_channels
+            self._derived_scratch = self._derived.evaluate(
+                a_data[:num_scans_block*self._num_channels].reshape(num_scans_block, self._num_channels),
+                self._derived_data[:, self._scans:self._scans + num_scans_block],
+                self._derived_scratch,
+            )
         
-        # add stream data of current eStreamRead
-        self._total_a_data.extend(a_data) 
+        for handler in self._block_handlers:
+            handler(self, ir, a_data, device_scan_backlog, ljm_scan_backlog, timestamp_read_return)
+        
+        # add stream data of current eStreamRead (concatenated once at the end of the shot)
+        self._blocks.append(a_data)
         
         # time that data was returned from eStreamRead
         self._timestamp_read_return[ir] = timestamp_read_return
@@ -274,6 +467,11 @@ class StreamIn:
         current_scans = int(current_samples / self._num_channels)
         self._scans += current_scans
         
+        # scans acquired by the device when eStreamRead returned, for the drift-corrected shot clock
+        missing_scans = sum(missing for first_scan, missing in self._gaps if first_scan < self._scans)
+        self._clock_points.append((timestamp_read_return.timestamp(),
+                                   self._scans + missing_scans + device_scan_backlog + ljm_scan_backlog))
+        
         msg = f"\teStreamRead {ir + 1} out of {self._num_reads} returned at {timestamp_read_return}."
         msg += f"\n\t\tScans Skipped across channels = {skipped_samples:0.0f}, "
         msg += f"Scan Backlogs: Device = {device_scan_backlog}, LJM = {ljm_scan_backlog}\n"
@@ -293,7 +491,16 @@ class StreamIn:
             if item is None:
                 break  # signal to exit
             ir, timestamp_read_return, ret = item
-            self._stack_stream_reads(ir, timestamp_read_return, ret)
+            if self._worker_error is None:
+                try:
+                    with self._device._profiler.span('stacking', read=ir):
+                        if self._shot_recorder is not None:
+                            # before stacking, which sets the skipped samples to NaN in place
+                            self._shot_recorder._on_read(self, ir, timestamp_read_return, ret)
+                        self._stack_stream_reads(ir, timestamp_read_return, ret)
+                except Exception as ex:
+                    # keep draining the queue (the read loop never waits for it); raised after the stream stops
+                    self._worker_error = ex
             self._queue.task_done()
     
     async def _run_stream_in(self) -> None:
@@ -302,6 +509,9 @@ class StreamIn:
         """
         
         handle = self._handle
+        profiler = self._device._profiler
+        profiler.begin_shot()
+        shot_start = time.perf_counter_ns()
         
         # # stop streaming if already active
         # try:
@@ -319,16 +529,21 @@ class StreamIn:
         # Streaming configuration parameters
         scansPerRead = self._scans_per_read
         NumAddresses = self._num_channels
-        aScanList = ljm.namesToAddresses(self._num_channels, self._scan_channels)[0]
+        aScanList = self._scan_list()
         scanRate = self._scan_rate
         numReads = self._num_reads
         
         # Start streaming
         # wait for trigger before streaming if enabled
         print(f">>> Streaming starting... ", end="", flush=True)
+        command_lock = self._device._command_lock
+        self._device._acquire_stream(self)  # released once the stream is stopped
         stream_started = False
         try:
-            ljm.eStreamStart(handle, scansPerRead, NumAddresses, aScanList, scanRate)
+            with profiler.span('stream_start'), command_lock:
+                for stream_out in self._stream_outs:
+                    stream_out._start(handle, scanRate)
+                self._ljm_stream_start(handle, scansPerRead, aScanList, scanRate)
             stream_started = True  # set after successful eStreamStart()
         except ljm.LJMError as ljmex:
             raise LabJackStreamReadError("LabJack library-level error") from ljmex
@@ -339,7 +554,8 @@ class StreamIn:
                 # attempt to stop stream in case the device started streaming
                 print("Stream failed to start. Attempting to stop stream... ", end="", flush=True)
                 try:
-                    ljm.eStreamStop(handle)
+                    with command_lock:
+                        self._ljm_stream_stop(handle)
                 except ljm.LJMError as ljmex:
                     print("Failed.", flush=True)
                     raise LabJackStreamReadError("LabJack library-level error") from ljmex
@@ -348,6 +564,8 @@ class StreamIn:
                     raise LabJackStreamReadError("Non LabJack library-level error") from ex
                 else:
                     print("Done.", flush=True)
+                finally:
+                    self._device._release_stream(self)
                     
         
         print(f"Started.", flush=True)
@@ -358,29 +576,95 @@ class StreamIn:
         self._samples = 0
         self._scans = 0
         self._skipped_samples = 0
-        self._total_a_data = []  # Accumulate data across reads
+        self._blocks = []  # data array of each read
+        self._skipped_runs = []  # (channel indices, start scans, stop scans) of skipped spans of each read
         self._timestamp_read_return = [None]*numReads
+        self._clock_points = []  # (host POSIX time of read return, scans acquired) of each read
+        if self._slow is not None:
+            self._slow._start_shot()
+        if self._derived is not None:
+            # (derived channels x scans) so that each derived record is a contiguous row
+            self._derived_data = np.empty((len(self._derived.names), numReads*scansPerRead))
+
+        # resilience bookkeeping
+        self._gaps = []  # (scan index in data where scans are missing, number of missing scans)
+        self._reconnects_left = self._reconnect_attempts
+        if self._reconnect_attempts > 0:
+            self._mark_segment_start(first_scan=0, first_read=0)
+        
+        autotuner = self._autotuner
+        if autotuner is not None:
+            autotuner.start_shot()
 
+        # eStreamRead into a reused ctypes buffer, copied into one preallocated row per read
+        from _stream_read import StreamReader
+        if self._stream_reader is None:
+            self._stream_reader = StreamReader()
+        reader = self._stream_reader
+        read_rows = None  # (reads x values per read)
+        
+        # raw reads of this shot, logged by the stacking worker (see record_raw())
+        recorder = self._raw_recorder
+        self._shot_recorder = recorder if recorder is not None and not recorder.closed else None
+        if self._shot_recorder is not None:
+            self._shot_recorder._begin_shot(self, aScanList)
+        
         # Read stream data for the specified number of reads.
         self._queue = queue.Queue()
+        self._worker_error = None  # first exception of the stacking (e.g., of a block handler)
         worker_thread = threading.Thread(target=self._queue_worker, daemon=True)
         worker_thread.start()
         
         start_time = datetime.now()
+        self._segment_scans_read = 0  # scans read since the last eStreamStart (for stream-out refills)
         ir = 0
         try:
             while ir < numReads:
             # for ir in numReads:
-                # read stream from LabJack
+                # read stream from LabJack (waits for stream data: no command_lock, see LabJackDevice)
                 try:
-                    ret = ljm.eStreamRead(handle)
-                    timestamp_read_return = datetime.now()
+                    # the first read of a triggered stream waits for the trigger
+                    read_start = time.perf_counter_ns()
+                    ret = reader.read(handle)
+                    timestamp_read_return = reader.timestamp()
+                    profiler.record('trigger_wait' if self._do_trigger and ir == 0 else 'read',
+                                    read_start, time.perf_counter_ns(), {'read': ir})
                 except ljm.LJMError as ljmex:
                     # If no scans are returned, continue; otherwise, propagate the error.
                     if ljmex.errorCode == ljm.errorcodes.NO_SCANS_RETURNED:
                         continue
+                    # If recoverable, reconnect and resume the stream; otherwise, propagate the error.
+                    if self._reconnects_left > 0 and LabJackIsRecoverableStreamError(ljmex):
+                        handle = self._resume_stream(ljmex, ir)
+                        continue
                     raise ljmex
                 
+                if reader.fast:
+                    # the buffer of the reader is reused by the next read
+                    if read_rows is None:
+                        read_rows = np.empty((numReads, len(ret[0])))
+                    if len(ret[0]) == read_rows.shape[1]:
+                        np.copyto(read_rows[ir], ret[0])
+                        ret = (read_rows[ir], ret[1], ret[2])
+                    else:
+                        ret = (ret[0].copy(), ret[1], ret[2])
+                
+                if autotuner is not None:
+                    autotuner.observe(ret[1], ret[2])
+                
+                # keep the stream-out buffers ahead of the scans acquired so far
+                self._segment_scans_read += scansPerRead
+                if self._stream_outs:
+                    with command_lock:
+                        for stream_out in self._stream_outs:
+                            stream_out._refill(handle, self._segment_scans_read + ret[1] + ret[2])
+                
+                # slow registers between eStreamRead calls, on the same handle
+                if self._slow is not None and self._slow.mode == 'poll':
+                    acquired_scans = (ir + 1)*scansPerRead + sum(missing for _, missing in self._gaps) + ret[1] + ret[2]
+                    with command_lock:
+                        self._slow._poll(handle, acquired_scans, scanRate)
+                
                 # stack the return of each eStreamRead() to this instance
                 self._queue.put((ir, timestamp_read_return, ret))
 
@@ -394,16 +678,25 @@ class StreamIn:
             # Stop the stream
             print(">>> Stopping Stream...\n", flush=True)
             try:
-                ljm.eStreamStop(handle)
+                with profiler.span('stream_stop'), command_lock:
+                    self._ljm_stream_stop(handle)
             except ljm.LJMError as ljmex:
                 raise LabJackStreamReadError("LabJack library-level error") from ljmex
             except Exception as ex:
                 raise LabJackStreamReadError("Non LabJack library-level error") from ex
+            finally:
+                self._device._release_stream(self)
             print("<<< Stream stopped.\n", flush=True)
             
         # wait until data stacking is done
         self._queue.put(None)  # signal to stop thread
         worker_thread.join()   # wait for worker to clean up
+        if self._shot_recorder is not None:
+            self._shot_recorder._end_shot(self)
+        if self._worker_error is not None:
+            if isinstance(self._worker_error, ljm.LJMError):
+                raise LabJackStreamReadError("LabJack library-level error") from self._worker_error
+            raise LabJackStreamReadError("Non LabJack library-level error") from self._worker_error
         
         msg = f"\t# scans = {self._samples} total, {self._scans}/channel"
         msg += f"\tSkipped scans across channels = {self._skipped_samples:0.0f}\n"
@@ -412,18 +705,444 @@ class StreamIn:
         end_time = datetime.now()
         elapsed = (end_time - start_time).total_seconds()
 
-        # Process raw streamed data into channel-specific data.
-        ch_data = LabJackaData2chData(self._total_a_data, self._num_channels, scanRate)
+        # Process raw streamed data into one (scans x channels) buffer; the records of each channel are column views
+        # of it (same layout and 't' as LabJackaData2chData).
+        deinterleave_start = time.perf_counter_ns()
+        num_channels = self._num_channels
+        a_data = np.concatenate(self._blocks) if self._blocks else np.empty(0)
+        num_scans = len(a_data)//num_channels
+        if autotuner is not None:
+            # keep the shot length independent of the tuned block size
+            num_scans = min(num_scans, self._num_scans)
+        buffer = a_data[:num_scans*num_channels].reshape(num_scans, num_channels)
+        sample_idx = np.arange(num_scans)*num_channels
         records = {}
         for inx, a_scan_list_name in enumerate(self._scan_channels):
-            ch_data_channel = deepcopy(ch_data[inx])
-            ch_data_channel.pop('idx')
-            records[a_scan_list_name] = ch_data_channel
+            records[a_scan_list_name] = {'V': buffer[:, inx], 't': (sample_idx + inx)/scanRate}
+        self._buffer = buffer
+        assembly_start = time.perf_counter_ns()
+        profiler.record('deinterleave', deinterleave_start, assembly_start)
+        if self._derived is not None:
+            t_derived = records[self._scan_channels[0]]['t']  # time of the scans (first channel)
+            for row, name in enumerate(self._derived.names):
+                records[name] = {'V': self._derived_data[row, :num_scans], 't': t_derived}
+        
+        # shift the time after each gap by the missing scans (same time convention as LabJackaData2chData)
+        if self._gaps:
+            scan_offsets = np.zeros(numReads*scansPerRead)
+            for first_scan, missing_scans in self._gaps:
+                scan_offsets[first_scan:] += missing_scans
+            for record in records.values():
+                record['t'] = record['t'] + scan_offsets[:len(record['t'])]*self._num_channels/scanRate
+        
+        # slow registers, placed by scan index (gaps included)
+        if self._slow is not None:
+            records.update(self._slow._end_shot(self._num_channels, scanRate))
+        
+        # skipped spans per channel, merging spans across eStreamRead boundaries
+        num_record_scans = len(next(iter(records.values()))['V']) if records else 0
+        self._skipped_spans = _merge_skipped_runs(self._skipped_runs, self._num_channels, num_record_scans)
+        self._num_record_scans = num_record_scans
+        
+        # start time and clock ratio fitted to the read-return times
+        if self._clock_points:
+            read_times, acquired_scans = np.array(self._clock_points).T
+            self._clock = fit_shot_clock(read_times, acquired_scans, scanRate)
+        else:
+            self._clock = None
+        
+        # block size for the next shot
+        if autotuner is not None:
+            self._set_scans_per_read(autotuner.end_shot())
         
         # store result to this instance    
         self._records = records
         # self._records_ready.set()  # signal that records are ready
+        profiler.record('record_assembly', assembly_start, time.perf_counter_ns())
+        
+        with profiler.span('shot_handlers'):
+            for handler in self._shot_handlers:
+                handler(self)
+        profiler.record('shot', shot_start, time.perf_counter_ns())
+        
+    def add_shot_handler(self, handler) -> None:
+        """
+        Register a callable run as `handler(stream_in)` right after the records of each shot are stored.
+        e.g., ShotAnalysisPool.attach() uses this to dispatch every completed shot to worker processes.
+        """
+        if not callable(handler):
+            raise ValueError(f"Shot handler should be callable: {handler}")
+        self._shot_handlers.append(handler)
+        
+    def add_block_handler(self, handler) -> None:
+        """
+        Register a callable run on each eStreamRead block in the stacking worker thread (i.e., not in the read loop) as
+            handler(stream_in, ir, a_data, device_scan_backlog, ljm_scan_backlog, timestamp_read_return)
+        where `a_data` is the interleaved block with skipped samples set to np.nan.
+        """
+        if not callable(handler):
+            raise ValueError(f"Block handler should be callable: {handler}")
+        self._block_handlers.append(handler)
+        
+    def publish(self, name: str | None = None, *, num_slots: int = 16) -> 'StreamPublisher':
+        """
+        Publish each eStreamRead block into a named shared memory ring so that local processes can follow the stream
+        with `_stream_publisher.StreamSubscriber(name)`. Publishing never blocks on slow readers.
+        
+        Args:
+            name (str or None)  : Name of the shared memory ring. None for a random name (see the returned `.name`).
+            num_slots (int)     : Number of blocks kept in the ring. default: 16
+        
+        Returns:
+            StreamPublisher object. The ring is removed when it is closed or this StreamIn object is deleted.
+        """
+        from _stream_publisher import StreamPublisher
+        if self._publisher is not None:
+            raise RuntimeError(f"StreamIn is already published as '{self._publisher.name}'.")
+        self._publisher = StreamPublisher(name, self._scan_channels, self._scan_rate,
+                                          self._scans_per_read_max*self._num_channels, num_slots=num_slots)
+        self.add_block_handler(self._publisher._on_block)
+        return self._publisher
+        
+    def add_sink(self,
+                 name: str,
+                 func,
+                 *,
+                 kind: str = 'shot',
+                 policy: str = 'drop',
+                 max_queue: int = 8,
+            ) -> 'SinkRouter':
+        """
+        Send every completed shot (kind='shot') or eStreamRead block (kind='block') to `func` in a worker thread of its
+        own, through a bounded queue, instead of calling it in the acquisition (see _sink_router.SinkRouter), e.g.,
+            stream_in.add_sink("influx", upload_shot, policy='drop', max_queue=16)
+            stream_in.add_sink("plot", update_plot, policy='coalesce', max_queue=1)
         
+        Args:
+            name (str)          : Unique name of the sink.
+            func (callable)     : Called as func(item) with a LabJackShotItemTypedDict or LabJackBlockItemTypedDict.
+            kind (str)          : 'shot' or 'block'. default: 'shot'
+            policy (str)        : When the queue is full: 'block' to wait (no loss), 'drop' to drop the new item or
+                                'coalesce' to drop the oldest pending one. default: 'drop'
+            max_queue (int)     : Items waiting for the sink at most. default: 8
+        
+        Returns:
+            _sink_router.SinkRouter of this StreamIn (see `stats()`, `flush()` and `close()`)
+        """
+        if self._sink_router is None:
+            from _sink_router import SinkRouter
+            self._sink_router = SinkRouter()
+            self._sink_router.attach(self)
+        self._sink_router.add_sink(name, func, kind=kind, policy=policy, max_queue=max_queue)
+        return self._sink_router
+        
+    def __del__(self) -> None:
+        if getattr(self, "_publisher", None) is not None:
+            self._publisher.close()
+        if getattr(self, "_sink_router", None) is not None:
+            self._sink_router.close(wait=False)
+        
+        
+    def add_derived_channels(self, derived: 'DerivedChannels') -> None:
+        """
+        Evaluate `derived` (see _derived_channels.DerivedChannels, e.g., quad_photodiode_channels()) on each
+        eStreamRead block, in the stacking worker thread, and add its channels to `records` alongside the streamed
+        channels. Derived records share the 't' of the first streamed channel and are not part of `to_numpy()`.
+        Replaces derived channels added before.
+        """
+        self._derived = derived.compile(self._scan_channels)
+        self._derived_scratch = None
+    
+    def add_slow_registers(self, registers: dict[str, float], *, mode: str = 'poll') -> 'SlowRegisters':
+        """
+        Acquire slowly changing registers (housekeeping values) along with the stream, in the same device session,
+        and add them to `records` aligned to the scans (see _slow_registers.SlowRegisters), e.g.,
+            stream_in.add_slow_registers({"TEMPERATURE_DEVICE_K": 1.0, "AIN10": 0.5})
+        Replaces slow registers added before.
+        
+        Args:
+            registers (dict)    : Register name -> interval in seconds.
+            mode (str)          : 'poll' to read them between eStreamRead calls, or 'scan' to fold them into the
+                                scan list and average them over each interval. default: 'poll'
+        
+        Returns:
+            _slow_registers.SlowRegisters object
+        """
+        from _slow_registers import SlowRegisters
+        slow = SlowRegisters(registers, mode=mode)
+        self._slow_addresses = slow._bind(self._device.max_bytes_per_MB)
+        self._slow = slow
+        return slow
+    
+    def record_raw(self,
+                   path: str,
+                   *,
+                   codec: str = 'zlib',
+                   level: int | None = None,
+                   overwrite: bool = False,
+                ) -> 'RawReadRecorder':
+        """
+        Log the raw return of every eStreamRead (interleaved data, device and LJM scan backlogs, host time of the
+        return) of the following shots, so that they can be reprocessed offline through the same stacking,
+        deinterleaving and derived channels with _raw_log.ReplayStreamIn. The reads are written by the stacking
+        worker thread, not the read loop. Replaces a recorder attached before (which is not closed).
+        
+        Args:
+            path (str)          : Log file (e.g., "session.ljrr").
+            codec (str)         : One of _shot_store.SHOT_STORE_CODECS; 'none' for the cheapest writes.
+                                default: 'zlib'
+            level (int)         : Compression level. None for the codec default (fast).
+            overwrite (bool)    : Whether to replace an existing file. default: False
+        
+        Returns:
+            _raw_log.RawReadRecorder object; close it (or use it as a context manager) to stop recording.
+        """
+        from _raw_log import RawReadRecorder
+        self._raw_recorder = RawReadRecorder(path, codec=codec, level=level, overwrite=overwrite)
+        return self._raw_recorder
+    
+    def _block_gaps(self) -> list[tuple[int, int]]:
+        """
+        (first scan, missing scans) of the gaps right before the block being stacked, for block handlers: `_gaps` may
+        already hold the gap of a later read, appended by the read loop meanwhile.
+        """
+        return [gap for gap in self._gaps if gap[0] == self._scans]
+    
+    def _ljm_stream_start(self, handle: int, scans_per_read: int, scan_list: list[int], scan_rate_Hz: float) -> None:
+        ljm.eStreamStart(handle, scans_per_read, len(scan_list), scan_list, scan_rate_Hz)
+    
+    def _ljm_stream_stop(self, handle: int) -> None:
+        ljm.eStreamStop(handle)
+    
+    def _scan_list(self) -> list[int]:
+        """
+        Addresses of the scan list: the streamed channels, the slow registers folded into the scans, then the
+        STREAM_OUT# channels (which return no data).
+        """
+        aScanList = list(ljm.namesToAddresses(self._num_channels, self._scan_channels)[0])
+        aScanList += self._slow_addresses
+        return aScanList + [stream_out.scan_address for stream_out in self._stream_outs]
+    
+    # >>>>> array views >>>>>
+    
+    def to_numpy(self) -> 'np.ndarray':
+        """
+        Capture buffer of the last shot as a (scans x channels) array, columns in the order of `scan_channels`.
+        No copy: `records[channel]['V']` are column views of the same buffer, and each shot allocates a new buffer, so
+        the arrays of earlier shots stay valid. Writing to it changes the records.
+        """
+        if self._records is None:
+            raise ValueError("StreamIn object has no records yet.")
+        return self._buffer
+    
+    def _time_index(self, absolute: bool) -> 'np.ndarray':
+        # seconds from scan 0 at the scan rate (gaps included), or absolute times from the shot clock;
+        # not records[...]['t'] (see to_dataframe())
+        if absolute:
+            return self.timestamps(as_datetime64=True)
+        return self.scan_indices()/self._scan_rate
+    
+    def to_dataframe(self, *, absolute_time: bool = False) -> 'pd.DataFrame':
+        """
+        pandas DataFrame (columns: channels, index: time) wrapping the capture buffer without copying it.
+        
+        Args:
+            absolute_time (bool)    : Whether to index by absolute time (datetime64, see `timestamps()`) instead of
+                                    seconds from scan 0. default: False
+        
+        Copies:
+            - The voltages are not copied (pandas keeps `to_numpy()` as its single block). Operations that build new
+              data copy as usual (arithmetic, `.dropna()`, `.astype()`, concatenating shots, selecting by row mask).
+              Column selection and slicing rows by position return views, which pandas Copy-on-Write copies lazily on
+              the first write.
+            - The time index is generated from the scan rate (or the shot clock) on each call.
+        
+        Time:
+            The index is the time of each scan, scan_indices()/scan_rate_Hz, shared by all channels of the scan. It is
+            not `records[channel]['t']`, which keeps the convention of LabJackaData2chData: the index of the sample in
+            the interleaved data over the scan rate, i.e., (scan*num_channels + channel index)/scan_rate_Hz, so
+            num_channels times the index plus a per-channel offset.
+        """
+        import pandas as pd
+        return pd.DataFrame(self.to_numpy(), index=pd.Index(self._time_index(absolute_time), name='t'),
+                            columns=list(self._scan_channels), copy=False)
+    
+    def to_xarray(self, *, absolute_time: bool = False) -> 'xr.DataArray':
+        """
+        xarray DataArray (dims: 't', 'channel') wrapping the capture buffer without copying it.
+        
+        Args:
+            absolute_time (bool)    : Whether the 't' coordinate is absolute time (datetime64) instead of seconds
+                                    from scan 0. default: False
+        
+        Copies:
+            - The voltages are not copied; `.sel()`/`.isel()` with slices return views, while arithmetic, reductions
+              and `.sel()`/`.isel()` with lists or masks return new arrays.
+            - The time coordinate is generated from the scan rate (or the shot clock) on each call.
+        
+        Time:
+            The 't' coordinate is the time of each scan, as the index of `to_dataframe()`, and differs from
+            `records[channel]['t']` (see `to_dataframe()`).
+        """
+        import xarray as xr
+        return xr.DataArray(self.to_numpy(), dims=('t', 'channel'),
+                            coords={'t': self._time_index(absolute_time), 'channel': list(self._scan_channels)},
+                            attrs={'scan_rate_Hz': self._scan_rate, 'units': 'V'})
+    
+    # <<<<< array views <<<<<
+    
+    # >>>>> timestamps >>>>>
+    
+    def scan_indices(self) -> 'np.ndarray':
+        """Scan index (counted from scan 0 of the shot, including the scans missing at gaps) of each record index."""
+        indices = np.arange(self._num_record_scans)
+        for first_scan, missing_scans in self._gaps:
+            indices[first_scan:] += missing_scans
+        return indices
+    
+    def timestamps(self, *, as_datetime64: bool = False) -> 'np.ndarray':
+        """
+        Absolute time of each scan of the records from the drift-corrected shot clock, computed on demand.
+        All channels of a scan share its time.
+        
+        Args:
+            as_datetime64 (bool)    : Whether to return numpy datetime64[ns] (UTC) instead of POSIX seconds.
+                                    default: False
+        """
+        if self._clock is None:
+            raise ValueError("StreamIn object has no records yet.")
+        times = scan_times(self._clock, self.scan_indices())
+        if as_datetime64:
+            return (times*1e9).astype('int64').astype('datetime64[ns]')
+        return times
+    
+    # <<<<< timestamps <<<<<
+    
+    # >>>>> skipped samples >>>>>
+    
+    def valid_segments(self, channel: str | None = None, *, min_length: int = 1) -> 'np.ndarray':
+        """
+        Contiguous spans of the records without skipped samples, from the skipped-span index (no rescan of the data).
+        
+        Args:
+            channel (str or None)   : Channel name. None for spans valid on all channels at once.
+            min_length (int)        : Drop segments shorter than this many scans. default: 1
+        
+        Returns:
+            (n x 2) int array of [start, stop) scan indices into `records[...]['V']`.
+        """
+        if self._records is None:
+            raise ValueError("StreamIn object has no records yet.")
+        if channel is None:
+            spans = np.concatenate(self._skipped_spans) if self._skipped_spans else np.empty((0, 2), dtype=np.int64)
+            spans = _union_spans(spans)
+        else:
+            spans = self._skipped_spans[self._scan_channels.index(channel)]
+        
+        # complement of the skipped spans within [0, num_record_scans)
+        starts = np.concatenate(([0], spans[:, 1]))
+        stops = np.concatenate((spans[:, 0], [self._num_record_scans]))
+        segments = np.stack((starts, stops), axis=1)
+        return segments[segments[:, 1] - segments[:, 0] >= max(1, min_length)]
+    
+    def valid_views(self, channel: str, *, min_length: int = 1, key: str = 'V') -> list['np.ndarray']:
+        """
+        NaN-free contiguous views (no copy) of `records[channel][key]`, one per valid segment of `channel`.
+        """
+        data = self._records[channel][key]
+        return [data[start:stop] for start, stop in self.valid_segments(channel, min_length=min_length)]
+    
+    # <<<<< skipped samples <<<<<
+    
+    # >>>>> resilience >>>>>
+    
+    # CORE_TIMER frequency by device type, to convert STREAM_START_TIME_STAMP to seconds
+    # https://support.labjack.com/docs/3-2-stream-mode-t-series-datasheet (STREAM_START_TIME_STAMP)
+    _CORE_TIMER_HZ = {LabJackDeviceTypeEnum.T4: 40e6, LabJackDeviceTypeEnum.T7: 40e6}
+    
+    def _mark_segment_start(self, first_scan: int, first_read: int) -> None:
+        """
+        Record when the current stream segment (i.e., since the last eStreamStart) started, by the host clock and,
+        if available, the device clock, so that scans missed until the next resume can be counted.
+        """
+        self._segment_first_scan = first_scan
+        self._segment_first_read = first_read
+        self._segment_start_host = time.monotonic()
+        self._segment_start_device = None
+        if self._device.device_type in self._CORE_TIMER_HZ:
+            try:
+                with self._device._command_lock:
+                    self._segment_start_device = ljm.eReadName(self._handle, "STREAM_START_TIME_STAMP")
+            except ljm.LJMError:
+                pass
+    
+    def _count_missing_scans(self, ir: int) -> int:
+        """
+        Number of scans missed between the end of the data read in the previous segment (ending before read `ir`) and
+        the start of the new segment. Call right after eStreamStart of the new segment.
+        """
+        prev_first_scan = self._segment_first_scan
+        prev_start_host, prev_start_device = self._segment_start_host, self._segment_start_device
+        scans_read = (ir - self._segment_first_read)*self._scans_per_read
+        self._mark_segment_start(first_scan=0, first_read=ir)
+        
+        elapsed = self._segment_start_host - prev_start_host
+        if prev_start_device is not None and self._segment_start_device is not None:
+            # device clock: exact up to the 32-bit CORE_TIMER roll-over, which the host clock resolves
+            f_timer = self._CORE_TIMER_HZ[self._device.device_type]
+            period = 2**32/f_timer
+            elapsed_device = ((int(self._segment_start_device) - int(prev_start_device)) % 2**32)/f_timer
+            elapsed = elapsed_device + round((elapsed - elapsed_device)/period)*period
+        
+        new_first_scan = prev_first_scan + int(round(elapsed*self._scan_rate))
+        missing_scans = max(0, new_first_scan - (prev_first_scan + scans_read))
+        self._segment_first_scan = prev_first_scan + scans_read + missing_scans
+        return missing_scans
+    
+    def _resume_stream(self, ljmex: Exception, ir: int) -> int:
+        """
+        Reconnect, re-apply the stream/trigger configuration and restart the stream after a recoverable error
+        raised before read `ir`. Record the missing scans as a gap.
+        
+        Returns:
+            int: new handle
+        Raises:
+            ljmex if all reconnect attempts fail.
+        """
+        warnings.warn(f"Stream interrupted by a recoverable error ({ljmex}). Reconnecting...", UserWarning)
+        aScanList = self._scan_list()
+        while self._reconnects_left > 0:
+            self._reconnects_left -= 1
+            try:
+                with self._device._command_lock:
+                    self._ljm_stream_stop(self._handle)
+            except Exception:
+                pass
+            time.sleep(self._reconnect_delay)
+            try:
+                self._device.reconnect()
+                self._handle = self._device._handle
+                self._configure()
+                if self._do_trigger:
+                    self._configure_trigger()
+                with self._device._command_lock:
+                    for stream_out in self._stream_outs:
+                        # continue from the last scan read
+                        stream_out._start(self._handle, self._scan_rate,
+                                          stream_out._first_value + self._segment_scans_read)
+                    self._ljm_stream_start(self._handle, self._scans_per_read, aScanList, self._scan_rate)
+            except (ljm.LJMError, LabJackError) as ex:
+                print(f"\tReconnection failed ({ex}). {self._reconnects_left} attempt(s) left.", flush=True)
+                continue
+            
+            self._segment_scans_read = 0
+            missing_scans = self._count_missing_scans(ir)
+            self._gaps.append((ir*self._scans_per_read, missing_scans))
+            print(f"\tStream resumed at eStreamRead {ir + 1}. Missing scans = {missing_scans}", flush=True)
+            return self._handle
+        raise ljmex
+    
+    # <<<<< resilience <<<<<
         
     def _stream_in(self):
         # """Synchronous method that blocks until async stream finishes."""
@@ -445,6 +1164,7 @@ class StreamIn:
         """Synchronous method that blocks until streaming finishes.
         Works in both scripts and interactive (Jupyter/async) environments.
         """
+        import asyncio  # imported here to keep importing this module fast
         try:
             loop = asyncio.get_running_loop()
         except RuntimeError:
@@ -474,6 +1194,8 @@ class StreamIn:
         # if self._records is None:
         #     warnings.warn("StreamIn object is not yet ready. Waiting for records...", category=UserWarning)
         #     self._records_ready.wait()
+        from pprint import pformat
+        from textwrap import indent
         msg = ""
         msg += "Labjack streamed read data:"
         msg += f"\n\trecords = \n"
@@ -509,8 +1231,8 @@ if __name__ == "__main__":
     
     print(stream_in)
     print()
-    total_nans = np.sum([np.isnan(value['V']).sum() for value in stream_in.records.values()])
-    print(f"Recounting skipped total samples = {total_nans}")
+    for channel, spans in stream_in.skipped_spans.items():
+        print(f"{channel}: {np.sum(spans[:, 1] - spans[:, 0])} skipped samples in {len(spans)} span(s)")
     
     del lj_device
     
@@ -0,0 +1,149 @@
+from _ljm_aux import *
+
+import warnings
+from typing import Callable
+
+import numpy as np
+
+
+# first STREAM_OUT# address in a scan list (STREAM_OUT0 = 4800, ..., STREAM_OUT3 = 4803)
+STREAM_OUT_SCAN_ADDRESS = 4800
+STREAM_OUT_MAX_COUNT = 4
+
+# values the device stream-out buffer holds (STREAM_OUT#_BUFFER_SIZE of 16384 bytes, 2 bytes per value),
+# of which refills keep half ahead of the scan clock
+_BUFFER_VALUES = 8192
+_LEAD_VALUES = _BUFFER_VALUES//2
+
+
+class StreamOut:
+    """
+    Hardware-timed output of a waveform to a DAC or digital register through a STREAM_OUT# channel, clocked by the
+    scans of a StreamIn: STREAM_OUT# is appended to the scan list, so value k is output within scan k, after the
+    inputs of that scan are sampled. The inputs of scan k still see value k-1; the response to value k shows from
+    scan k+1 on (a fixed one-scan lag, plus the settling of the output).
+    https://support.labjack.com/docs/3-2-2-stream-out-t-series-datasheet
+
+    - A looped waveform that fits the device buffer is loaded once (LJM periodic stream-out).
+    - Otherwise the values are streamed (LJM aperiodic stream-out): the buffer is prefilled before eStreamStart and
+      refilled after each eStreamRead, keeping about half the buffer ahead of the scans acquired so far.
+      An eStreamRead period should therefore stay well below _LEAD_VALUES scans (see `scans_per_read`); refills
+      that come too late are counted in `underruns`.
+    - A finite, non-looped source holds its last value once exhausted.
+    - After a resume gap (see StreamIn reconnect_attempts), the output continues from the last scan read, i.e., it is
+      shifted by the missing scans.
+
+    Create with `LabJackDevice.stream_out()` and pass to `LabJackDevice.stream_in(..., stream_outs=[...])`.
+    """
+
+    # Read-only properties
+    @property
+    def target(self): return self._target
+    @property
+    def index(self): return self._index
+    @property
+    def loop(self): return self._loop
+    @property
+    def underruns(self): return self._underruns
+    @property
+    def values_written(self): return self._values_written
+
+    def __init__(self,
+                 target: str,
+                 source: 'np.ndarray | Callable[[int, int], np.ndarray]',
+                 *,
+                 index: int = 0,
+                 loop: bool = False,
+            ) -> None:
+        """
+        Parameters:
+            target (str)        : Register to output to, e.g., "DAC0", "DAC1", "FIO_STATE", "EIO_STATE".
+            source              : 1-D array of values (volts for DACs, bit states for digital registers), or a
+                                callable source(first_value_index, num_values) returning the next values.
+            index (int)         : STREAM_OUT# index (0-3), one per output of a stream. default: 0
+            loop (bool)         : Whether to repeat an array source. default: False
+        """
+        if not 0 <= index < STREAM_OUT_MAX_COUNT:
+            raise ValueError(f"Stream-out index should be 0 to {STREAM_OUT_MAX_COUNT - 1}.")
+        if not callable(source):
+            source = np.asarray(source, dtype=float).ravel()
+            if len(source) == 0:
+                raise ValueError("Stream-out source is empty.")
+        elif loop:
+            raise ValueError("loop is for array sources; a callable source generates its own repetition.")
+        self._target = target
+        self._source = source
+        self._index = int(index)
+        self._loop = bool(loop)
+        self._periodic = self._loop and len(source) <= _BUFFER_VALUES
+        self._values_written = 0
+        self._underruns = 0
+
+    @property
+    def scan_address(self) -> int:
+        return STREAM_OUT_SCAN_ADDRESS + self._index
+
+    def _values(self, first: int, num_values: int) -> 'np.ndarray':
+        if callable(self._source):
+            return np.asarray(self._source(first, num_values), dtype=float)
+        indices = np.arange(first, first + num_values)
+        if self._loop:
+            return self._source[indices % len(self._source)]
+        return self._source[np.minimum(indices, len(self._source) - 1)]
+
+    # >>>>> LJM calls >>>>>
+
+    def _start(self, handle: int, scan_rate_Hz: float, first_value: int = 0) -> None:
+        """Initialize the stream-out and prefill its buffer; call right before eStreamStart."""
+        target_address = ljm.nameToAddress(self._target)[0]
+        self._values_written = first_value
+        self._first_value = first_value
+        self._queue_free = None
+        if self._periodic:
+            values = np.roll(self._source, -(first_value % len(self._source)))
+            ljm.periodicStreamOut(handle, self._index, target_address, scan_rate_Hz, len(values), values.tolist())
+            return
+        ljm.initializeAperiodicStreamOut(handle, self._index, target_address, scan_rate_Hz)
+        self._write(handle, _LEAD_VALUES)
+
+    def _write(self, handle: int, num_values: int) -> None:
+        if self._queue_free is not None:
+            num_values = min(num_values, self._queue_free)  # free space of the LJM stream-out queue
+        if num_values <= 0:
+            return
+        values = self._values(self._values_written, num_values)
+        self._queue_free = ljm.writeAperiodicStreamOut(handle, self._index, len(values), values.tolist())
+        self._values_written += len(values)
+
+    def _refill(self, handle: int, scans_acquired: int) -> None:
+        """Top up the buffer to _LEAD_VALUES values ahead of `scans_acquired` (scans since _start)."""
+        if self._periodic:
+            return
+        lead = self._values_written - self._first_value - scans_acquired
+        if lead <= 0:
+            # the device ran out of values: skip ahead to stay aligned with the scans
+            self._underruns += 1
+            self._values_written = self._first_value + scans_acquired
+        if lead < _LEAD_VALUES:
+            self._write(handle, _LEAD_VALUES - max(lead, 0))
+
+    # <<<<< LJM calls <<<<<
+
+
+def refill_scans_per_read(stream_outs: list[StreamOut]) -> int | None:
+    """Largest scans_per_read leaving margin for the stream-out refills, or None if no stream-out is refilled."""
+    if any(not stream_out._periodic for stream_out in stream_outs):
+        return _LEAD_VALUES//2
+    return None
+
+
+def check_stream_outs(stream_outs: list[StreamOut], scans_per_read: int) -> None:
+    """Validate the stream-outs of a stream: distinct indices, refills frequent enough."""
+    indices = [stream_out.index for stream_out in stream_outs]
+    if len(set(indices)) != len(indices):
+        raise ValueError(f"Stream-outs should have distinct indices: {indices}")
+    max_scans_per_read = refill_scans_per_read(stream_outs)
+    if max_scans_per_read is not None and scans_per_read > max_scans_per_read:
+        warnings.warn(f"scans_per_read = {scans_per_read} leaves little margin for stream-out refills "
+                      f"(refilled once per eStreamRead, {_LEAD_VALUES} values ahead); underruns are likely.",
+                      UserWarning)
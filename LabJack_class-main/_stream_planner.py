@@ -0,0 +1,178 @@
+from _ljm_aux import *
+
+import math
+import time
+import warnings
+from typing import TypedDict, TYPE_CHECKING
+if TYPE_CHECKING:
+    from labjack_device import LabJackDevice
+
+
+# >>>>> device limits >>>>>
+# Approximate maximum stream sample rates (samples/s over all channels) by STREAM_RESOLUTION_INDEX for the
+# +-10 V range, from https://support.labjack.com/docs/a-1-data-rates-t-series-datasheet
+# Index 0 is the device default (= 1 for T7/T4 stream).
+# T8 samples its AINs simultaneously: its limits are per-channel scan rates (see _SIMULTANEOUS_SAMPLING).
+STREAM_MAX_SAMPLE_RATE_HZ = {
+    LabJackDeviceTypeEnum.T7: {0: 100e3, 1: 100e3, 2: 48e3, 3: 22e3, 4: 11e3, 5: 5.5e3, 6: 2.5e3, 7: 1.2e3, 8: 600.},
+    LabJackDeviceTypeEnum.T4: {0: 50e3, 1: 50e3, 2: 24e3, 3: 11e3, 4: 5.5e3, 5: 2.7e3},
+    LabJackDeviceTypeEnum.T8: {0: 40e3, 1: 40e3, 2: 20e3, 3: 10e3, 4: 5e3, 5: 2.5e3, 6: 1.2e3, 7: 600., 8: 300.},
+}
+_SIMULTANEOUS_SAMPLING = {LabJackDeviceTypeEnum.T8}
+
+# Approximate settling added per sample (in microseconds) by AIN_ALL_RANGE (+-V) on the T7, whose gain amplifier
+# needs longer settling at high gain. https://support.labjack.com/docs/analog-input-settling-time-app-note
+STREAM_RANGE_SETTLING_US = {10.0: 0., 1.0: 10., 0.1: 50., 0.01: 100.}
+
+# Approximate sustained stream throughput (samples/s) of each connection type.
+# cf. https://support.labjack.com/docs/3-2-stream-mode-t-series-datasheet
+STREAM_MAX_LINK_SAMPLE_RATE_HZ = {
+    LabJackConnectionTypeEnum.USB: 100e3,
+    LabJackConnectionTypeEnum.ETHERNET: 100e3,
+    LabJackConnectionTypeEnum.WIFI: 3e3,
+}
+
+# bytes per streamed sample on the wire, including the amortized packet overhead
+_STREAM_BYTES_PER_SAMPLE = 2.1
+
+# fraction of the maximum rate regarded as sustainable without skipped samples
+_SAFETY_MARGIN = 0.9
+
+# <<<<< device limits <<<<<
+
+
+class LabJackStreamPlanTypedDict(TypedDict):
+    sampling_rate_Hz: float             # requested sampling rate (over all channels)
+    max_sampling_rate_Hz: float         # estimated max sustainable sampling rate
+    limited_by: str                     # "ADC", "settling", "connection" or "link"
+    expected_skipped_fraction: float    # estimated fraction of skipped samples at the requested rate
+    sustainable: bool
+    suggested_sampling_rate_Hz: float   # requested rate if sustainable, otherwise the max sustainable rate
+    notes: list[str]
+
+
+def measure_link_throughput(device: 'LabJackDevice', *, num_trials: int = 20) -> float:
+    """
+    Measure the command-response throughput (bytes/s) of the connection with maximum-size register reads.
+    It is a lower bound of the stream throughput, as streaming does not wait for a round trip per packet.
+
+    Args:
+        device (LabJackDevice)  : Connected device (not streaming).
+        num_trials (int)        : Number of packets to time. default: 20
+    """
+    device._check_connection()
+    # read SERIAL_NUMBER (address 60028, UINT32) repeatedly in one packet: ~8 bytes of request+response per frame
+    num_frames = max(1, (int(device.max_bytes_per_MB) - 16)//8)
+    addresses = [60028]*num_frames
+    data_types = [ljm.constants.UINT32]*num_frames
+    try:
+        # hold the command lock throughout, so that other threads do not add to the timed round trips
+        with device._command_lock:
+            ljm.eReadAddresses(device._handle, num_frames, addresses, data_types)  # warm-up
+            start = time.perf_counter()
+            for _ in range(num_trials):
+                ljm.eReadAddresses(device._handle, num_frames, addresses, data_types)
+            elapsed = time.perf_counter() - start
+    except ljm.LJMError as ljmex:
+        raise LabJackError("LabJack library-level error") from ljmex
+    return num_trials*num_frames*4/elapsed
+
+
+def plan_stream(
+        device_type: LabJackDeviceTypeEnum,
+        connection_type: LabJackConnectionTypeEnum,
+        num_channels: int,
+        sampling_rate_Hz: float,
+        *,
+        resolution_index: int = 0,
+        ain_range: float = 10.0,
+        settling_us: float = 0.0,
+        link_throughput_Bps: float | None = None,
+    ) -> LabJackStreamPlanTypedDict:
+    """
+    Estimate the max sustainable stream sampling rate and the expected fraction of skipped samples.
+    See `LabJackDevice.plan_stream_in()`.
+    """
+    if num_channels < 1:
+        raise ValueError("num_channels should be 1 or bigger.")
+    notes = []
+
+    # ADC conversion rate
+    rates = STREAM_MAX_SAMPLE_RATE_HZ.get(device_type)
+    if rates is None:
+        raise ValueError(f"Stream rates of {device_type.name} are unknown.")
+    if resolution_index not in rates:
+        raise ValueError(f"STREAM_RESOLUTION_INDEX {resolution_index} is not valid for {device_type.name} "
+                         f"(valid: {sorted(rates)}).")
+    max_rate = rates[resolution_index]
+    if device_type in _SIMULTANEOUS_SAMPLING:
+        max_rate *= num_channels  # simultaneous sampling: the limit is per-channel scan rate
+    limited_by = "ADC"
+
+    # settling: explicit STREAM_SETTLING_US, or the range-dependent settling of the gain amplifier (T7)
+    if device_type is LabJackDeviceTypeEnum.T7:
+        range_settling = STREAM_RANGE_SETTLING_US.get(float(ain_range))
+        if range_settling is None:
+            notes.append(f"AIN range +-{ain_range} V is not a T7 range; no range settling assumed.")
+            range_settling = 0.
+        settling = max(float(settling_us), range_settling)
+    else:
+        settling = float(settling_us)
+    if settling > 0 and device_type not in _SIMULTANEOUS_SAMPLING:
+        settling_rate = 1/(1/max_rate + settling*1e-6)
+        if settling_rate < max_rate:
+            max_rate, limited_by = settling_rate, "settling"
+
+    # connection
+    connection_rate = STREAM_MAX_LINK_SAMPLE_RATE_HZ.get(connection_type, math.inf)
+    if connection_rate < max_rate:
+        max_rate, limited_by = connection_rate, "connection"
+    if link_throughput_Bps is not None:
+        link_rate = link_throughput_Bps/_STREAM_BYTES_PER_SAMPLE
+        if link_rate < max_rate:
+            max_rate, limited_by = link_rate, "link"
+            notes.append(f"Measured link throughput {link_throughput_Bps/1e3:.1f} kB/s limits the rate.")
+
+    sustainable_rate = _SAFETY_MARGIN*max_rate
+    expected_skipped = max(0.0, 1 - max_rate/sampling_rate_Hz)
+    sustainable = sampling_rate_Hz <= sustainable_rate
+    if not sustainable and expected_skipped == 0:
+        notes.append(f"Requested rate is within {100*(1 - _SAFETY_MARGIN):.0f} % of the estimated max; "
+                     "occasional skipped samples are possible.")
+
+    return LabJackStreamPlanTypedDict(
+        sampling_rate_Hz=float(sampling_rate_Hz),
+        max_sampling_rate_Hz=float(max_rate),
+        limited_by=limited_by,
+        expected_skipped_fraction=float(expected_skipped),
+        sustainable=bool(sustainable),
+        suggested_sampling_rate_Hz=float(sampling_rate_Hz if sustainable else sustainable_rate),
+        notes=notes,
+    )
+
+
+def apply_stream_plan(plan: LabJackStreamPlanTypedDict, policy: str) -> float:
+    """
+    Apply `policy` to a plan and return the sampling rate to use.
+
+    Args:
+        plan    : Result of plan_stream().
+        policy  : "reject"  : raise LabJackStreamPlanError if the requested rate is not sustainable.
+                  "clamp"   : use the suggested rate (with a warning) if the requested rate is not sustainable.
+                  "suggest" : warn with the suggested rate but keep the requested rate.
+    """
+    if policy not in ("reject", "clamp", "suggest"):
+        raise ValueError(f"Unknown stream plan policy: {policy}")
+    if plan['sustainable']:
+        return plan['sampling_rate_Hz']
+
+    msg = f"Sampling rate {plan['sampling_rate_Hz']:.6g} Hz is not sustainable "
+    msg += f"(estimated max {plan['max_sampling_rate_Hz']:.6g} Hz, limited by {plan['limited_by']}; "
+    msg += f"expected skipped fraction {plan['expected_skipped_fraction']:.1%})."
+    if policy == "reject":
+        raise LabJackStreamPlanError(msg + f" Suggested: {plan['suggested_sampling_rate_Hz']:.6g} Hz.")
+    if policy == "clamp":
+        warnings.warn(msg + f" Clamped to {plan['suggested_sampling_rate_Hz']:.6g} Hz.", UserWarning)
+        return plan['suggested_sampling_rate_Hz']
+    warnings.warn(msg + f" Suggested: {plan['suggested_sampling_rate_Hz']:.6g} Hz.", UserWarning)
+    return plan['sampling_rate_Hz']
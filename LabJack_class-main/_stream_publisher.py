@@ -0,0 +1,363 @@
+import json
+import time
+from datetime import datetime
+from multiprocessing import shared_memory, resource_tracker
+from typing import Iterator, TYPE_CHECKING
+
+import numpy as np
+if TYPE_CHECKING:
+    from _stream_in import StreamIn
+
+# Layout of the shared memory ring (all integers are int64):
+#   [0, 64)             header: magic, version, num_channels, slot_capacity, num_slots, write_seq, scan_rate (float64), -
+#   [64, 1088)          JSON-encoded list of channel names (zero padded)
+#   [1088, ...)         slot headers, _SLOT_FIELDS int64 per slot:
+#                       seq, shot, ir, first_scan, num_samples, device_scan_backlog, ljm_scan_backlog,
+#                       timestamp (float64, POSIX seconds)
+#   [aligned, ...)      slot data, slot_capacity float64 per slot (interleaved samples as returned by eStreamRead)
+#
+# Sequence protocol (seqlock per slot): the writer publishing block `s` into slot `s % num_slots` sets the slot's seq
+# to 2*s+1 (odd: being written), copies the data, sets it to 2*s+2 (even: complete) and finally sets write_seq to s+1.
+# A reader of block `s` checks that the slot's seq equals 2*s+2 before and after using the data.
+_MAGIC = 0x4C4A5150445F5247  # "LJQPD_RG"
+_VERSION = 1
+_HEADER_BYTES = 64
+_NAMES_BYTES = 1024
+_SLOT_FIELDS = 8
+_H_MAGIC, _H_VERSION, _H_NUM_CHANNELS, _H_SLOT_CAPACITY, _H_NUM_SLOTS, _H_WRITE_SEQ, _H_SCAN_RATE = range(7)
+_S_SEQ, _S_SHOT, _S_IR, _S_FIRST_SCAN, _S_NUM_SAMPLES, _S_DEVICE_BACKLOG, _S_LJM_BACKLOG, _S_TIMESTAMP = range(_SLOT_FIELDS)
+
+
+def _ring_layout(num_slots: int, slot_capacity: int) -> tuple[int, int]:
+    """Return (offset of slot data, total size in bytes) of the ring."""
+    offset_slots = _HEADER_BYTES + _NAMES_BYTES
+    offset_data = offset_slots + num_slots*_SLOT_FIELDS*8
+    offset_data = (offset_data + 63)//64*64  # cache-line aligned
+    return offset_data, offset_data + num_slots*slot_capacity*8
+
+
+class _StreamRing:
+    """NumPy views on the shared memory ring."""
+
+    def __init__(self, shm: shared_memory.SharedMemory) -> None:
+        self.shm = shm
+        buf = shm.buf
+        self.header = np.ndarray((_HEADER_BYTES//8,), dtype=np.int64, buffer=buf)
+        self.header_f = self.header.view(np.float64)
+        if self.header[_H_MAGIC] != _MAGIC:
+            raise ValueError(f"Shared memory '{shm.name}' is not a LabJack stream ring.")
+        if self.header[_H_VERSION] != _VERSION:
+            raise ValueError(f"Unsupported LabJack stream ring version: {self.header[_H_VERSION]}")
+        num_slots = int(self.header[_H_NUM_SLOTS])
+        slot_capacity = int(self.header[_H_SLOT_CAPACITY])
+        offset_data, _ = _ring_layout(num_slots, slot_capacity)
+        self.slots = np.ndarray((num_slots, _SLOT_FIELDS), dtype=np.int64, buffer=buf,
+                                offset=_HEADER_BYTES + _NAMES_BYTES)
+        self.slots_f = self.slots.view(np.float64)
+        self.data = np.ndarray((num_slots, slot_capacity), dtype=np.float64, buffer=buf, offset=offset_data)
+        names = bytes(buf[_HEADER_BYTES:_HEADER_BYTES + _NAMES_BYTES]).rstrip(b"\0")
+        self.channels = json.loads(names.decode())
+
+    def release(self) -> None:
+        self.header = self.header_f = self.slots = self.slots_f = self.data = None
+
+
+class StreamPublisher:
+    """
+    Single writer of a named shared memory ring that publishes each eStreamRead block of a `StreamIn`
+    to local consumer processes (live plotting, watchdog, analysis, ...). See `StreamSubscriber` for the reader side.
+
+    Publishing never waits for readers: the oldest block is overwritten when the ring is full, and readers detect it
+    from the sequence numbers.
+
+    Intended to be created by `StreamIn.publish()`.
+    """
+
+    # Read-only properties
+    @property
+    def name(self): return self._shm.name
+    @property
+    def num_slots(self): return self._num_slots
+    @property
+    def slot_capacity(self): return self._slot_capacity
+    @property
+    def num_published(self): return int(self._ring.header[_H_WRITE_SEQ])
+
+    def __init__(self,
+                 name: str | None,
+                 scan_channels: list[str],
+                 scan_rate_Hz: float,
+                 samples_per_block: int,
+                 *,
+                 num_slots: int = 16,
+            ) -> None:
+        """
+        Parameters:
+            name (str or None)      : Name of the shared memory block. None for a random name (see `name`).
+            scan_channels (list)    : Names of the streamed channels.
+            scan_rate_Hz (float)    : Scan rate per channel.
+            samples_per_block (int) : Maximum number of samples (over all channels) per block.
+            num_slots (int)         : Number of blocks kept in the ring. default: 16
+        """
+        if num_slots < 2:
+            raise ValueError("num_slots should be 2 or bigger.")
+        names = json.dumps(list(scan_channels)).encode()
+        if len(names) > _NAMES_BYTES:
+            raise ValueError("Too many or too long channel names for the stream ring header.")
+
+        self._num_slots = num_slots = int(num_slots)
+        self._slot_capacity = slot_capacity = int(samples_per_block)
+        _, size = _ring_layout(num_slots, slot_capacity)
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        buf = self._shm.buf
+        header = np.ndarray((_HEADER_BYTES//8,), dtype=np.int64, buffer=buf)
+        header[:] = 0
+        header[_H_VERSION] = _VERSION
+        header[_H_NUM_CHANNELS] = len(scan_channels)
+        header[_H_SLOT_CAPACITY] = slot_capacity
+        header[_H_NUM_SLOTS] = num_slots
+        header.view(np.float64)[_H_SCAN_RATE] = scan_rate_Hz
+        buf[_HEADER_BYTES:_HEADER_BYTES + len(names)] = names
+        header[_H_MAGIC] = _MAGIC  # written last: marks the ring as initialized
+        del header
+        self._ring = _StreamRing(self._shm)
+        self._ring.slots[:] = 0
+        self._shot = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def __del__(self) -> None:
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def publish(self,
+                a_data: np.ndarray,
+                *,
+                ir: int = 0,
+                first_scan: int = 0,
+                device_scan_backlog: int = 0,
+                ljm_scan_backlog: int = 0,
+                timestamp: datetime | None = None,
+            ) -> int:
+        """
+        Write a block of interleaved samples into the next slot, overwriting the oldest block.
+        A new shot is counted when `ir` is 0.
+
+        Returns:
+            int: sequence number of the published block.
+        """
+        ring = self._ring
+        num_samples = len(a_data)
+        if num_samples > self._slot_capacity:
+            raise ValueError(f"Block of {num_samples} samples exceeds the slot capacity {self._slot_capacity}.")
+        if ir == 0:
+            self._shot += 1
+
+        seq = int(ring.header[_H_WRITE_SEQ])
+        slot = seq % self._num_slots
+        meta = ring.slots[slot]
+        meta[_S_SEQ] = 2*seq + 1
+        ring.data[slot, :num_samples] = a_data
+        meta[_S_SHOT] = self._shot
+        meta[_S_IR] = ir
+        meta[_S_FIRST_SCAN] = first_scan
+        meta[_S_NUM_SAMPLES] = num_samples
+        meta[_S_DEVICE_BACKLOG] = device_scan_backlog
+        meta[_S_LJM_BACKLOG] = ljm_scan_backlog
+        ring.slots_f[slot, _S_TIMESTAMP] = (timestamp or datetime.now()).timestamp()
+        meta[_S_SEQ] = 2*seq + 2
+        ring.header[_H_WRITE_SEQ] = seq + 1
+        return seq
+
+    def _on_block(self, stream_in: 'StreamIn', ir: int, a_data: np.ndarray,
+                  device_scan_backlog: int, ljm_scan_backlog: int, timestamp_read_return: datetime) -> None:
+        """StreamIn block handler (see StreamIn.add_block_handler())."""
+        self.publish(a_data, ir=ir, first_scan=stream_in._scans,
+                     device_scan_backlog=device_scan_backlog, ljm_scan_backlog=ljm_scan_backlog,
+                     timestamp=timestamp_read_return)
+
+    def close(self) -> None:
+        """Remove the shared memory ring. Attached readers keep their mapping until they detach."""
+        if getattr(self, "_ring", None) is None:
+            return
+        self._ring.release()
+        self._ring = None
+        self._shm.close()
+        self._shm.unlink()
+
+
+class StreamBlock:
+    """
+    A block read from a `StreamSubscriber`. `data` is a zero-copy (scans x channels) view on the shared ring.
+    The writer may overwrite the slot at any time: check `valid()` after using `data`, or use `copy()`.
+    """
+
+    def __init__(self, ring: _StreamRing, seq: int, slot: int, meta: np.ndarray, timestamp: float) -> None:
+        self._ring = ring
+        self.seq = seq
+        self._slot = slot
+        self.shot = int(meta[_S_SHOT])
+        self.ir = int(meta[_S_IR])
+        self.first_scan = int(meta[_S_FIRST_SCAN])
+        self.device_scan_backlog = int(meta[_S_DEVICE_BACKLOG])
+        self.ljm_scan_backlog = int(meta[_S_LJM_BACKLOG])
+        self.timestamp = datetime.fromtimestamp(timestamp)
+        num_channels = len(ring.channels)
+        num_samples = int(meta[_S_NUM_SAMPLES])
+        self.data = ring.data[slot, :num_samples - num_samples % num_channels].reshape(-1, num_channels)
+
+    @property
+    def channels(self): return self._ring.channels
+
+    def valid(self) -> bool:
+        """Whether the slot still holds this block (i.e., `data` has not been overwritten)."""
+        return self._ring.slots is not None and int(self._ring.slots[self._slot, _S_SEQ]) == 2*self.seq + 2
+
+    def copy(self) -> np.ndarray:
+        """
+        Return a private copy of `data`.
+
+        Raises:
+            LookupError: if the block was overwritten before or while copying.
+        """
+        data = self.data.copy()
+        if not self.valid():
+            raise LookupError(f"Stream block {self.seq} was overwritten.")
+        return data
+
+    def __getitem__(self, channel: str) -> np.ndarray:
+        """Zero-copy view of one channel."""
+        return self.data[:, self._ring.channels.index(channel)]
+
+
+class StreamSubscriber:
+    """
+    Reader client of a stream ring published by `StreamIn.publish()` (or `StreamPublisher`).
+    Readers attach and detach at will and never slow down the writer; blocks overwritten before being read are
+    skipped and counted in `overruns`.
+
+    Example usage (in another process):
+        with StreamSubscriber("labjack_stream") as sub:
+            for block in sub.blocks(timeout_s=5):
+                x = block["AIN1"]   # zero-copy view
+                ...
+                if not block.valid(): # overwritten while in use
+                    continue
+    """
+
+    # Read-only properties
+    @property
+    def name(self): return self._shm.name
+    @property
+    def channels(self): return self._ring.channels
+    @property
+    def scan_rate_Hz(self): return float(self._ring.header_f[_H_SCAN_RATE])
+    @property
+    def overruns(self): return self._overruns
+    @property
+    def next_seq(self): return self._next_seq
+
+    def __init__(self, name: str, *, from_oldest: bool = False) -> None:
+        """
+        Parameters:
+            name (str)          : Name of the shared memory ring.
+            from_oldest (bool)  : Whether to start from the oldest block still in the ring instead of the next new one.
+                                default: False
+        """
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, track=False)  # Python >= 3.13
+        except TypeError:
+            self._shm = shared_memory.SharedMemory(name=name)
+            # the ring is owned by the publisher: keep this process's resource tracker from unlinking it at exit
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+        self._ring = _StreamRing(self._shm)
+        self._overruns = 0
+        write_seq = self._write_seq()
+        self._next_seq = max(0, write_seq - self._ring.slots.shape[0] + 1) if from_oldest else write_seq
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def __del__(self) -> None:
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def _write_seq(self) -> int:
+        return int(self._ring.header[_H_WRITE_SEQ])
+
+    def _read(self, seq: int) -> StreamBlock | None:
+        ring = self._ring
+        slot = seq % ring.slots.shape[0]
+        meta = ring.slots[slot].copy()
+        timestamp = float(ring.slots_f[slot, _S_TIMESTAMP])
+        if int(meta[_S_SEQ]) != 2*seq + 2:
+            return None
+        block = StreamBlock(ring, seq, slot, meta, timestamp)
+        return block if block.valid() else None
+
+    def latest(self) -> StreamBlock | None:
+        """Return the most recently published block (or None if nothing is published yet) without consuming blocks."""
+        write_seq = self._write_seq()
+        if write_seq == 0:
+            return None
+        return self._read(write_seq - 1)
+
+    def poll(self) -> StreamBlock | None:
+        """Return the next unread block, or None if no new block is available. Never blocks."""
+        while True:
+            write_seq = self._write_seq()
+            if self._next_seq >= write_seq:
+                return None
+            oldest = write_seq - self._ring.slots.shape[0] + 1  # keep one slot of margin for the writer
+            if self._next_seq < oldest:
+                self._overruns += oldest - self._next_seq
+                self._next_seq = oldest
+            block = self._read(self._next_seq)
+            if block is None:  # overwritten meanwhile
+                self._overruns += 1
+                self._next_seq += 1
+                continue
+            self._next_seq += 1
+            return block
+
+    def blocks(self, timeout_s: float | None = None, poll_interval_s: float = 1e-3) -> Iterator[StreamBlock]:
+        """
+        Yield blocks as they are published.
+
+        Args:
+            timeout_s (float or None)   : Stop after this long without a new block. None to wait indefinitely.
+            poll_interval_s (float)     : Sleep between checks for new blocks.
+        """
+        last = time.monotonic()
+        while True:
+            block = self.poll()
+            if block is not None:
+                last = time.monotonic()
+                yield block
+                continue
+            if timeout_s is not None and time.monotonic() - last > timeout_s:
+                return
+            time.sleep(poll_interval_s)
+
+    def close(self) -> None:
+        """Detach from the ring."""
+        if getattr(self, "_ring", None) is None:
+            return
+        self._ring.release()
+        self._ring = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # blocks handed out still reference the ring; the mapping is released with them.
+            pass
@@ -0,0 +1,129 @@
+from _ljm_aux import *
+
+import ctypes
+import time
+from datetime import datetime
+from typing import TypedDict
+
+import numpy as np
+
+
+def _ljm_stream_read_function():
+    """LJM_eStreamRead of the loaded LJM library, or None if it cannot be reached (e.g., other ljm versions)."""
+    try:
+        from labjack.ljm import ljm as ljm_module
+        function = ljm_module._staticLib.LJM_eStreamRead
+        ljm_module._g_eStreamDataSize  # size of aData per handle, set by eStreamStart
+    except (ImportError, AttributeError):
+        return None
+    return function
+
+
+class StreamReader:
+    """
+    eStreamRead without materializing the data as a Python list.
+
+    `ljm.eStreamRead()` allocates a ctypes array per call and converts it to a list of Python floats, which the
+    caller converts back to an array: two per-sample conversions that dominate the CPU time at high rates.
+    StreamReader calls the C function LJM_eStreamRead through ctypes into one preallocated ctypes.c_double buffer,
+    exposed to numpy with np.frombuffer (no copy, no per-sample object). It falls back to `ljm.eStreamRead()` when
+    the C function cannot be reached (see `fast`).
+
+    The returned array is a view of the reused buffer: copy it (e.g., np.copyto into a shot buffer) before the next
+    read.
+
+    ljm methods used:
+    - https://support.labjack.com/docs/estreamread-ljm-user-s-guide
+    """
+
+    # Read-only properties
+    @property
+    def fast(self): return self._function is not None
+
+    def __init__(self, *, fast: bool = True) -> None:
+        """
+        Parameters:
+            fast (bool) : Whether to use the ctypes path when available. default: True
+        """
+        self._function = _ljm_stream_read_function() if fast else None
+        self._buffer = None
+        self._array = None
+        self._device_backlog = ctypes.c_int32(0)
+        self._ljm_backlog = ctypes.c_int32(0)
+
+    def read(self, handle: int) -> tuple['np.ndarray', int, int]:
+        """
+        Returns:
+            (interleaved data, device scan backlog, LJM scan backlog), as ljm.eStreamRead()
+        Raises:
+            ljm.LJMError as ljm.eStreamRead()
+        """
+        if self._function is None:
+            data, device_backlog, ljm_backlog = ljm.eStreamRead(handle)
+            return np.array(data, dtype=float), device_backlog, ljm_backlog
+        from labjack.ljm import ljm as ljm_module
+        num_values = ljm_module._g_eStreamDataSize.get(handle)
+        if num_values is None:
+            raise ljm.LJMError(errorString="Streaming has not been started for the given handle. "
+                                           "Please call eStreamStart first.")
+        if self._array is None or len(self._array) != num_values:
+            self._buffer = (ctypes.c_double*num_values)()
+            self._array = np.frombuffer(self._buffer, dtype=np.float64)
+        error = self._function(handle, ctypes.byref(self._buffer),
+                               ctypes.byref(self._device_backlog), ctypes.byref(self._ljm_backlog))
+        if error != ljm.errorcodes.NOERROR:
+            raise ljm.LJMError(error)
+        return self._array, self._device_backlog.value, self._ljm_backlog.value
+
+    def timestamp(self) -> datetime:
+        """Host time of the return of the last read (called right after `read()`)."""
+        return datetime.now()
+
+
+class LabJackStreamReadBenchTypedDict(TypedDict):
+    """Result of `benchmark_stream_read()` for one path."""
+    path: str
+    num_values: int
+    us_per_read: float
+    MSps: float  # million samples converted per second
+
+
+def benchmark_stream_read(
+        num_values: int = 100_000,
+        *,
+        repeat: int = 20,
+    ) -> list[LabJackStreamReadBenchTypedDict]:
+    """
+    Host-side cost of getting one eStreamRead block of `num_values` samples into a numpy shot buffer, without a
+    device (the LJM call itself is the same for both paths):
+    - 'list': as ljm.eStreamRead() + np.array(), i.e., new ctypes array -> list of floats -> array
+    - 'ctypes': reused ctypes buffer -> np.frombuffer view -> np.copyto into the shot buffer
+
+    Returns:
+        list of LabJackStreamReadBenchTypedDict, best of `repeat`
+    """
+    source = np.sin(np.arange(num_values)*1e-3)
+    out = np.empty(num_values)
+
+    def list_path():
+        c_data = (ctypes.c_double*num_values)()  # allocated per call by ljm.eStreamRead
+        ctypes.memmove(c_data, source.ctypes.data, source.nbytes)  # stands for LJM filling the buffer
+        out[:] = np.array(c_data[:], dtype=float)
+
+    c_buffer = (ctypes.c_double*num_values)()
+    view = np.frombuffer(c_buffer, dtype=np.float64)
+
+    def ctypes_path():
+        ctypes.memmove(c_buffer, source.ctypes.data, source.nbytes)
+        np.copyto(out, view)
+
+    results = []
+    for path, function in (('list', list_path), ('ctypes', ctypes_path)):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            best = min(best, time.perf_counter() - start)
+        results.append(LabJackStreamReadBenchTypedDict(
+            path=path, num_values=num_values, us_per_read=best*1e6, MSps=num_values/best/1e6))
+    return results
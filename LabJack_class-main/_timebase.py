@@ -0,0 +1,147 @@
+import bisect
+import math
+from datetime import datetime, timezone
+from typing import TypedDict, TYPE_CHECKING
+
+import numpy as np
+if TYPE_CHECKING:
+    from _stream_in import StreamIn
+
+
+class LabJackShotClockTypedDict(TypedDict):
+    start_time_s: float     # host POSIX time of scan 0 of the shot
+    scan_rate_Hz: float     # nominal scan rate per channel
+    clock_ratio: float      # estimated actual/nominal scan rate (device clock relative to the host clock)
+    residual_s: float       # RMS residual of the fit over the points used
+    num_points: int         # number of eStreamRead returns used in the fit
+
+
+def fit_shot_clock(
+        read_times_s: 'np.ndarray',
+        acquired_scans: 'np.ndarray',
+        scan_rate_Hz: float,
+        *,
+        max_clock_error: float = 1e-3,
+    ) -> LabJackShotClockTypedDict:
+    """
+    Fit the host times at which eStreamRead returned against the number of scans acquired by then
+        read_time = start_time + acquired_scans/(scan_rate*clock_ratio) + latency
+    Latency is never negative, so after a least-squares fit the points above the median residual (i.e., the late
+    returns) are dropped and the line is fitted again to the least delayed ones.
+
+    Args:
+        read_times_s (array)    : Host POSIX time (s) at which each eStreamRead returned.
+        acquired_scans (array)  : Scans acquired by the device at each return (scans read + scan backlogs).
+        scan_rate_Hz (float)    : Nominal scan rate per channel.
+        max_clock_error (float) : Largest plausible |clock_ratio - 1|. A fit beyond it (e.g., reads returning in
+                                bursts) falls back to the nominal rate. default: 1e-3
+    """
+    t = np.asarray(read_times_s, dtype=float)
+    n = np.asarray(acquired_scans, dtype=float)
+    if len(t) == 0:
+        raise ValueError("No eStreamRead return to fit.")
+    if len(t) < 3 or np.ptp(n) == 0:
+        return _nominal_clock(t, n, scan_rate_Hz)
+
+    # fit relative to the first return to keep the float64 precision of POSIX times
+    t_ref = t[0]
+    slope, intercept = np.polyfit(n, t - t_ref, 1)
+    residuals = t - t_ref - (slope*n + intercept)
+    use = residuals <= np.median(residuals)
+    if np.count_nonzero(use) >= 2 and np.ptp(n[use]) > 0:
+        slope, intercept = np.polyfit(n[use], t[use] - t_ref, 1)
+        residuals = t[use] - t_ref - (slope*n[use] + intercept)
+
+    clock_ratio = 1/(slope*scan_rate_Hz)
+    if not abs(clock_ratio - 1) <= max_clock_error:
+        return _nominal_clock(t, n, scan_rate_Hz)
+    return LabJackShotClockTypedDict(
+        start_time_s=float(t_ref + intercept),
+        scan_rate_Hz=float(scan_rate_Hz),
+        clock_ratio=float(clock_ratio),
+        residual_s=float(np.sqrt(np.mean(residuals**2))),
+        num_points=int(np.count_nonzero(use)),
+    )
+
+
+def _nominal_clock(t: 'np.ndarray', n: 'np.ndarray', scan_rate_Hz: float) -> LabJackShotClockTypedDict:
+    # nominal rate through the least delayed return
+    start = t - n/scan_rate_Hz
+    return LabJackShotClockTypedDict(start_time_s=float(np.min(start)), scan_rate_Hz=float(scan_rate_Hz),
+                                     clock_ratio=1.0, residual_s=float(np.std(start)), num_points=int(len(t)))
+
+
+def scan_times(clock: LabJackShotClockTypedDict, scan_indices: 'np.ndarray') -> 'np.ndarray':
+    """Host POSIX times (s) of the scans at `scan_indices` (counted from scan 0 of the shot, including gaps)."""
+    return clock['start_time_s'] + np.asarray(scan_indices)/(clock['scan_rate_Hz']*clock['clock_ratio'])
+
+
+def clock_datetime(clock: LabJackShotClockTypedDict) -> datetime:
+    """Start time of a shot as a timezone-aware UTC datetime."""
+    return datetime.fromtimestamp(clock['start_time_s'], tz=timezone.utc)
+
+
+class ShotTimeIndex:
+    """
+    Map wall-clock ranges to scan ranges across many shots in O(log n) (n: number of shots).
+
+    Shots are kept sorted by start time, and a time range is located by bisection over the start times, looking back
+    by the longest shot duration (shots may overlap, e.g., from several devices or by the jitter of the fits).
+
+    e.g.,
+        index = ShotTimeIndex()
+        index.attach(stream_in)  # index every shot; keys are shot counts from 0
+        ...
+        for key, scan_start, scan_stop in index.locate(t_start, t_stop):
+            ...  # records of shot `key`, scans [scan_start, scan_stop)
+    """
+
+    def __init__(self) -> None:
+        self._starts = []   # start time (s) of each shot, sorted
+        self._shots = []    # (key, clock, num_scans, end time) of each shot, in the order of self._starts
+        self._max_duration = 0.0
+        self._num_attached = 0
+
+    def __len__(self) -> int:
+        return len(self._shots)
+
+    def add(self, key, clock: LabJackShotClockTypedDict, num_scans: int) -> None:
+        """
+        Add a shot of `num_scans` scans (counted including gaps) timed by `clock`. Shots may be added in any order.
+        """
+        start = clock['start_time_s']
+        end = float(scan_times(clock, num_scans))
+        i = bisect.bisect_right(self._starts, start)
+        self._starts.insert(i, start)
+        self._shots.insert(i, (key, clock, int(num_scans), end))
+        self._max_duration = max(self._max_duration, end - start)
+
+    def attach(self, stream_in: 'StreamIn') -> None:
+        """Add every completed shot of `stream_in`, keyed by the count of shots attached so far."""
+        def handler(stream_in: 'StreamIn') -> None:
+            if stream_in.clock is not None:
+                self.add(self._num_attached, stream_in.clock, stream_in.num_record_scans + stream_in.missing_scans)
+            self._num_attached += 1
+        stream_in.add_shot_handler(handler)
+
+    def locate(self, t_start_s: float, t_stop_s: float) -> list[tuple[object, int, int]]:
+        """
+        Scan ranges covering host POSIX times [t_start_s, t_stop_s).
+
+        Returns:
+            list of (key, scan_start, scan_stop) of each overlapping shot, in order of start time. Scan indices count gaps;
+            see `StreamIn.scan_indices` to map them to record indices.
+        """
+        first = bisect.bisect_left(self._starts, t_start_s - self._max_duration)
+        last = bisect.bisect_left(self._starts, t_stop_s)
+        located = []
+        for i in range(first, last):
+            key, clock, num_scans, end = self._shots[i]
+            if end <= t_start_s:
+                continue
+            rate = clock['scan_rate_Hz']*clock['clock_ratio']
+            scan_start = max(0, math.ceil((t_start_s - clock['start_time_s'])*rate))
+            scan_stop = min(num_scans, math.ceil((t_stop_s - clock['start_time_s'])*rate))
+            if scan_stop > scan_start:
+                located.append((key, scan_start, scan_stop))
+        return located
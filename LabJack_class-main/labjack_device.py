@@ -1,9 +1,16 @@
-from labjack import ljm
 from _ljm_aux import *
+from contextlib import nullcontext
 from datetime import datetime
-from typing import TYPE_CHECKING
+import threading
+from _profiler import NULL_PROFILER
+from typing import Callable, TYPE_CHECKING
 if TYPE_CHECKING:
     from _stream_in import StreamIn
+    from _stream_planner import LabJackStreamPlanTypedDict
+    from _stream_out import StreamOut
+    from _poller import RegisterPoller
+    from _profiler import AcquisitionProfiler
+    import numpy as np
 
 class LabJackDevice:
     """
@@ -23,6 +30,14 @@ class LabJackDevice:
         with LabJackDevice(device_identifier='192.168.1.120') as device:
             stream_data = lj.stream()
             # process stream_data ...
+    
+    Thread safety:
+    - Every command-response ljm call on the handle (configuration, register reads, stream start/stop, stream-out
+      writes, ...) is made while holding `command_lock`, and only for that call, so that threads configuring,
+      polling and streaming interleave call by call. Hold it too around direct ljm calls on `_handle`.
+    - A stream is owned by one object at a time (see `stream_owner`): a stream start while another object streams
+      raises LabJackStreamBusyError instead of disturbing it. eStreamRead is called under the stream ownership
+      only, as it waits for the stream data rather than making a command-response round trip.
     """
     
     # >>>>> class setting >>>>>
@@ -42,12 +57,21 @@ class LabJackDevice:
     def port(self): return self._port
     @property
     def max_bytes_per_MB(self): return self._max_bytes_per_MB
+    @property
+    def command_lock(self): return self._command_lock
+    @property
+    def stream_owner(self): return self._stream_owner
+    @property
+    def profiler(self): return self._profiler
 
     def __init__(
             self,
             device_type: LabJackDeviceTypeEnum, 
             connection_type: LabJackConnectionTypeEnum,
-            device_identifier: str
+            device_identifier: str,
+            *,
+            connect_timeout_s: float | None = None,
+            profiler: 'AcquisitionProfiler | None' = None,
         ) -> None:
         """
         Initialize the LabJackDevice.
@@ -56,11 +80,17 @@ class LabJackDevice:
             device_type: An enum value indicating the LabJack device type (e.g., LabJackDeviceTypeEnum.T7).
             connection_type: An enum value indicating the connection type (e.g., LabJackConnectionTypeEnum.ETHERNET).
             device_identifier: The device identifier (e.g., IP address or serial number).
+            connect_timeout_s: Timeout (in seconds) for opening a TCP (Ethernet/WiFi) connection.
+                               None for the LJM default (LJM_OPEN_TCP_DEVICE_TIMEOUT_MS).
+                               cf. To connect to many devices concurrently, see `_discovery.connect_devices()`.
+            profiler: _profiler.AcquisitionProfiler timing the acquisition stages from the connection on.
+                      None to disable profiling (see `enable_profiling()`).
         """
         # Connection configuration
         self._device_type = device_type
         self._connection_type = connection_type
         self._device_identifier = device_identifier
+        self._connect_timeout = connect_timeout_s
         
         self._handle = None
         self._serial_number = None
@@ -68,6 +98,14 @@ class LabJackDevice:
         self._port = None
         self._max_bytes_per_MB = None
         self._device_info = None
+        
+        # thread safety
+        self._command_lock = threading.RLock()  # held around each command-response ljm call
+        self._stream_owner_lock = threading.Lock()
+        self._stream_owner = None  # object streaming on this device
+        
+        # acquisition stage timing (no-op unless enabled)
+        self._profiler = profiler if profiler is not None else NULL_PROFILER
 
         self._connect()
         print()
@@ -120,11 +158,16 @@ class LabJackDevice:
         
         
         # Open device (using names of enums)
+        # the timeout is library-wide: LabJackOpenTCPTimeout shares it with the connections being opened concurrently
+        open_timeout = nullcontext()
+        if self._connect_timeout is not None and self._connection_type is not LabJackConnectionTypeEnum.USB:
+            open_timeout = LabJackOpenTCPTimeout(int(self._connect_timeout*1000))
         try:
             start = datetime.now()
-            self._handle = ljm.openS(self._device_type.name,
-                                    self._connection_type.name,
-                                    self._device_identifier)
+            with open_timeout, self._profiler.span('connect'), self._command_lock:
+                self._handle = ljm.openS(self._device_type.name,
+                                        self._connection_type.name,
+                                        self._device_identifier)
             end = datetime.now()
         except ljm.LJMError as ljmex:
             raise LabJackConnectionError("LabJack library-level error") from ljmex
@@ -162,7 +205,8 @@ class LabJackDevice:
         try:
             # ask ljm library for the disconnetion
             start = datetime.now()
-            ljm.close(self._handle)
+            with self._profiler.span('disconnect'), self._command_lock:
+                ljm.close(self._handle)
             end = datetime.now()
             td_exe = end - start
         except ljm.LJMError as ljmex:
@@ -175,7 +219,74 @@ class LabJackDevice:
 
         print(f"Done. Execution time: {td_exe.total_seconds():.6f} s")
         
+    def reconnect(self) -> None:
+        """
+        Close the connection, ignoring errors (e.g., when the link is already down), and connect again.
+        The device info is reloaded; the register configuration kept by the device is not touched.
+        Other threads wait for the new handle (`command_lock` is held throughout).
+        """
+        with self._command_lock:
+            if getattr(self, "_handle", None) is not None:
+                try:
+                    self._disconnect()
+                except LabJackDisconnectionError:
+                    print("Failed (ignored).")
+            self._connect()
+        
     # <<<<< LabJack connection <<<<<
+    
+    
+    
+    # >>>>> profiling >>>>>
+    
+    def enable_profiling(self, profiler: 'AcquisitionProfiler | None' = None) -> 'AcquisitionProfiler':
+        """
+        Time the acquisition stages (configure, trigger arm/wait, each read, stacking, deinterleave, record assembly,
+        ...) of this device and its streams, e.g.,
+            profiler = device.enable_profiling()
+            stream_in._stream_in()
+            print(profiler.format_report())
+            profiler.export_chrome_trace("acquisition.json")
+        
+        Args:
+            profiler (AcquisitionProfiler)  : Profiler to record into (e.g., shared by several devices).
+                                            None for a new one.
+        
+        Returns:
+            _profiler.AcquisitionProfiler object
+        """
+        from _profiler import AcquisitionProfiler
+        self._profiler = profiler if profiler is not None else AcquisitionProfiler()
+        return self._profiler
+    
+    def disable_profiling(self) -> None:
+        self._profiler = NULL_PROFILER
+    
+    # <<<<< profiling <<<<<
+    
+    
+    
+    # >>>>> stream ownership >>>>>
+    
+    def _acquire_stream(self, owner: object) -> None:
+        """Take the stream ownership for `owner` (re-entrant for the same owner)."""
+        with self._stream_owner_lock:
+            if self._stream_owner is not None and self._stream_owner is not owner:
+                raise LabJackStreamBusyError(f"The device is streaming for another object: {self._stream_owner!r}")
+            self._stream_owner = owner
+    
+    def _release_stream(self, owner: object) -> None:
+        with self._stream_owner_lock:
+            if self._stream_owner is owner:
+                self._stream_owner = None
+    
+    def _check_stream_free(self, owner: object) -> None:
+        """Raise LabJackStreamBusyError if another object streams (e.g., before writing STREAM_* registers)."""
+        stream_owner = self._stream_owner
+        if stream_owner is not None and stream_owner is not owner:
+            raise LabJackStreamBusyError(f"The device is streaming for another object: {stream_owner!r}")
+    
+    # <<<<< stream ownership <<<<<
 
     
     
@@ -213,18 +324,19 @@ class LabJackDevice:
         
         try:
             for key, value in kwargs.items():
-                if isinstance(value, str):
-                    # configure string values
-                    ljm.writeLibraryConfigStringS(key, value)
-                else:
-                    ljm.writeLibraryConfigS(key, value)
+                with self._command_lock:
+                    if isinstance(value, str):
+                        # configure string values
+                        ljm.writeLibraryConfigStringS(key, value)
+                    else:
+                        ljm.writeLibraryConfigS(key, value)
         except ljm.LJMError as ljmex:
             raise LabJackLibraryConfigurationError("LabJack library-level error") from ljmex
         except Exception as ex:
             raise LabJackLibraryConfigurationError("Non LabJack library-level error") from ex
     
     def configure_register(self, *,
-                  AIN_ALL_NEGATIVE_CH=ljm.constants.GND,
+                  AIN_ALL_NEGATIVE_CH=199,  # ljm.constants.GND
                   AIN_ALL_RANGE=10.0,
                   **kwargs: int | float | str):
         """
@@ -293,12 +405,14 @@ class LabJackDevice:
             for key, value in kwargs.items():
                 if isinstance(value, str):
                     # configure string values
-                    ljm.eWriteNameString(key, value)
+                    with self._command_lock:
+                        ljm.eWriteNameString(self._handle, key, value)
                 else:
                     keys_number.append(key); values_number.append(value)
             # configure number values
             N_config_number = len(keys_number)
-            ljm.eWriteNames(handle, N_config_number, keys_number, values_number)
+            with self._command_lock:
+                ljm.eWriteNames(self._handle, N_config_number, keys_number, values_number)
         except ljm.LJMError as ljmex:
             raise LabJackRegisterConfigurationError("LabJack library-level error") from ljmex
         except Exception as ex:
@@ -322,11 +436,16 @@ class LabJackDevice:
             duration_s: int = 1,
             *,
             sampling_rate_Hz: float = 100e3,
-            scans_per_read: int | None = None,
+            scans_per_read: int | str | None = None,
             do_trigger: bool =False,
             trigger_channel : str = "DIO0",
             trigger_mode: LabJackTriggerModeEnum = LabJackTriggerModeEnum.ConditionalReset,
             trigger_edge: LabJackTriggerEdgeEnum = LabJackTriggerEdgeEnum.Rising,
+            trigger_timeout_s: float | None = None,
+            reconnect_attempts: int = 0,
+            reconnect_delay_s: float = 1.0,
+            rate_policy: str | None = None,
+            stream_outs: list['StreamOut'] | None = None,
         ) -> 'StreamIn':
         """
         configure and initiate (triggered) streaming and return a LabJackDevice.Stream object that contains the result.
@@ -338,6 +457,7 @@ class LabJackDevice:
                 total_scan_rate_Hz (float)  : Total scan rate over all channel in Hz. defaults: 100e3. 
                                             cf. scan rate per channel = [total_scan_rate_Hz / len(scan_channels)] Hz.
                 scans_per_read (int)        : Number of scans over all channel per eStreamRead.
+                                            None for a single read per shot, "auto" to tune it from the scan backlogs.
                 do_trigger (bool)           : Whether to use triggered streaming.
                 trigger_channel (str)       : Name of the trigger channel 
                                             default: "DIO0"
@@ -345,6 +465,16 @@ class LabJackDevice:
                                             Default: LabJackTriggerModeEnum.ConditionalReset.
                 trigger_edge                : Enum value for the trigger edge.
                                             Default: LabJackTriggerEdgeEnum.Rising
+                trigger_timeout_s (float)   : Duration of waiting for trigger. None for indefinite wait.
+                reconnect_attempts (int)    : Number of reconnections allowed per capture to resume the stream after
+                                            a recoverable connection error. 0 to fail instead. Default: 0
+                reconnect_delay_s (float)   : Wait before each reconnection. Default: 1.0
+                rate_policy (str or None)   : Check the sampling rate with `plan_stream_in()` before configuring:
+                                            "reject" (raise LabJackStreamPlanError), "clamp" (lower the rate) or
+                                            "suggest" (warn only) if it is not sustainable. None to skip the check.
+                                            Default: None
+                stream_outs (list)          : Outputs created with `stream_out()`, clocked by the same scans as the
+                                            inputs (value k is output in scan k, after its inputs). Default: None
 
         Returns:
             An LabJackDevice.Stream object
@@ -352,12 +482,149 @@ class LabJackDevice:
         # check connection
         #self._check_connection()
         from _stream_in import StreamIn
+        if rate_policy is not None:
+            from _stream_planner import apply_stream_plan
+            # planned with the registers StreamIn writes, not the planner defaults, so that both never drift apart
+            registers = StreamIn._STREAM_REGISTERS
+            plan = self.plan_stream_in(scan_channels, sampling_rate_Hz,
+                                       resolution_index=registers["STREAM_RESOLUTION_INDEX"],
+                                       ain_range=registers["AIN_ALL_RANGE"],
+                                       settling_us=registers["STREAM_SETTLING_US"])
+            sampling_rate_Hz = apply_stream_plan(plan, rate_policy)
         return StreamIn(self, scan_channels, duration_s, \
                 sampling_rate_Hz=sampling_rate_Hz, scans_per_read=scans_per_read, \
-                do_trigger=do_trigger, trigger_channel=trigger_channel, trigger_mode=trigger_mode, trigger_edge=trigger_edge)
+                do_trigger=do_trigger, trigger_channel=trigger_channel, trigger_mode=trigger_mode, trigger_edge=trigger_edge, \
+                trigger_timeout_s=trigger_timeout_s, \
+                reconnect_attempts=reconnect_attempts, reconnect_delay_s=reconnect_delay_s, \
+                stream_outs=stream_outs)
     
-    # <<<<< stream in <<<<<
+    def stream_out(
+            self,
+            target: str,
+            source: 'np.ndarray | Callable[[int, int], np.ndarray]',
+            *,
+            index: int = 0,
+            loop: bool = False,
+        ) -> 'StreamOut':
+        """
+        Define a hardware-timed waveform output (DAC or digital register) to run with a stream, e.g.,
+            ramp = device.stream_out("DAC0", np.linspace(0, 5, 1000), loop=True)
+            stream_in = device.stream_in(["AIN0"], 1.0, sampling_rate_Hz=10e3, stream_outs=[ramp])
+        The output shares the scan clock of the stream: value k is output within scan k, after its inputs, so the
+        response to value k shows in the inputs from scan k+1 on.
+        
+        Args:
+                target (str)        : Register to output to, e.g., "DAC0", "DAC1", "FIO_STATE".
+                source              : 1-D array of values, or a callable source(first_value_index, num_values).
+                index (int)         : STREAM_OUT# index (0-3), distinct for each output of a stream. Default: 0
+                loop (bool)         : Whether to repeat an array source. Default: False
+        
+        Returns:
+            _stream_out.StreamOut object
+        
+        ljm methods used:
+        - https://support.labjack.com/docs/periodicstreamout-ljm-user-s-guide
+        - https://support.labjack.com/docs/initializeaperiodicstreamout-ljm-user-s-guide
+        - https://support.labjack.com/docs/writeaperiodicstreamout-ljm-user-s-guide
+        """
+        from _stream_out import StreamOut
+        if self._device_type is LabJackDeviceTypeEnum.DIGIT:
+            raise ValueError("Stream-out is not supported by LabJack Digit.")
+        return StreamOut(target, source, index=index, loop=loop)
+    
+    def plan_stream_in(
+            self,
+            scan_channels: list[str],
+            sampling_rate_Hz: float,
+            *,
+            resolution_index: int = 0,
+            ain_range: float = 10.0,
+            settling_us: float = 0.0,
+            measure_link: bool = False,
+        ) -> 'LabJackStreamPlanTypedDict':
+        """
+        Estimate, before eStreamStart, the max sustainable sampling rate and the expected fraction of skipped samples
+        for streaming `scan_channels` at `sampling_rate_Hz` on this device and connection.
+        The defaults match the configuration applied by `stream_in()`.
         
+        Args:
+            scan_channels (list of str)     : Channels to stream.
+            sampling_rate_Hz (float)        : Sampling rate over all channels.
+            resolution_index (int)          : STREAM_RESOLUTION_INDEX. default: 0
+            ain_range (float)               : AIN_ALL_RANGE in +-V. default: 10.0
+            settling_us (float)             : STREAM_SETTLING_US. default: 0.0
+            measure_link (bool)             : Whether to also measure the link throughput (takes some round trips).
+        
+        Returns:
+            _stream_planner.LabJackStreamPlanTypedDict: plan with the max sustainable and suggested rates.
+            Use `_stream_planner.apply_stream_plan()` to reject or clamp.
+        """
+        from _stream_planner import plan_stream, measure_link_throughput
+        link_throughput = measure_link_throughput(self) if measure_link else None
+        return plan_stream(self._device_type, self._connection_type, len(scan_channels), sampling_rate_Hz,
+                           resolution_index=resolution_index, ain_range=ain_range, settling_us=settling_us,
+                           link_throughput_Bps=link_throughput)
+    
+    # <<<<< stream in <<<<<
+
+    # >>>>> register read >>>>>
+    # implemented in ./_poller.py
+
+    def read(self, names: list[str]) -> dict[str, float]:
+        """
+        Read registers (command-response), packed into as few packets as `max_bytes_per_MB` allows.
+
+        Args:
+            names (list of str) : Register names, e.g., ["AIN4", "TEMPERATURE_DEVICE_K"].
+
+        Returns:
+            dict of register name -> value
+
+        ljm methods used:
+        - https://support.labjack.com/docs/namestoaddresses-ljm-user-s-guide
+        - https://support.labjack.com/docs/ereadaddresses-ljm-user-s-guide
+        """
+        from _poller import read_registers
+        return read_registers(self, names)
+
+    def poll(
+            self,
+            groups: dict[str, tuple[list[str], float]],
+            *,
+            max_ticks: int = 100_000,
+            callback: Callable[[str, float, dict[str, float]], None] | None = None,
+            start: bool = True,
+        ) -> 'RegisterPoller':
+        """
+        Poll slow channels (temperatures, DC levels, ...) at per-group intervals on one background thread, e.g.,
+            poller = device.poll({'temperatures': (["TEMPERATURE_DEVICE_K", "AIN10"], 1.0),
+                                  'dc': (["AIN4", "AIN5"], 0.1)})
+            ...
+            poller.stop()
+            t, values = poller.data('dc')
+        The registers of the groups due at a tick are read together, in as few packets as `max_bytes_per_MB` allows.
+
+        Args:
+            groups (dict)           : Group name -> (register names, interval in seconds).
+            max_ticks (int)         : Ticks kept per group. Default: 100000
+            callback (callable)     : callback(group, timestamp, {register: value}) run on the polling thread.
+            start (bool)            : Whether to start polling right away. Default: True
+
+        Returns:
+            _poller.RegisterPoller object
+
+        ljm methods used:
+        - https://support.labjack.com/docs/namestoaddresses-ljm-user-s-guide
+        - https://support.labjack.com/docs/ereadaddresses-ljm-user-s-guide
+        """
+        from _poller import RegisterPoller
+        poller = RegisterPoller(self, groups, max_ticks=max_ticks, callback=callback)
+        if start:
+            poller.start()
+        return poller
+
+    # <<<<< register read <<<<<
+
     # <<<<<<< LabJack operation <<<<<<<
 
 # example usage
@@ -0,0 +1,364 @@
+"""
+Command-line entry point: `labjack-quadpd stream|record|replay|bench|bench-store|bench-read|bench-lock|bench-align|info` (or `python labjack_quadpd.py ...`).
+
+Only the standard library is imported at start-up; the LJM library, numpy and pandas are imported by the
+subcommands that need them, so short cron-style captures start quickly.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+
+# >>>>> device >>>>>
+
+def _add_device_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("device_identifier", help="IP address or serial number of the device")
+    parser.add_argument("--device-type", default="T7", help="T4, T7, T8 or DIGIT. default: T7")
+    parser.add_argument("--connection-type", default="ETHERNET", help="USB, ETHERNET or WIFI. default: ETHERNET")
+
+
+def _add_stream_arguments(parser: argparse.ArgumentParser) -> None:
+    _add_device_arguments(parser)
+    parser.add_argument("-c", "--channels", nargs="+", default=["AIN0"], help="channels to stream. default: AIN0")
+    parser.add_argument("-d", "--duration", type=float, default=1.0, help="duration of a shot in s. default: 1")
+    parser.add_argument("-r", "--rate", type=float, default=50e3,
+                        help="sampling rate over all channels in Hz. default: 50e3")
+    parser.add_argument("--scans-per-read", type=lambda v: v if v == "auto" else int(v), default=None,
+                        help='scans per eStreamRead, or "auto" to tune it. default: one read per shot')
+    parser.add_argument("--trigger", metavar="CHANNEL", default=None,
+                        help="trigger channel (e.g., DIO0) for a triggered stream. default: not triggered")
+    parser.add_argument("--trigger-edge", default="Rising", help="Rising or Falling. default: Rising")
+    _add_derived_arguments(parser)
+
+
+def _add_derived_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--quad", nargs=4, metavar=("A", "B", "C", "D"), default=None,
+                        help="quadrant channels of a quad photodiode: adds SUM, X and Y")
+    parser.add_argument("--min-sum", type=float, default=0.0,
+                        help="X and Y are NaN where |SUM| is below this (V). default: 0")
+    parser.add_argument("--derive", nargs="+", metavar="NAME=EXPR", default=[],
+                        help="derived channels, e.g., X=AIN1/AIN12 (after --quad channels)")
+
+
+def _open_device(args: argparse.Namespace, profiler=None):
+    from labjack_device import LabJackDevice
+    from _ljm_aux import LabJackDeviceTypeEnum, LabJackConnectionTypeEnum
+    return LabJackDevice(
+        device_type=LabJackDeviceTypeEnum[args.device_type],
+        connection_type=LabJackConnectionTypeEnum[args.connection_type],
+        device_identifier=args.device_identifier,
+        profiler=profiler,
+    )
+
+
+def _open_stream_in(device, args: argparse.Namespace):
+    from _ljm_aux import LabJackTriggerEdgeEnum
+    stream_in = device.stream_in(
+        args.channels, args.duration,
+        sampling_rate_Hz=args.rate,
+        scans_per_read=args.scans_per_read,
+        do_trigger=args.trigger is not None,
+        trigger_channel=args.trigger or "DIO0",
+        trigger_edge=LabJackTriggerEdgeEnum[args.trigger_edge],
+    )
+    _add_derived_channels(stream_in, args)
+    return stream_in
+
+
+def _add_derived_channels(stream_in, args: argparse.Namespace) -> None:
+    if args.quad or args.derive:
+        from _derived_channels import DerivedChannels, quad_photodiode_channels
+        definitions, aliases, masks = {}, {}, {}
+        if args.quad:
+            quad = quad_photodiode_channels(*args.quad, min_sum_V=args.min_sum)
+            definitions, aliases, masks = quad.definitions, quad._aliases, quad._masks
+        for definition in args.derive:
+            name, _, expression = definition.partition("=")
+            definitions[name.strip()] = expression
+        stream_in.add_derived_channels(DerivedChannels(definitions, aliases=aliases, masks=masks))
+
+# <<<<< device <<<<<
+
+
+# >>>>> subcommands >>>>>
+
+def _cmd_info(args: argparse.Namespace) -> int:
+    with _open_device(args):
+        pass  # the device info is printed on connection
+    return 0
+
+
+def _cmd_stream(args: argparse.Namespace) -> int:
+    profiler = None
+    if args.profile:
+        from _profiler import AcquisitionProfiler
+        profiler = AcquisitionProfiler()
+    with _open_device(args, profiler) as device:
+        stream_in = _open_stream_in(device, args)
+        if args.raw_log:
+            stream_in.record_raw(args.raw_log, overwrite=True)
+        for i_shot in range(args.shots):
+            start = time.perf_counter()
+            stream_in._stream_in()
+            _print_shot(i_shot, time.perf_counter() - start, stream_in, profiler)
+        if args.raw_log:
+            stream_in.raw_recorder.close()
+            print(f"Saved the raw reads of {stream_in.raw_recorder.num_shots} shots to {args.raw_log}.")
+    if profiler is not None:
+        profiler.export_chrome_trace(args.profile)
+        print(f"Saved the acquisition trace to {args.profile} (open in https://ui.perfetto.dev).")
+    return 0
+
+
+def _print_shot(i_shot: int, elapsed: float, stream_in, profiler) -> None:
+    import numpy as np
+    print(f"Shot {i_shot}: {elapsed:.4f} s, skipped samples = {stream_in.skipped_samples}")
+    for channel, record in stream_in.records.items():
+        print(f"\t{channel}: mean = {np.nanmean(record['V']):.6f} V, std = {np.nanstd(record['V']):.6f} V")
+    if profiler is not None:
+        print(profiler.format_report())
+
+
+def _cmd_replay(args: argparse.Namespace) -> int:
+    # reprocess a raw read log (stream --raw-log) through the acquisition pipeline, without a device
+    from _raw_log import ReplayStreamIn
+    profiler = None
+    if args.profile:
+        from _profiler import AcquisitionProfiler
+        profiler = AcquisitionProfiler()
+    stream_in = ReplayStreamIn(args.raw_log, realtime=args.realtime, profiler=profiler)
+    _add_derived_channels(stream_in, args)
+    for i_shot in range(stream_in.num_shots):
+        start = time.perf_counter()
+        stream_in.replay(i_shot)
+        _print_shot(i_shot, time.perf_counter() - start, stream_in, profiler)
+    if profiler is not None:
+        profiler.export_chrome_trace(args.profile)
+        print(f"Saved the replay trace to {args.profile} (open in https://ui.perfetto.dev).")
+    return 0
+
+
+def _cmd_record(args: argparse.Namespace) -> int:
+    if args.output.lower().endswith((".arrows", ".arrow", ".parquet", ".pq")):
+        return _record_arrow(args)
+    if args.output.lower().endswith(".ljqs"):
+        return _record_shot_store(args)
+    import numpy as np
+    voltages = {}  # streamed and derived channels
+    times = {}
+    with _open_device(args) as device:
+        stream_in = _open_stream_in(device, args)
+        for i_shot in range(args.shots):
+            stream_in._stream_in()
+            for channel, record in stream_in.records.items():
+                voltages.setdefault(channel, []).append(record['V'])
+                times.setdefault(channel, record['t'])
+            print(f"Shot {i_shot} recorded.", flush=True)
+
+    print(f">>> Saving {args.shots} shots to {args.output}... ", end="", flush=True)
+    if args.output.endswith(".csv"):
+        # same layout as raw_profile.csv written by stella_updated.py
+        import pandas as pd
+        columns = {}
+        for channel in voltages:
+            columns[f"{channel}_t"] = times[channel]
+        for i_shot in range(args.shots):
+            for channel in voltages:
+                columns[f"{channel}_V_{i_shot}"] = voltages[channel][i_shot]
+        pd.DataFrame(columns).to_csv(args.output, index=False)
+    else:
+        arrays = {}
+        for channel in voltages:
+            arrays[f"{channel}_t"] = times[channel]
+            arrays[f"{channel}_V"] = np.stack(voltages[channel])  # shots x scans
+        np.savez(args.output, **arrays)
+    print("Done.")
+    return 0
+
+
+def _record_arrow(args: argparse.Namespace) -> int:
+    # append each shot as it completes (long form: shot, channel, t, V) instead of holding all shots in memory
+    from _arrow_writer import ShotResultWriter
+    with ShotResultWriter(args.output, overwrite=True) as writer, _open_device(args) as device:
+        stream_in = _open_stream_in(device, args)
+        writer.attach(stream_in, records=True)
+        for i_shot in range(args.shots):
+            stream_in._stream_in()
+            print(f"Shot {i_shot} recorded.", flush=True)
+    print(f"Saved {writer.num_rows_written} rows to {args.output}.")
+    return 0
+
+
+def _record_shot_store(args: argparse.Namespace) -> int:
+    # int16 counts, delta/shuffle-filtered and compressed shot by shot (see _shot_store.py)
+    from _shot_store import ShotStoreWriter
+    with ShotStoreWriter(args.output, codec=args.codec, level=args.level, overwrite=True) as writer, \
+            _open_device(args) as device:
+        stream_in = _open_stream_in(device, args)
+        writer.attach(stream_in)
+        for i_shot in range(args.shots):
+            stream_in._stream_in()
+            print(f"Shot {i_shot} recorded.", flush=True)
+    print(f"Saved {writer.num_shots} shots to {args.output}.")
+    return 0
+
+
+# modules timed by `bench`, from the lightest to the heaviest
+_BENCH_IMPORTS = ["labjack_quadpd", "_ljm_aux", "labjack_device", "_stream_in", "numpy"]
+
+
+def _time_import(module: str, repeat: int) -> float:
+    """Best-of-`repeat` wall time (s) to import `module` in a fresh interpreter, excluding interpreter start-up."""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [here, os.environ.get("PYTHONPATH")])))
+    best = float("inf")
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+        if out.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{out.stderr}")
+        best = min(best, float(out.stdout.strip().splitlines()[-1]))
+    return best
+
+
+def _cmd_bench(args: argparse.Namespace) -> int:
+    print(f"Import time (best of {args.repeat}, fresh interpreter each):")
+    for module in args.modules or _BENCH_IMPORTS:
+        try:
+            print(f"\t{module:<20s}{_time_import(module, args.repeat)*1e3:9.1f} ms", flush=True)
+        except RuntimeError as ex:
+            print(f"\t{module:<20s}{'failed':>9s}  ({str(ex).splitlines()[-1]})", flush=True)
+    return 0
+
+def _cmd_bench_store(args: argparse.Namespace) -> int:
+    import tempfile
+    from _shot_store import benchmark_shot_store
+    print(f"Shot storage ({args.scans} scans x {args.channels} channels, best of {args.repeat}; "
+          "MB/s of float64 samples, ratio = float64 bytes/file bytes):")
+    with tempfile.TemporaryDirectory() as directory:
+        results = benchmark_shot_store(directory, num_scans=args.scans, num_channels=args.channels,
+                                       codecs=args.codecs or None, repeat=args.repeat)
+    print(f"\t{'format':<14s}{'write MB/s':>12s}{'read MB/s':>12s}{'ratio':>8s}{'max error V':>14s}")
+    for row in results:
+        print(f"\t{row['format']:<14s}{row['write_MBps']:12.1f}{row['read_MBps']:12.1f}{row['ratio']:8.2f}"
+              f"{row['max_error_V']:14.3g}")
+    return 0
+
+def _cmd_bench_read(args: argparse.Namespace) -> int:
+    from _stream_read import benchmark_stream_read, _ljm_stream_read_function
+    print(f"eStreamRead block ({args.values} values) into a numpy buffer, best of {args.repeat} "
+          f"(ctypes path {'available' if _ljm_stream_read_function() is not None else 'unavailable'} here):")
+    print(f"\t{'path':<10s}{'us/read':>10s}{'MS/s':>10s}")
+    for row in benchmark_stream_read(args.values, repeat=args.repeat):
+        print(f"\t{row['path']:<10s}{row['us_per_read']:10.1f}{row['MSps']:10.1f}")
+    return 0
+
+def _cmd_bench_align(args: argparse.Namespace) -> int:
+    from _shot_align import benchmark_shot_alignment
+    print(f"Trigger-jitter alignment of {args.shots} shots x {args.samples} samples (jitter +/-{args.jitter} samples, "
+          f"best of {args.repeat}):")
+    print(f"\t{'shift':<8s}{'estimate ms':>13s}{'shift ms':>10s}{'shots/s':>10s}{'rms error':>11s}")
+    for row in benchmark_shot_alignment(args.shots, args.samples, max_lag=int(args.jitter) + 2,
+                                        jitter_samples=args.jitter, repeat=args.repeat):
+        print(f"\t{row['method']:<8s}{row['estimate_ms']:13.1f}{row['shift_ms']:10.1f}{row['shots_per_s']:10.0f}"
+              f"{row['rms_error_samples']:11.4f}")
+    return 0
+
+def _cmd_bench_lock(args: argparse.Namespace) -> int:
+    from _lock_stress import stress_device_lock
+    with _open_device(args) as device:
+        results = stress_device_lock(device, duration_s=args.duration, num_readers=args.readers,
+                                     registers=args.registers, stream_channels=args.stream or None)
+    print(f"Device access under contention ({args.duration} s):")
+    print(f"\t{'kind':<12s}{'threads':>8s}{'ops':>8s}{'ops/s':>10s}{'median ms':>11s}{'max ms':>9s}{'errors':>8s}")
+    for row in results:
+        print(f"\t{row['kind']:<12s}{row['num_threads']:8d}{row['num_ops']:8d}{row['ops_per_s']:10.1f}"
+              f"{row['latency_median_ms']:11.2f}{row['latency_max_ms']:9.2f}{row['num_errors']:8d}")
+    return 0
+
+# <<<<< subcommands <<<<<
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="labjack-quadpd", description="LabJack quad photodiode acquisition")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_info = subparsers.add_parser("info", help="connect and print device information")
+    _add_device_arguments(parser_info)
+    parser_info.set_defaults(func=_cmd_info)
+
+    parser_stream = subparsers.add_parser("stream", help="stream shots and print per-channel summaries")
+    _add_stream_arguments(parser_stream)
+    parser_stream.add_argument("-n", "--shots", type=int, default=1, help="number of shots. default: 1")
+    parser_stream.add_argument("--profile", metavar="TRACE_JSON", default=None,
+                               help="print per-stage timing of each shot and save a Chrome/Perfetto trace")
+    parser_stream.add_argument("--raw-log", metavar="LJRR", default=None,
+                               help="log the raw eStreamRead returns for `replay`")
+    parser_stream.set_defaults(func=_cmd_stream)
+
+    parser_replay = subparsers.add_parser("replay", help="reprocess the shots of a raw read log (stream --raw-log) "
+                                          "without a device")
+    parser_replay.add_argument("raw_log", help="raw read log")
+    parser_replay.add_argument("--realtime", action="store_true",
+                               help="return the reads at their recorded pace. default: as fast as possible")
+    _add_derived_arguments(parser_replay)
+    parser_replay.add_argument("--profile", metavar="TRACE_JSON", default=None,
+                               help="print per-stage timing of each shot and save a Chrome/Perfetto trace")
+    parser_replay.set_defaults(func=_cmd_replay)
+
+    parser_record = subparsers.add_parser("record", help="stream shots and save them (.npz, .csv via pandas, "
+                                          ".arrows/.parquet via pyarrow or compressed .ljqs, "
+                                          "the last three written shot by shot)")
+    _add_stream_arguments(parser_record)
+    parser_record.add_argument("-n", "--shots", type=int, default=1, help="number of shots. default: 1")
+    parser_record.add_argument("-o", "--output", required=True,
+                               help="output file (.npz, .csv, .arrows, .parquet or .ljqs)")
+    parser_record.add_argument("--codec", default="zlib", help="codec of .ljqs output. default: zlib")
+    parser_record.add_argument("--level", type=int, default=None, help="compression level of .ljqs output")
+    parser_record.set_defaults(func=_cmd_record)
+
+    parser_bench = subparsers.add_parser("bench", help="measure the import time of the library modules")
+    parser_bench.add_argument("modules", nargs="*", help=f"modules to time. default: {' '.join(_BENCH_IMPORTS)}")
+    parser_bench.add_argument("--repeat", type=int, default=5, help="default: 5")
+    parser_bench.set_defaults(func=_cmd_bench)
+
+    parser_bench_store = subparsers.add_parser("bench-store", help="compare shot storage formats (.ljqs, .npy, CSV)")
+    parser_bench_store.add_argument("--scans", type=int, default=200_000, help="default: 200000")
+    parser_bench_store.add_argument("--channels", type=int, default=4, help="default: 4")
+    parser_bench_store.add_argument("--codecs", nargs="*", help="default: all installed")
+    parser_bench_store.add_argument("--repeat", type=int, default=3, help="default: 3")
+    parser_bench_store.set_defaults(func=_cmd_bench_store)
+
+    parser_bench_read = subparsers.add_parser("bench-read", help="compare the eStreamRead conversion paths "
+                                              "(list vs ctypes buffer)")
+    parser_bench_read.add_argument("--values", type=int, default=100_000, help="values per read. default: 100000")
+    parser_bench_read.add_argument("--repeat", type=int, default=20, help="default: 20")
+    parser_bench_read.set_defaults(func=_cmd_bench_read)
+
+    parser_bench_align = subparsers.add_parser("bench-align", help="measure the cross-shot trigger-jitter "
+                                               "alignment on synthetic shots")
+    parser_bench_align.add_argument("--shots", type=int, default=2000, help="default: 2000")
+    parser_bench_align.add_argument("--samples", type=int, default=1000, help="samples per shot. default: 1000")
+    parser_bench_align.add_argument("--jitter", type=float, default=3.0, help="max |delay| in samples. default: 3")
+    parser_bench_align.add_argument("--repeat", type=int, default=3, help="default: 3")
+    parser_bench_align.set_defaults(func=_cmd_bench_align)
+
+    parser_bench_lock = subparsers.add_parser("bench-lock", help="measure register reads and streaming contending "
+                                              "for one device")
+    _add_device_arguments(parser_bench_lock)
+    parser_bench_lock.add_argument("-d", "--duration", type=float, default=5.0, help="in s. default: 5")
+    parser_bench_lock.add_argument("--readers", type=int, default=4, help="reading threads. default: 4")
+    parser_bench_lock.add_argument("--registers", nargs="+", default=["AIN0", "AIN1", "TEMPERATURE_DEVICE_K"],
+                                   help="registers read by each thread. default: AIN0 AIN1 TEMPERATURE_DEVICE_K")
+    parser_bench_lock.add_argument("--stream", nargs="*", metavar="CHANNEL", default=[],
+                                   help="channels streamed in shots meanwhile. default: no stream")
+    parser_bench_lock.set_defaults(func=_cmd_bench_lock)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
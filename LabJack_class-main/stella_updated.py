@@ -1,14 +1,11 @@
 from labjack_device import *
 import time
-import pandas as pd
+import numpy as np
 
-import pandas as pd
 import os
 from pprint import pprint
-from influxdb_client import InfluxDBClient, Point
-from influxdb_client.client.write_api import SYNCHRONOUS
 import traceback
-import concurrent.futures
+# pandas and influxdb_client are imported where used to keep the start-up fast
 
 def find_valley_averages(time_array, signal_array, threshold):
     below = np.abs(signal_array) > threshold
@@ -48,6 +45,9 @@ def upload_to_influx(
     influx_bucket="sr3"
 ):
     """Upload a value to InfluxDB as a single point."""
+    from influxdb_client import InfluxDBClient, Point
+    from influxdb_client.client.write_api import SYNCHRONOUS
+
     # Create client and write API
     client = InfluxDBClient(url=influx_url, token=influx_token, org=influx_org)
     write_api = client.write_api(write_options=SYNCHRONOUS)
@@ -199,8 +199,8 @@ for loop_index in range(5):  # number of total triggers
     #                 print(f"Failed to upload {chan_name} ({tag_str}): {e}")
     #                 traceback.print_exc()
     for chan_name in a_scan_list_names:
-        V_raw = np.array(data.records[chan_name]['V'])  
-        t_raw = np.array(data.records[chan_name]['t'])
+        V_raw = data.records[chan_name]['V']  # view of this shot's buffer (a new one each shot): no copy needed
+        t_raw = data.records[chan_name]['t']
 
         if reference_times[chan_name] is None:
             reference_times[chan_name] = t_raw
@@ -228,6 +228,7 @@ for loop_index in range(5):  # number of total triggers
             for chan_name in a_scan_list_names:
                 data_dict[f"{chan_name}_V_{i}"] = voltage_columns[chan_name][i]
 
+        import pandas as pd
         raw_df = pd.DataFrame(data_dict)
         raw_df.to_csv(output_csv, index=False)
         print(f"Saved")
@@ -0,0 +1,15 @@
+import pytest
+
+
+@pytest.fixture
+def fake_ljm(monkeypatch):
+    """FakeLJM installed as the `ljm` of every module (see fake_ljm.py); needs the labjack-ljm package, not a device."""
+    pytest.importorskip("labjack.ljm")
+    import _ljm_aux
+    import _stream_read
+    from fake_ljm import FakeLJM
+    fake = FakeLJM()
+    monkeypatch.setattr(_ljm_aux.ljm, "_module", fake)
+    # the ctypes path of StreamReader would call the real LJM_eStreamRead
+    monkeypatch.setattr(_stream_read, "_ljm_stream_read_function", lambda: None)
+    return fake
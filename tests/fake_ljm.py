@@ -0,0 +1,116 @@
+import importlib
+import threading
+import time
+
+# command-response calls: the device answers one at a time, so LabJackDevice must never overlap them
+_COMMANDS = (
+    "openS", "close",
+    "eReadName", "eReadNames", "eReadAddress", "eReadAddresses",
+    "eWriteName", "eWriteNames", "eWriteNameString",
+    "eStreamStart", "eStreamStop",
+    "periodicStreamOut", "initializeAperiodicStreamOut", "writeAperiodicStreamOut",
+)
+
+
+class FakeLJM:
+    """
+    Stand-in for the `labjack.ljm` module with one fake T7 (no device or LJM library needed), installed in place of
+    `_ljm_aux.ljm` by the `fake_ljm` fixture (see conftest.py).
+
+    Every command-response call (see `_COMMANDS`) takes `call_s` and records an overlap if another one is in progress,
+    i.e., if a caller did not hold `LabJackDevice.command_lock`. eStreamRead waits for data rather than commanding the
+    device, so it is not checked; it returns a ramp per channel paced at the scan rate, or raises the LJMError of
+    `stream_read_errors`. The constants, error codes and LJMError of the real module are kept.
+    """
+
+    def __init__(self, *, call_s: float = 2e-4) -> None:
+        real = importlib.import_module("labjack.ljm")
+        self.constants = real.constants
+        self.errorcodes = real.errorcodes
+        self.LJMError = real.LJMError
+        self.call_s = call_s
+        self.num_calls = dict.fromkeys(_COMMANDS, 0)
+        self.overlaps = []  # (call, call in progress)
+        self._state_lock = threading.Lock()
+        self._in_progress = []  # calls running now
+        self._stream = None  # [scans per read, number of addresses, scan rate, reads so far] while streaming
+        self.library_config = {"LJM_OPEN_TCP_DEVICE_TIMEOUT_MS": 20000.0}
+        self.stream_read_errors = {}  # eStreamRead call (from 0, over all streams) -> ljm.errorcodes name to raise
+        self._num_stream_reads = 0
+        for name in _COMMANDS:
+            setattr(self, name, self._command(name, getattr(self, f"_{name}")))
+
+    def _command(self, name, function):
+        def command(*args):
+            with self._state_lock:
+                self.num_calls[name] += 1
+                if self._in_progress:
+                    self.overlaps.append((name, self._in_progress[0]))
+                self._in_progress.append(name)
+            try:
+                time.sleep(self.call_s)  # the round trip, during which another call would overlap
+                return function(*args)
+            finally:
+                with self._state_lock:
+                    self._in_progress.remove(name)
+        return command
+
+    # >>>>> library >>>>>
+
+    def writeLibraryConfigS(self, name, value): self.library_config[name] = float(value)
+    def writeLibraryConfigStringS(self, name, value): self.library_config[name] = value
+    def readLibraryConfigS(self, name): return self.library_config.get(name, 0.0)
+    def getHandleInfo(self, handle): return (7, 3, 470000, 3232235868, 502, 1040)
+    def numberToIP(self, number): return "192.168.1.92"
+    def nameToAddress(self, name): return (self._address(name), 3)
+
+    def namesToAddresses(self, num_frames, names, aNumFrames=None):
+        return [self._address(name) for name in names], [3]*num_frames
+
+    @staticmethod
+    def _address(name):
+        digits = "".join(c for c in name if c.isdigit())
+        return int(digits or 0)*2
+
+    # <<<<< library <<<<<
+
+    # >>>>> commands >>>>>
+
+    def _openS(self, device_type, connection_type, identifier): return 1
+    def _close(self, handle): pass
+    def _eReadName(self, handle, name): return 0.0
+    def _eReadNames(self, handle, num_frames, names): return [0.0]*num_frames
+    def _eReadAddress(self, handle, address, data_type): return 0.0
+    def _eReadAddresses(self, handle, num_frames, addresses, data_types): return [0.0]*num_frames
+    def _eWriteName(self, handle, name, value): pass
+    def _eWriteNames(self, handle, num_frames, names, values): pass
+    def _eWriteNameString(self, handle, name, value): pass
+
+    def _eStreamStart(self, handle, scans_per_read, num_addresses, addresses, scan_rate):
+        self._stream = [scans_per_read, num_addresses, scan_rate, 0]
+        return scan_rate
+
+    def _eStreamStop(self, handle):
+        self._stream = None
+
+    def _periodicStreamOut(self, handle, index, target, scan_rate, num_values, values): pass
+    def _initializeAperiodicStreamOut(self, handle, index, target, scan_rate): pass
+    def _writeAperiodicStreamOut(self, handle, index, num_values, values): return 16384
+
+    # <<<<< commands <<<<<
+
+    def eStreamRead(self, handle):
+        call = self._num_stream_reads
+        self._num_stream_reads += 1
+        if call in self.stream_read_errors:
+            name = self.stream_read_errors[call]
+            raise self.LJMError(errorCode=getattr(self.errorcodes, name), errorString=name)
+        if self._stream is None:
+            raise self.LJMError(errorString="Streaming has not been started for the given handle.")
+        scans_per_read, num_addresses, scan_rate, num_reads = self._stream
+        self._stream[3] += 1
+        time.sleep(scans_per_read/scan_rate)
+        values = []
+        for scan in range(num_reads*scans_per_read, (num_reads + 1)*scans_per_read):
+            values.extend(float(ich) + 0.1*((scan % 100)/50 - 1) for ich in range(num_addresses))
+        return values, 0, 0
@@ -0,0 +1,66 @@
+import gc
+import sys
+
+import numpy as np
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.compute as pc
+
+from _arrow_writer import ShotResultWriter, read_batches
+from _ljm_aux import LabJackConnectionTypeEnum, LabJackDeviceTypeEnum
+from labjack_device import LabJackDevice
+
+
+def test_arrow_batches_are_readable_while_writing(tmp_path):
+    path = str(tmp_path / "results.arrows")
+    writer = ShotResultWriter(path, flush_rows=2)
+    for i in range(5):
+        writer.write({'shot': i, 'mean_V': 0.1*i})
+    # two complete batches are visible before close(); the fifth row is still buffered
+    assert sum(batch.num_rows for batch in read_batches(path)) == 4
+    writer.close()
+    table = pa.Table.from_batches(list(read_batches(path)))
+    assert table.column('shot').to_pylist() == [0, 1, 2, 3, 4]
+
+
+def test_parquet_row_groups(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "results.parquet")
+    with ShotResultWriter(path, flush_rows=3) as writer:
+        writer.write_rows([{'shot': i, 'channel': "AIN0", 'mean_V': float(i)} for i in range(7)])
+    assert pq.read_table(path).num_rows == 7
+    assert pq.ParquetFile(path).num_row_groups == 3
+
+
+def test_records_of_streamed_shots(tmp_path, fake_ljm):
+    path = str(tmp_path / "records.arrows")
+    device = LabJackDevice(LabJackDeviceTypeEnum.T7, LabJackConnectionTypeEnum.ETHERNET, "192.168.1.92")
+    try:
+        stream_in = device.stream_in(["AIN0", "AIN1"], 0.05, sampling_rate_Hz=4000, scans_per_read=50)
+        with ShotResultWriter(path) as writer:
+            writer.attach(stream_in, records=True)
+            for _ in range(2):
+                stream_in._stream_in()
+    finally:
+        device._disconnect()
+    table = pa.Table.from_batches(list(read_batches(path)))
+    num_scans = stream_in.num_record_scans
+    assert table.num_rows == 2*2*num_scans
+    last = table.filter(pc.equal(table.column('shot'), 1))
+    np.testing.assert_array_equal(last.column('V').to_numpy(), stream_in.to_numpy().T.ravel())
+    np.testing.assert_allclose(last.column('t').to_numpy()[:num_scans], np.arange(num_scans)/stream_in.scan_rate_Hz)
+
+
+def test_finalizer_does_not_raise(tmp_path, monkeypatch):
+    unraisable = []
+    monkeypatch.setattr(sys, "unraisablehook", unraisable.append)
+    existing = tmp_path / "existing.arrows"
+    existing.write_bytes(b"")
+    with pytest.raises(FileExistsError):
+        ShotResultWriter(str(existing))  # half-initialized object
+    writer = ShotResultWriter(str(tmp_path / "bad.arrows"), schema=pa.schema([('shot', pa.int64())]))
+    writer.write({'shot': "not a number"})  # fails only when flushed, i.e., in the finalizer
+    del writer
+    gc.collect()
+    assert unraisable == []
@@ -0,0 +1,32 @@
+import numpy as np
+
+from _derived_channels import DerivedChannels, quad_photodiode_channels
+
+
+def _evaluate(derived, scan_channels, block):
+    plan = derived.compile(scan_channels)
+    out = np.empty((len(plan.names), len(block)))
+    plan.evaluate(block, out)
+    return dict(zip(plan.names, out))
+
+
+def test_quad_photodiode_matches_numpy():
+    rng = np.random.default_rng(0)
+    block = rng.uniform(-0.1, 1.0, size=(1000, 5))  # AIN4 is not used
+    result = _evaluate(quad_photodiode_channels("AIN0", "AIN1", "AIN2", "AIN3", min_sum_V=0.5),
+                       ["AIN0", "AIN1", "AIN2", "AIN3", "AIN4"], block)
+    a, b, c, d = block[:, :4].T
+    total = a + b + c + d
+    low = np.abs(total) < 0.5
+    assert low.any() and not low.all()
+    np.testing.assert_allclose(result['SUM'], total)
+    np.testing.assert_allclose(result['X'], np.where(low, np.nan, (a + d - b - c)/total))
+    np.testing.assert_allclose(result['Y'], np.where(low, np.nan, (a + b - c - d)/total))
+
+
+def test_later_channels_see_masked_values():
+    derived = DerivedChannels({'SUM': 'A + B', 'X': '(A - B)/SUM', 'X2': 'X*X'},
+                              aliases={'A': "AIN0", 'B': "AIN1"}, masks={'X': ('SUM', 0.5)})
+    result = _evaluate(derived, ["AIN0", "AIN1"], np.array([[0.1, 0.1], [0.6, 0.2]]))
+    np.testing.assert_allclose(result['X'], [np.nan, 0.5])
+    np.testing.assert_allclose(result['X2'], [np.nan, 0.25])
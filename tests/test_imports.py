@@ -0,0 +1,15 @@
+import subprocess
+import sys
+from pathlib import Path
+
+MODULE_DIR = Path(__file__).resolve().parents[1] / "LabJack_class-main"
+
+
+def test_import_labjack_device_is_lazy():
+    """Importing labjack_device loads neither numpy nor the LJM library (see _ljm_aux._LazyModule)."""
+    code = (
+        "import sys, labjack_device\n"
+        "print(sorted(name for name in ('numpy', 'labjack.ljm') if name in sys.modules))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=MODULE_DIR, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
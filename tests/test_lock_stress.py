@@ -0,0 +1,30 @@
+from _lock_stress import stress_device_lock
+from _ljm_aux import LabJackConnectionTypeEnum, LabJackDeviceTypeEnum
+from fake_ljm import FakeLJM
+from labjack_device import LabJackDevice
+
+import threading
+
+
+def test_fake_ljm_detects_overlapping_commands(fake_ljm):
+    threads = [threading.Thread(target=fake_ljm.eReadNames, args=(1, 1, ["AIN0"])) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert fake_ljm.overlaps
+
+
+def test_device_lock_serializes_commands(fake_ljm: FakeLJM):
+    device = LabJackDevice(LabJackDeviceTypeEnum.T7, LabJackConnectionTypeEnum.ETHERNET, "192.168.1.92")
+    try:
+        results = stress_device_lock(device, duration_s=1.0, num_readers=4,
+                                     configure={"AIN_ALL_RANGE": 10.0},
+                                     stream_channels=["AIN0", "AIN1"], stream_duration_s=0.2, sampling_rate_Hz=10e3)
+    finally:
+        device._disconnect()
+    by_kind = {result['kind']: result for result in results}
+    assert set(by_kind) == {'read', 'configure', 'stream'}
+    assert all(result['num_ops'] > 0 and result['num_errors'] == 0 for result in results)
+    assert fake_ljm.num_calls['eStreamStart'] > 0
+    assert fake_ljm.overlaps == []
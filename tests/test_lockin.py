@@ -0,0 +1,89 @@
+import math
+
+import numpy as np
+import pytest
+
+from _lockin import LockIn
+
+SCAN_RATE = 10e3
+
+
+def _cosine(amplitude, frequency_Hz, phase, num_scans, start=0):
+    t = (start + np.arange(num_scans))/SCAN_RATE
+    return amplitude*np.cos(2*math.pi*frequency_Hz*t + phase)
+
+
+def _demodulate(lockin, block, block_scans=1000):
+    for begin in range(0, len(block), block_scans):
+        lockin.update(block[begin:begin + block_scans])
+    return lockin.end_shot()
+
+
+def test_amplitude_and_phase():
+    lockin = LockIn(SCAN_RATE, ["AIN0", "AIN1"], ["AIN0", "AIN1"], frequency_Hz=123.4, output_rate_Hz=100,
+                    time_constant_s=0.01, filter_order=2)
+    block = np.column_stack((_cosine(0.5, 123.4, 0.3, 20000), _cosine(0.2, 123.4, -1.0, 20000)))
+    records = _demodulate(lockin, block)
+    settled = slice(20, None)  # 10 time constants
+    # the 2f mixing product is rejected by the stages at the scan rate (12 dB/octave), not only by the boxcar
+    np.testing.assert_allclose(records['AIN0_R']['V'][settled], 0.5/math.sqrt(2), rtol=1e-3)
+    np.testing.assert_allclose(records['AIN0_theta']['V'][settled], 0.3, atol=2e-3)
+    np.testing.assert_allclose(records['AIN1_R']['V'][settled], 0.2/math.sqrt(2), rtol=1e-3)
+    np.testing.assert_allclose(records['AIN1_theta']['V'][settled], -1.0, atol=2e-3)
+    np.testing.assert_allclose(records['AIN0_I']['V'][settled], 0.5/math.sqrt(2)*math.cos(0.3), rtol=1e-3)
+    assert len(records['AIN0_R']['t']) == 200
+    assert records['AIN0_R']['t'][0] == pytest.approx(49.5/SCAN_RATE)
+
+
+def test_reference_channel():
+    # the starting estimate is 0.2% off: the oscillator follows the reference
+    lockin = LockIn(SCAN_RATE, ["AIN0", "AIN1"], ["AIN0"], reference_channel="AIN1", frequency_Hz=200.4,
+                    output_rate_Hz=100, time_constant_s=0.01)
+    block = np.column_stack((_cosine(0.4, 200.0, 1.2, 40000), _cosine(1.0, 200.0, 0.5, 40000)))
+    records = _demodulate(lockin, block)
+    assert lockin.frequency_Hz == pytest.approx(200.0, rel=1e-4)
+    settled = slice(-100, None)
+    np.testing.assert_allclose(records['AIN0_R']['V'][settled], 0.4/math.sqrt(2), rtol=2e-3)
+    np.testing.assert_allclose(records['AIN0_theta']['V'][settled], 1.2 - 0.5, atol=5e-3)  # relative to the reference
+
+
+def test_harmonic():
+    lockin = LockIn(SCAN_RATE, ["AIN0"], ["AIN0"], frequency_Hz=150.0, harmonic=2, output_rate_Hz=100,
+                    time_constant_s=0.01)
+    # the fundamental is rejected
+    block = (_cosine(0.3, 300.0, 0.7, 20000) + _cosine(0.2, 150.0, 0.0, 20000))[:, None]
+    records = _demodulate(lockin, block)
+    np.testing.assert_allclose(records['AIN0_R']['V'][20:], 0.3/math.sqrt(2), rtol=2e-3)
+    np.testing.assert_allclose(records['AIN0_theta']['V'][20:], 0.7, atol=5e-3)
+
+
+def test_skip_keeps_the_oscillator_phase():
+    lockin = LockIn(SCAN_RATE, ["AIN0"], ["AIN0"], frequency_Hz=123.4, output_rate_Hz=100, time_constant_s=0.01)
+    lockin.update(_cosine(0.5, 123.4, 0.3, 10050)[:, None])
+    lockin.skip(3333)  # the 50 carried scans and the missing ones are dropped
+    lockin.update(_cosine(0.5, 123.4, 0.3, 10000, start=10050 + 3333)[:, None])
+    records = lockin.end_shot()
+    t = records['AIN0_R']['t']
+    assert len(t) == 100 + 100
+    assert t[100] == pytest.approx((10050 + 3333 + 49.5)/SCAN_RATE)
+    # the stages hold their state across the gap, where the 2f ripple changes phase: allow them to settle again
+    settled = np.r_[20:100, 110:200]
+    np.testing.assert_allclose(records['AIN0_theta']['V'][settled], 0.3, atol=2e-3)
+    np.testing.assert_allclose(records['AIN0_R']['V'][settled], 0.5/math.sqrt(2), rtol=1e-3)
+
+
+def test_nan_at_the_start_of_a_shot():
+    # skipped samples at the start of a stream must not leave the filter stages NaN for the whole shot
+    lockin = LockIn(1e3, ["AIN0", "AIN1"], ["AIN0", "AIN1"], frequency_Hz=50.0, output_rate_Hz=100,
+                    time_constant_s=0.05)
+    t = np.arange(2000)/1e3
+    block = np.column_stack((np.cos(2*math.pi*50*t), np.cos(2*math.pi*50*t)))
+    block[:10, 0] = np.nan   # the first output window
+    block[:25, 1] = np.nan
+    block[500:520, 1] = np.nan  # skipped samples mid-shot hold the stages
+    records = _demodulate(lockin, block, block_scans=100)
+    r0, r1 = records['AIN0_R']['V'], records['AIN1_R']['V']
+    assert np.isnan(r0[0]) and not np.isnan(r0[1:]).any()
+    assert np.isnan(r1[:2]).all() and not np.isnan(r1[2:]).any()
+    np.testing.assert_allclose(r0[-10:], 1/math.sqrt(2), rtol=1e-3)
+    np.testing.assert_allclose(r1[-10:], 1/math.sqrt(2), rtol=1e-3)
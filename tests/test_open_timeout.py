@@ -0,0 +1,85 @@
+import threading
+import time
+
+from _discovery import connect_devices
+from _ljm_aux import LabJackConnectionTypeEnum, LabJackDeviceTypeEnum
+from labjack_device import LabJackDevice
+
+TIMEOUT = "LJM_OPEN_TCP_DEVICE_TIMEOUT_MS"
+
+
+def _slow_open(fake_ljm, open_s):
+    """openS taking open_s[identifier] seconds; returns the timeouts seen at the end of each open."""
+    seen = {}
+
+    def openS(device_type, connection_type, identifier):
+        time.sleep(open_s[identifier])
+        seen[identifier] = fake_ljm.readLibraryConfigS(TIMEOUT)
+        return 1
+    fake_ljm.openS = openS
+    return seen
+
+
+def _config(identifier):
+    return {'deviceType': LabJackDeviceTypeEnum.T7, 'connectionType': LabJackConnectionTypeEnum.ETHERNET,
+            'deviceIdentifier': identifier}
+
+
+def _wait_for(condition, timeout_s=2.0):
+    deadline = time.monotonic() + timeout_s
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_concurrent_devices_keep_the_largest_timeout(fake_ljm):
+    seen = _slow_open(fake_ljm, {"10.0.0.1": 0.3, "10.0.0.2": 0.1})
+    devices = []
+
+    def connect(identifier, timeout_s):
+        devices.append(LabJackDevice(LabJackDeviceTypeEnum.T7, LabJackConnectionTypeEnum.ETHERNET, identifier,
+                                     connect_timeout_s=timeout_s))
+    threads = [threading.Thread(target=connect, args=("10.0.0.1", 1.0))]
+    threads[0].start()
+    time.sleep(0.05)
+    threads.append(threading.Thread(target=connect, args=("10.0.0.2", 3.0)))
+    threads[1].start()
+    for thread in threads:
+        thread.join()
+    for device in devices:
+        device._disconnect()
+    # the shorter connection that ends last is not cut short by the longer one ending first
+    assert seen == {"10.0.0.2": 3000.0, "10.0.0.1": 1000.0}
+    assert fake_ljm.library_config[TIMEOUT] == 20000.0
+
+
+def test_connect_devices_restores_after_abandoned_connections(fake_ljm):
+    seen = _slow_open(fake_ljm, {"10.0.0.1": 0.05, "10.0.0.2": 0.6})
+    connected, failed = connect_devices([_config("10.0.0.1"), _config("10.0.0.2")], timeout_s=0.3, use_cache=False)
+    assert list(connected) == ["10.0.0.1"] and isinstance(failed["10.0.0.2"], TimeoutError)
+    connected["10.0.0.1"]._disconnect()
+    # the abandoned connection is still opening: its timeout holds until it ends
+    assert 0 < fake_ljm.library_config[TIMEOUT] <= 300.0
+    assert _wait_for(lambda: "10.0.0.2" in seen)
+    assert 0 < seen["10.0.0.2"] <= 300.0
+    assert _wait_for(lambda: fake_ljm.library_config[TIMEOUT] == 20000.0)
+    assert fake_ljm.num_calls['close'] == 2  # the late device is disconnected too
+
+
+def test_device_and_connect_devices_share_the_setting(fake_ljm):
+    seen = _slow_open(fake_ljm, {"10.0.0.1": 0.5, "10.0.0.2": 0.05, "10.0.0.3": 0.05})
+    devices = []
+    thread = threading.Thread(target=lambda: devices.append(
+        LabJackDevice(LabJackDeviceTypeEnum.T7, LabJackConnectionTypeEnum.ETHERNET, "10.0.0.1",
+                      connect_timeout_s=5.0)))
+    thread.start()
+    time.sleep(0.05)
+    connected, failed = connect_devices([_config("10.0.0.2"), _config("10.0.0.3")], timeout_s=0.3, use_cache=False)
+    assert failed == {}
+    # connect_devices neither lowered the timeout of the device being opened nor restored it under it
+    assert fake_ljm.library_config[TIMEOUT] == 5000.0
+    thread.join()
+    for device in devices + list(connected.values()):
+        device._disconnect()
+    assert seen["10.0.0.1"] == 5000.0
+    assert fake_ljm.library_config[TIMEOUT] == 20000.0
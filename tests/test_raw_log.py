@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from _ljm_aux import LabJackConnectionTypeEnum, LabJackDeviceTypeEnum
+from _raw_log import RawReadLog, ReplayStreamIn
+from labjack_device import LabJackDevice
+
+
+@pytest.fixture
+def device(fake_ljm):
+    device = LabJackDevice(LabJackDeviceTypeEnum.T7, LabJackConnectionTypeEnum.ETHERNET, "192.168.1.92")
+    yield device
+    device._disconnect()
+
+
+def _copy(records):
+    return {name: {key: np.array(values) for key, values in record.items()} for name, record in records.items()}
+
+
+def _assert_records_equal(actual, expected):
+    assert actual.keys() == expected.keys()
+    for name in expected:
+        for key in expected[name]:
+            np.testing.assert_array_equal(actual[name][key], expected[name][key], err_msg=f"{name} {key}")
+
+
+def _record_shots(device, path, num_shots):
+    stream_in = device.stream_in(["AIN0", "AIN1"], 0.25, sampling_rate_Hz=4000, scans_per_read=100,
+                                 reconnect_attempts=1, reconnect_delay_s=0.0)
+    stream_in.add_slow_registers({"AIN10": 0.02}, mode='scan')  # folded into the scan list
+    shots = []
+    with stream_in.record_raw(path):
+        for _ in range(num_shots):
+            stream_in._stream_in()
+            shots.append((_copy(stream_in.records), stream_in.gaps))
+    return shots
+
+
+def test_replay_matches_the_recorded_shots(tmp_path, fake_ljm, device):
+    path = str(tmp_path / "session.ljrr")
+    shots = _record_shots(device, path, 2)
+    assert "AIN10" in shots[1][0]
+    replay = ReplayStreamIn(path)
+    assert replay.num_shots == 2
+    replay.replay(1)
+    _assert_records_equal(replay.records, shots[1][0])
+    replay.replay(0)
+    _assert_records_equal(replay.records, shots[0][0])
+
+
+def test_replay_of_a_shot_with_a_gap(tmp_path, fake_ljm, device):
+    path = str(tmp_path / "session.ljrr")
+    # the link drops at the 3rd read of the second shot (5 reads per shot); the new segment starts 0.2 s later
+    fake_ljm.stream_read_errors = {5 + 2: "SOCKET_LEVEL_ERROR"}
+    time_stamps = iter([0, 0, 0.2*40e6])
+
+    def eReadName(handle, name):
+        return float(next(time_stamps)) if name == "STREAM_START_TIME_STAMP" else 0.0
+    fake_ljm.eReadName = eReadName
+    with pytest.warns(UserWarning, match="Reconnecting"):
+        shots = _record_shots(device, path, 2)
+    assert shots[1][1] == [(200, 200)]
+    replay = ReplayStreamIn(path)
+    replay.replay(1)
+    assert replay.gaps == [(200, 200)]
+    _assert_records_equal(replay.records, shots[1][0])
+    with RawReadLog(path) as log:
+        assert [kind for kind, _ in log.records(1)].count('gap') == 1
+
+
+def test_truncated_log_keeps_the_complete_shots(tmp_path, fake_ljm, device):
+    path = tmp_path / "session.ljrr"
+    shots = _record_shots(device, str(path), 2)
+    content = path.read_bytes()
+    with RawReadLog(str(path)) as log:
+        last_read = list(log._shots[1][1])[-1]  # (kind, body offset, body length) of the last read of shot 1
+    truncated = tmp_path / "truncated.ljrr"
+    truncated.write_bytes(content[:last_read[1] + last_read[2]//2])  # in the middle of the record
+    replay = ReplayStreamIn(str(truncated))
+    assert replay.num_shots == 1
+    replay.replay(0)
+    _assert_records_equal(replay.records, shots[0][0])
+    with pytest.raises(IndexError):
+        replay.replay(1)
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from _ljm_aux import LabJackConnectionTypeEnum, LabJackDeviceTypeEnum
+from _lockin import LockIn
+from _spectrum import WelchPSD
+from labjack_device import LabJackDevice
+
+CORE_TIMER_HZ = 40e6  # T7
+
+
+@pytest.fixture
+def device(fake_ljm):
+    device = LabJackDevice(LabJackDeviceTypeEnum.T7, LabJackConnectionTypeEnum.ETHERNET, "192.168.1.92")
+    yield device
+    device._disconnect()
+
+
+def _stream_start_time_stamps(fake_ljm, time_stamps):
+    """STREAM_START_TIME_STAMP returns `time_stamps` in turn (one per stream segment)."""
+    time_stamps = iter(time_stamps)
+
+    def eReadName(handle, name):
+        return float(next(time_stamps)) if name == "STREAM_START_TIME_STAMP" else 0.0
+    fake_ljm.eReadName = eReadName
+
+
+def test_resume_records_the_missing_scans(fake_ljm, device):
+    # 2 channels at 2000 scans/s, 10 reads of 100 scans; the link drops at the 5th read
+    fake_ljm.stream_read_errors = {4: "SOCKET_LEVEL_ERROR"}
+    # the new segment starts 0.35 s (700 scans) after the first, across the roll-over of the 32-bit CORE_TIMER
+    first = 2**32 - 0.1*CORE_TIMER_HZ
+    _stream_start_time_stamps(fake_ljm, [first, (first + 0.35*CORE_TIMER_HZ) % 2**32])
+    stream_in = device.stream_in(["AIN0", "AIN1"], 0.5, sampling_rate_Hz=4000, scans_per_read=100,
+                                 reconnect_attempts=1, reconnect_delay_s=0.0)
+    welch = WelchPSD(stream_in.scan_rate_Hz, stream_in.scan_channels, nperseg=64, overlap=0.5)
+    welch.attach(stream_in)
+    lockin = LockIn(stream_in.scan_rate_Hz, stream_in.scan_channels, ["AIN0"], frequency_Hz=50.0,
+                    output_rate_Hz=100)
+    lockin.attach(stream_in)
+    skipped = []
+    skip = lockin.skip
+    lockin.skip = lambda num_samples: (skipped.append(num_samples), skip(num_samples))
+
+    with pytest.warns(UserWarning, match="Reconnecting"):
+        stream_in._stream_in()
+
+    # 400 scans read before the error: 700 - 400 scans are missing
+    assert stream_in.gaps == [(400, 300)]
+    assert stream_in.missing_scans == 300
+    assert fake_ljm.num_calls['openS'] == 2 and fake_ljm.num_calls['eStreamStart'] == 2
+    # 't' jumps by the missing scans after the gap (t = (scan*channels + channel)/scan rate, see records)
+    t = stream_in.records['AIN1']['t']
+    assert len(t) == 1000
+    np.testing.assert_allclose(np.diff(t)[[398, 399, 400]], np.array([1, 301, 1])*2/stream_in.scan_rate_Hz)
+    assert t[-1] == pytest.approx((1299*2 + 1)/stream_in.scan_rate_Hz)
+    # Welch drops the carry at the gap: 11 segments of 64 (step 32) in the first 400 scans, 17 in the last 600
+    # (30 in 1000 contiguous scans)
+    assert welch.num_segments == 11 + 17
+    # LockIn skips the missing scans once, at the block after the gap
+    assert skipped == [300]
+    t_lockin = lockin.records['AIN0_R']['t']
+    assert len(t_lockin) == 20 + 30
+    assert t_lockin[20] == pytest.approx((700 + 9.5)/stream_in.scan_rate_Hz)
+
+
+def test_resume_without_missing_scans(fake_ljm, device):
+    # the new segment starts before the scans read so far would have ended: nothing is missing
+    fake_ljm.stream_read_errors = {4: "SOCKET_LEVEL_ERROR"}
+    _stream_start_time_stamps(fake_ljm, [1000, 1000 + 0.1*CORE_TIMER_HZ])
+    stream_in = device.stream_in(["AIN0", "AIN1"], 0.5, sampling_rate_Hz=4000, scans_per_read=100,
+                                 reconnect_attempts=1, reconnect_delay_s=0.0)
+    with pytest.warns(UserWarning, match="Reconnecting"):
+        stream_in._stream_in()
+    assert stream_in.gaps == [(400, 0)]
+    np.testing.assert_allclose(np.diff(stream_in.records['AIN0']['t']), 2/stream_in.scan_rate_Hz)
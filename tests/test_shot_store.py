@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from _shot_store import ShotStoreReader, ShotStoreWriter
+
+
+@pytest.mark.filterwarnings("error")  # a fully skipped channel must not warn at each shot
+def test_round_trip_with_skipped_samples(tmp_path):
+    rng = np.random.default_rng(1)
+    num_scans = 10000
+    data = np.column_stack((
+        np.sin(np.arange(num_scans)/50),
+        rng.normal(0.2, 0.01, num_scans),
+        np.full(num_scans, np.nan),  # fully skipped channel
+    ))
+    data[rng.choice(num_scans, 100, replace=False), 0] = np.nan
+    data[1023:1026, 1] = np.nan  # across a block boundary
+    path = str(tmp_path / "shots.ljqs")
+    with ShotStoreWriter(path, block_scans=1024) as writer:
+        writer.write_array(data, ["AIN0", "AIN1", "AIN2"], 1000.0)
+        writer.write_array(data[:500, :2], ["AIN0", "AIN1"], 1000.0)
+    with ShotStoreReader(path, max_workers=4) as store:
+        assert len(store) == 2
+        meta = store.meta(0)
+        assert len(meta['block_sizes']) == 10
+        scale = np.asarray(meta['scale_V'])
+        shot = store[0]
+        np.testing.assert_array_equal(np.isnan(shot), np.isnan(data))
+        finite = ~np.isnan(data)
+        error = np.abs(np.where(finite, shot - data, 0))
+        assert np.all(error <= scale/2*(1 + 1e-9))
+        assert store[1].shape == (500, 2)
@@ -0,0 +1,89 @@
+import threading
+import time
+
+from _sink_router import SinkRouter
+
+
+class _GatedSink:
+    """Sink that holds each call until `release` is set; `started` is set once it holds an item."""
+
+    def __init__(self):
+        self.items = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, item):
+        self.started.set()
+        self.release.wait()
+        self.items.append(item['read'])
+
+
+def _route(router, read):
+    """Route an eStreamRead block, as the stacking thread of a StreamIn does."""
+    router._on_block(None, read, None, 0, 0, None)
+
+
+def _stats(router, name):
+    return next(row for row in router.stats() if row['name'] == name)
+
+
+def test_drop_rejects_without_stalling():
+    sink = _GatedSink()
+    with SinkRouter() as router:
+        router.add_sink("slow", sink, kind='block', policy='drop', max_queue=2)
+        _route(router, 0)
+        assert sink.started.wait(1.0)  # item 0 is being delivered
+        start = time.perf_counter()
+        for item in range(1, 6):
+            _route(router, item)
+        assert time.perf_counter() - start < 0.1
+        stats = _stats(router, "slow")
+        assert (stats['num_offered'], stats['num_dropped'], stats['queue_depth']) == (6, 3, 2)
+        sink.release.set()
+        assert router.flush(1.0)
+    assert sink.items == [0, 1, 2]
+
+
+def test_coalesce_delivers_the_newest():
+    sink = _GatedSink()
+    with SinkRouter() as router:
+        router.add_sink("plot", sink, kind='block', policy='coalesce', max_queue=1)
+        _route(router, 0)
+        assert sink.started.wait(1.0)
+        for item in range(1, 6):
+            _route(router, item)
+        assert _stats(router, "plot")['num_dropped'] == 4
+        sink.release.set()
+        assert router.flush(1.0)
+    assert sink.items == [0, 5]
+
+
+def test_block_waits_for_the_sink():
+    sink = _GatedSink()
+    with SinkRouter() as router:
+        router.add_sink("csv", sink, kind='block', policy='block', max_queue=1)
+        _route(router, 0)
+        assert sink.started.wait(1.0)
+        _route(router, 1)  # queued
+        threading.Timer(0.2, sink.release.set).start()
+        start = time.perf_counter()
+        _route(router, 2)  # waits until the sink takes item 1
+        assert time.perf_counter() - start >= 0.15
+        assert router.flush(1.0)
+        stats = _stats(router, "csv")
+        assert stats['blocked_ms'] >= 150 and stats['num_dropped'] == 0
+    assert sink.items == [0, 1, 2]
+
+
+def test_close_without_wait_drops_the_queue():
+    sink = _GatedSink()
+    router = SinkRouter()
+    router.add_sink("slow", sink, kind='block', policy='drop', max_queue=4)
+    worker = router._block_sinks[0]
+    for item in range(4):
+        _route(router, item)
+    assert sink.started.wait(1.0)  # item 0 is being delivered, 3 are queued
+    threading.Timer(0.1, sink.release.set).start()
+    router.close(wait=False)
+    assert sink.items == [0]
+    assert (worker.num_delivered, worker.num_dropped, len(worker.queue)) == (1, 3, 0)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from _ljm_aux import LabJackConnectionTypeEnum, LabJackDeviceTypeEnum
+from _slow_registers import SlowRegisters
+from labjack_device import LabJackDevice
+
+
+def _scan_mode(registers, blocks, scan_rate_Hz=1000.0):
+    """Feed (columns, first scan, missing scans) blocks to a 'scan' mode SlowRegisters; returns the records."""
+    slow = SlowRegisters(registers, mode='scan')
+    for columns, first_scan, num_missing in blocks:
+        slow._on_scans(columns, first_scan, num_missing, scan_rate_Hz)
+    return slow._end_shot(num_channels=2, scan_rate_Hz=scan_rate_Hz)
+
+
+@pytest.mark.parametrize("splits", [[30], [7, 13, 10], [1, 1, 9, 19], [10, 10, 10]])
+def test_scan_mode_windows_span_blocks(splits):
+    # AIN10 averaged over 10 scans, AIN11 over 5; scan k holds k (AIN10) and -k (AIN11)
+    columns = np.column_stack((np.arange(30.0), -np.arange(30.0)))
+    columns[3, 0] = -9999.0  # skipped sample, left out of its window
+    blocks, first_scan = [], 0
+    for num_scans in splits:
+        blocks.append((columns[first_scan:first_scan + num_scans], first_scan, 0))
+        first_scan += num_scans
+    records = _scan_mode({"AIN10": 0.01, "AIN11": 0.005}, blocks)
+    np.testing.assert_array_equal(records["AIN10"]['scan'], [4.5, 14.5, 24.5])
+    np.testing.assert_allclose(records["AIN10"]['V'], [(45 - 3)/9, 14.5, 24.5])
+    np.testing.assert_allclose(records["AIN10"]['t'], np.array([4.5, 14.5, 24.5])*2/1000)
+    np.testing.assert_array_equal(records["AIN11"]['scan'], [2, 7, 12, 17, 22, 27])
+    np.testing.assert_allclose(records["AIN11"]['V'], [-2, -7, -12, -17, -22, -27])
+
+
+def test_scan_mode_drops_the_carry_at_a_gap():
+    columns = np.arange(33.0)[:, None]
+    # 13 scans, then 100 missing scans: the 3 scans of the incomplete window do not continue across the gap
+    records = _scan_mode({"AIN10": 0.01}, [(columns[:13], 0, 0), (columns[13:], 13, 100)])
+    np.testing.assert_array_equal(records["AIN10"]['scan'], [4.5, 100 + 17.5, 100 + 27.5])
+    np.testing.assert_allclose(records["AIN10"]['V'], [4.5, 17.5, 27.5])
+
+
+def test_poll_mode_reads_between_stream_reads(fake_ljm):
+    device = LabJackDevice(LabJackDeviceTypeEnum.T7, LabJackConnectionTypeEnum.ETHERNET, "192.168.1.92")
+    events = []
+    stream_read = fake_ljm.eStreamRead
+
+    def eStreamRead(handle):
+        events.append('read')
+        return stream_read(handle)
+
+    def eReadAddresses(handle, num_frames, addresses, data_types):
+        events.append(('poll', device._command_lock._is_owned()))
+        return [float(events.count('read'))]*num_frames
+    fake_ljm.eStreamRead = eStreamRead
+    fake_ljm.eReadAddresses = eReadAddresses
+    try:
+        stream_in = device.stream_in(["AIN0", "AIN1"], 0.25, sampling_rate_Hz=4000, scans_per_read=100)
+        stream_in.add_slow_registers({"AIN10": 1e-6})  # due after every read
+        stream_in._stream_in()
+    finally:
+        device._disconnect()
+    # one register read after each eStreamRead, under command_lock
+    assert events == ['read', ('poll', True)]*5
+    record = stream_in.records["AIN10"]
+    np.testing.assert_array_equal(record['V'], [1, 2, 3, 4, 5])
+    # placed at the scan the device was acquiring when eStreamRead returned (no backlog here), plus half the round trip
+    acquired = 100*np.arange(1, 6)
+    assert np.all((record['scan'] >= acquired) & (record['scan'] < acquired + 10))
+    np.testing.assert_allclose(record['t'], record['scan']*2/stream_in.scan_rate_Hz)